@@ -0,0 +1,125 @@
+# -*- coding: utf-8 -*-
+"""
+Chunk the members of tar, zip and gzip archives as virtual files.
+
+Members are decompressed and chunked as streams, nothing is extracted to disk.
+A member is named by the path of the archive joined with its name inside the
+archive, e.g. `backup.tar.gz/etc/hosts`.
+"""
+
+import gzip
+import io
+import os
+import tarfile
+import zipfile
+from typing import BinaryIO, Callable, Iterator, Tuple
+from fastcdc.blockio import chunk_stream
+
+try:
+    from fastcdc.fastcdc_cy import Chunk
+except ImportError:
+    from fastcdc.fastcdc_py import Chunk
+
+
+TAR_SUFFIXES = (".tar", ".tar.gz", ".tgz", ".tar.bz2", ".tbz2", ".tar.xz", ".txz")
+ARCHIVE_SUFFIXES = TAR_SUFFIXES + (".zip", ".gz")
+
+
+def is_archive(path):
+    # type: (str) -> bool
+    """Check if path has the suffix of a supported archive."""
+    return path.lower().endswith(ARCHIVE_SUFFIXES)
+
+
+def iter_members(path):
+    # type: (str) -> Iterator[Tuple[str, BinaryIO]]
+    """
+    Yield (name, stream) of the regular file members of an archive.
+
+    Tar archives are read sequentially, so a stream is only valid until the next
+    member is requested. A gzip file that is not a tar archive has one member
+    named like the file without the `.gz` suffix.
+    """
+    lower = path.lower()
+    if lower.endswith(TAR_SUFFIXES):
+        with tarfile.open(path, "r|*") as archive:
+            for member in archive:
+                if member.isfile():
+                    yield os.path.join(path, member.name), archive.extractfile(member)
+    elif lower.endswith(".zip"):
+        with zipfile.ZipFile(path) as archive:
+            for info in archive.infolist():
+                if not info.is_dir():
+                    with archive.open(info) as stream:
+                        yield os.path.join(path, info.filename), stream
+    elif lower.endswith(".gz"):
+        with gzip.open(path, "rb") as stream:
+            yield os.path.join(path, os.path.basename(path)[:-3]), stream
+    else:
+        raise ValueError("Unsupported archive: {}".format(path))
+
+
+class MemberStream(io.RawIOBase):
+    """All members of an archive as one concatenated stream."""
+
+    def __init__(self, members):
+        # type: (Iterator[Tuple[str, BinaryIO]]) -> None
+        self.members = members
+        self.current = None
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        while True:
+            if self.current is None:
+                member = next(self.members, None)
+                if member is None:
+                    return 0
+                self.current = member[1]
+            n = self.current.readinto(buffer)
+            if n:
+                return n
+            self.current = None
+
+
+def chunk_archive(
+    path,
+    min_size=None,
+    avg_size=8192,
+    max_size=None,
+    fat=False,
+    hf=None,
+    stats=None,
+    engine="fastcdc",
+    reset=True,
+    sketch=False,
+):
+    # type: (str, int|None, int, int|None, bool, Callable|str|None, Stats|None, str, bool, bool) -> Iterator[Tuple[str, Iterator[Chunk]]]
+    """
+    Chunk the members of an archive without extracting them.
+
+    With `reset` every member is chunked on its own, like a file on disk, so the
+    chunks of a member are cut at its start and end. Otherwise the contents of
+    all members are chunked as one stream named `path`. The chunks of a member
+    must be consumed before the next member is requested.
+
+    :param path: Path of a tar, zip or gzip file
+    :param min_size: Minimum chunk size (default: avg_size // 4)
+    :param avg_size: Average chunk size (default: 8192)
+    :param max_size: Maximum chunk size (default: avg_size * 8)
+    :param fat: If True, include chunk data in output
+    :param hf: Hash function or name of a supported hash function (default: None)
+    :param stats: Stats instance to collect counters and timings (default: None)
+    :param engine: Chunking algorithm, one of ENGINES (default: "fastcdc")
+    :param reset: Cut chunks at member boundaries (default: True)
+    :param sketch: If True, include resemblance features in output
+    :return: Generator yielding (name, chunks) per member
+    """
+    params = (min_size, avg_size, max_size, fat, hf, stats, engine)
+    if not reset:
+        stream = MemberStream(iter_members(path))
+        yield path, chunk_stream(stream, *params, sketch=sketch)
+        return
+    for name, stream in iter_members(path):
+        yield name, chunk_stream(stream, *params, sketch=sketch)
@@ -5,12 +5,14 @@ from statistics import mean
 import click
 from humanize import naturalsize as nsize
 from codetiming import Timer
-import cpuinfo
 import fastcdc
+from fastcdc.engines import ENGINES
 
 
 def system_info():
     """Printable system info"""
+    import cpuinfo
+
     cinfo = cpuinfo.get_cpu_info()
     sinfo = (
         "FastCDC Performance Benchmark\n"
@@ -20,6 +22,7 @@ def system_info():
         "OS:      {}\n"
         "Python:  {} - {} - {}\n"
         "FastCDC: {}\n"
+        "Scan:    {}\n"
         "==========================================================================\n"
     ).format(
         cinfo.get("brand_raw"),
@@ -29,12 +32,31 @@ def system_info():
         platform.python_version(),
         platform.python_compiler(),
         fastcdc.__version__,
+        scan_isa(),
     )
     return sinfo
 
 
+def scan_isa():
+    """Instruction set used by the compiled boundary search"""
+    try:
+        from fastcdc.fastcdc_cy import isa
+    except ImportError:
+        return "pure python"
+    return isa()
+
+
 @click.command("benchmark")
-def benchmark():
+@click.option(
+    "--engine",
+    "engine_names",
+    type=click.Choice(ENGINES),
+    multiple=True,
+    default=["fastcdc"],
+    help="Chunking algorithm to benchmark (repeat to compare).",
+    show_default=True,
+)
+def benchmark(engine_names):
     """Benchmark chunking performance."""
     files = [os.urandom(4194304) for _ in range(64)]
     num_bytes = 4194304
@@ -56,17 +78,21 @@ def benchmark():
     result = []
     for avg_size in chunk_sizes:
         click.echo("Chunksize:  {}".format(nsize(avg_size)))
-        for func in chunk_funks:
-            timer_name = "{}_{}".format(func.__name__, avg_size)
-            t = Timer(timer_name, logger=None)
-            for file in files:
-                t.start()
-                result = list(func(file, avg_size=avg_size))
-                t.stop()
-            data_per_s = num_bytes / Timer.timers.mean(timer_name)
-            click.echo("{}: {}/s".format(func.__name__, nsize(data_per_s)))
-        avg_size = mean([c.length for c in result])
-        click.echo("Real AVG:  {}".format(nsize(avg_size)))
+        for engine in engine_names:
+            for func in chunk_funks:
+                name = func.__name__
+                if len(engine_names) > 1 or engine != "fastcdc":
+                    name = "{}[{}]".format(name, engine)
+                timer_name = "{}_{}".format(name, avg_size)
+                t = Timer(timer_name, logger=None)
+                for file in files:
+                    t.start()
+                    result = list(func(file, avg_size=avg_size, engine=engine))
+                    t.stop()
+                data_per_s = num_bytes / Timer.timers.mean(timer_name)
+                click.echo("{}: {}/s".format(name, nsize(data_per_s)))
+            real_avg = mean([c.length for c in result])
+            click.echo("Real AVG:  {}".format(nsize(real_avg)))
         click.echo()
 
 
@@ -0,0 +1,374 @@
+# -*- coding: utf-8 -*-
+"""
+Chunk files from large block reads that bypass or release the page cache.
+
+Mapping a file keeps every page of it in the page cache until memory pressure
+evicts other, possibly hot, data. These readers instead fill a small ring of
+aligned buffers from a reader thread while the chunker works on the previous
+block. With `direct` the file is opened with O_DIRECT (where supported) so the
+data never enters the page cache, otherwise the pages of each block are dropped
+with posix_fadvise(DONTNEED) as soon as it is chunked.
+"""
+
+import mmap
+import os
+import queue
+import threading
+from time import perf_counter
+from typing import BinaryIO, Callable, Iterator, Optional, Tuple
+from fastcdc.engines import ENGINES
+from fastcdc.utils import preadinto
+
+try:
+    from fastcdc.fastcdc_cy import chunk_generator, Chunk
+except ImportError:
+    from fastcdc.fastcdc_py import chunk_generator, Chunk
+
+
+IO_MODES = ("mmap", "read", "direct")
+# Size of a block read (a multiple of ALIGNMENT).
+BLOCK_SIZE = 8 * 1024 * 1024
+# Number of buffers in the ring (one is chunked while the others are filled).
+BUFFERS = 3
+# Alignment of buffers, offsets and sizes of O_DIRECT reads.
+ALIGNMENT = 4096
+
+
+def align(size):
+    # type: (int) -> int
+    """Round size up to a multiple of ALIGNMENT."""
+    return (size + ALIGNMENT - 1) // ALIGNMENT * ALIGNMENT
+
+
+def open_file(path, direct):
+    # type: (str, bool) -> Tuple[int, bool]
+    """Open path for reading and return the fd and whether O_DIRECT is used."""
+    flags = os.O_RDONLY | getattr(os, "O_BINARY", 0)
+    if direct and hasattr(os, "O_DIRECT"):
+        try:
+            return os.open(path, flags | os.O_DIRECT), True
+        except OSError:
+            pass
+    fd = os.open(path, flags)
+    if hasattr(os, "posix_fadvise"):
+        os.posix_fadvise(fd, 0, 0, os.POSIX_FADV_SEQUENTIAL)
+    return fd, False
+
+
+class BlockReader:
+    """
+    Read a file in blocks into a ring of reusable aligned buffers.
+
+    Each buffer has a `head` of `head_size` bytes in front of the block, where
+    the consumer may copy the unfinished tail of the previous block. Blocks are
+    read ahead by a thread; `blocks()` yields (buffer, file offset, length) and
+    the buffer must not be used after the next block was requested.
+
+    :param path: File to read
+    :param head_size: Bytes reserved in front of every block
+    :param block_size: Size of a read (rounded up to ALIGNMENT)
+    :param direct: Use O_DIRECT where supported
+    :param buffers: Number of buffers in the ring
+    """
+
+    def __init__(
+        self, path, head_size=0, block_size=BLOCK_SIZE, direct=False, buffers=BUFFERS
+    ):
+        self.head_size = align(head_size)
+        self.block_size = align(block_size)
+        self.path = path
+        self.fd, self.direct = open_file(path, direct)
+        # Anonymous maps are page aligned, as O_DIRECT requires.
+        self.ring = [
+            mmap.mmap(-1, self.head_size + self.block_size) for _ in range(buffers)
+        ]
+        self.free = queue.Queue()
+        self.full = queue.Queue()
+        self.stop = threading.Event()
+        self.time_io = 0.0
+        for buffer in self.ring:
+            self.free.put(buffer)
+        self.thread = threading.Thread(target=self.read, daemon=True)
+        self.thread.start()
+
+    def read(self):
+        offset = 0
+        try:
+            while not self.stop.is_set():
+                buffer = self.free.get()
+                if buffer is None:
+                    return
+                start = perf_counter()
+                view = memoryview(buffer)[self.head_size :]
+                try:
+                    length = self.read_block(view, offset)
+                finally:
+                    view.release()
+                self.time_io += perf_counter() - start
+                self.full.put((buffer, offset, length))
+                if length < self.block_size:
+                    return
+                offset += length
+        except Exception as e:
+            self.full.put(e)
+
+    def read_block(self, view, offset):
+        # type: (memoryview, int) -> int
+        """Fill view from offset, fall back to buffered reads if O_DIRECT fails."""
+        filled = 0
+        while filled < len(view):
+            try:
+                n = preadinto(self.fd, view[filled:], offset + filled)
+            except OSError:
+                if not self.direct:
+                    raise
+                # Some filesystems accept O_DIRECT on open but not on read.
+                os.close(self.fd)
+                self.fd, self.direct = open_file(self.path, False)
+                continue
+            if n == 0:
+                break
+            filled += n
+            if self.direct and filled % ALIGNMENT:
+                # A short unaligned O_DIRECT read only happens at end of file.
+                break
+        return filled
+
+    def blocks(self):
+        # type: () -> Iterator[Tuple[mmap.mmap, int, int]]
+        """Yield (buffer, file offset, length) until the end of the file."""
+        previous = None
+        while True:
+            item = self.full.get()
+            if previous is not None:
+                self.drop(*previous[1:])
+                self.free.put(previous[0])
+            if isinstance(item, Exception):
+                raise item
+            yield item
+            previous = item
+            if item[2] < self.block_size:
+                self.drop(*item[1:])
+                return
+
+    def drop(self, offset, length):
+        # type: (int, int) -> None
+        """Release the pages of a consumed block from the page cache."""
+        if not self.direct and length and hasattr(os, "posix_fadvise"):
+            os.posix_fadvise(self.fd, offset, length, os.POSIX_FADV_DONTNEED)
+
+    def close(self):
+        # type: () -> None
+        self.stop.set()
+        self.free.put(None)
+        self.thread.join()
+        os.close(self.fd)
+        for buffer in self.ring:
+            buffer.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class StreamReader:
+    """
+    Read a file object in blocks into a single buffer, like BlockReader.
+
+    For streams without a file descriptor or random access, such as
+    decompressed archive members or pipes.
+
+    :param stream: Binary file object with `readinto` or `read`
+    :param head_size: Bytes reserved in front of every block
+    :param block_size: Size of a read
+    """
+
+    def __init__(self, stream, head_size=0, block_size=BLOCK_SIZE):
+        self.stream = stream
+        self.head_size = head_size
+        self.block_size = block_size
+        self.buffer = bytearray(head_size + block_size)
+        self.time_io = 0.0
+
+    def blocks(self):
+        # type: () -> Iterator[Tuple[bytearray, int, int]]
+        """Yield (buffer, stream offset, length) until the end of the stream."""
+        offset = 0
+        while True:
+            start = perf_counter()
+            length = self.read_block()
+            self.time_io += perf_counter() - start
+            yield self.buffer, offset, length
+            if length < self.block_size:
+                return
+            offset += length
+
+    def read_block(self):
+        # type: () -> int
+        view = memoryview(self.buffer)[self.head_size :]
+        filled = 0
+        while filled < len(view):
+            if hasattr(self.stream, "readinto"):
+                n = self.stream.readinto(view[filled:])
+            else:
+                data = self.stream.read(len(view) - filled)
+                n = len(data)
+                view[filled : filled + n] = data
+            if not n:
+                break
+            filled += n
+        return filled
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        pass
+
+
+def chunk_stream(
+    stream,
+    min_size=None,
+    avg_size=8192,
+    max_size=None,
+    fat=False,
+    hf=None,
+    stats=None,
+    engine="fastcdc",
+    block_size=BLOCK_SIZE,
+    sketch=False,
+):
+    # type: (BinaryIO, int|None, int, int|None, bool, Callable|str|None, Stats|None, str, int, bool) -> Iterator[Chunk]
+    """
+    Chunk a binary file object in blocks with the same result as `fastcdc()`.
+
+    The stream is read sequentially and not closed.
+
+    :param stream: Binary file object to chunk
+    :param min_size: Minimum chunk size (default: avg_size // 4)
+    :param avg_size: Average chunk size (default: 8192)
+    :param max_size: Maximum chunk size (default: avg_size * 8)
+    :param fat: If True, include chunk data in output
+    :param hf: Hash function or name of a supported hash function (default: None)
+    :param stats: Stats instance to collect counters and timings (default: None)
+    :param engine: Chunking algorithm, one of ENGINES (default: "fastcdc")
+    :param block_size: Size of a block read
+    :param sketch: If True, include resemblance features in output
+    :return: Generator yielding Chunk objects
+    """
+    if min_size is None:
+        min_size = avg_size // 4
+    if max_size is None:
+        max_size = avg_size * 8
+    if engine not in ENGINES:
+        raise ValueError("Unsupported engine: {}".format(engine))
+    reader = StreamReader(stream, max_size, max(block_size, max_size))
+    return generate(
+        reader, min_size, avg_size, max_size, fat, hf, stats, engine, sketch
+    )
+
+
+def chunk_file(
+    path,
+    min_size=None,
+    avg_size=8192,
+    max_size=None,
+    fat=False,
+    hf=None,
+    stats=None,
+    engine="fastcdc",
+    direct=False,
+    block_size=BLOCK_SIZE,
+    sketch=False,
+):
+    # type: (str, int|None, int, int|None, bool, Callable|str|None, Stats|None, str, bool, int, bool) -> Iterator[Chunk]
+    """
+    Chunk a file from block reads with the same result as `fastcdc()`.
+
+    The cut point of a chunk only depends on the bytes from its start, so every
+    chunk that ends before the end of a block is final. The last chunk of a block
+    is copied in front of the next block and chunked again.
+
+    :param path: File to chunk
+    :param min_size: Minimum chunk size (default: avg_size // 4)
+    :param avg_size: Average chunk size (default: 8192)
+    :param max_size: Maximum chunk size (default: avg_size * 8)
+    :param fat: If True, include chunk data in output
+    :param hf: Hash function or name of a supported hash function (default: None)
+    :param stats: Stats instance to collect counters and timings (default: None)
+    :param engine: Chunking algorithm, one of ENGINES (default: "fastcdc")
+    :param direct: Bypass the page cache with O_DIRECT where supported
+    :param block_size: Size of a block read
+    :param sketch: If True, include resemblance features in output
+    :return: Generator yielding Chunk objects
+    """
+    if min_size is None:
+        min_size = avg_size // 4
+    if max_size is None:
+        max_size = avg_size * 8
+    if engine not in ENGINES:
+        raise ValueError("Unsupported engine: {}".format(engine))
+    block_size = max(block_size, max_size)
+    reader = BlockReader(path, max_size, block_size, direct)
+    return generate(
+        reader, min_size, avg_size, max_size, fat, hf, stats, engine, sketch
+    )
+
+
+def generate(reader, min_size, avg_size, max_size, fat, hf, stats, engine, sketch):
+    # type: (BlockReader|StreamReader, int, int, int, bool, Callable|str|None, Optional[Stats], str, bool) -> Iterator[Chunk]
+    head = reader.head_size
+    tail = b""
+    with reader:
+        if stats is not None:
+            stats.files += 1
+        for buffer, offset, length in reader.blocks():
+            eof = length < reader.block_size
+            buffer[head - len(tail) : head] = tail
+            start = head - len(tail)
+            base = offset - len(tail)
+            end = head + length
+            view = memoryview(buffer)[start:end]
+            chunks = chunk_generator(
+                view,
+                min_size,
+                avg_size,
+                max_size,
+                fat,
+                hf,
+                None,
+                engine,
+                sketch=sketch,
+            )
+            try:
+                while True:
+                    if stats is None:
+                        chunk = next(chunks, None)
+                    else:
+                        started = perf_counter()
+                        chunk = next(chunks, None)
+                        stats.time_scan += perf_counter() - started
+                    if chunk is None:
+                        tail = b""
+                        break
+                    if not eof and chunk.offset + chunk.length == len(view):
+                        # May be cut by the end of the block, chunk it again.
+                        tail = bytes(view[chunk.offset :])
+                        break
+                    if stats is not None:
+                        final = eof and chunk.offset + chunk.length == len(view)
+                        stats.add_chunk(chunk.length, max_size, final)
+                    yield Chunk(
+                        base + chunk.offset,
+                        chunk.length,
+                        chunk.data,
+                        chunk.hash,
+                        chunk.features,
+                    )
+            finally:
+                chunks.close()
+                view.release()
+        if stats is not None:
+            stats.time_io += reader.time_io
@@ -1,10 +1,55 @@
 # -*- coding: utf-8 -*-
+import json
+import os
+import sys
+from contextlib import nullcontext
 import click
+from humanize import intcomma, naturalsize
 from fastcdc import __version__, fastcdc
-import hashlib
+from fastcdc.blockio import IO_MODES, chunk_file
+from fastcdc.engines import ENGINES
+from fastcdc.profiler import Profiler
+from fastcdc.stats import Stats
 from fastcdc.utils import DefaultHelp, supported_hashes
 
 
+# Number of formatted lines collected before they are written out in one call.
+BATCH_SIZE = 4096
+
+
+def format_pretty(chunk):
+    return "{}={} {}={} {}={}\n".format(
+        click.style("hash", fg="bright_magenta"),
+        click.style(chunk.hash, fg="bright_cyan"),
+        click.style("offset", fg="bright_magenta"),
+        click.style(str(chunk.offset), fg="bright_cyan"),
+        click.style("size", fg="bright_magenta"),
+        click.style(str(chunk.length), fg="bright_cyan"),
+    )
+
+
+def format_plain(chunk):
+    return "hash={} offset={} size={}\n".format(chunk.hash, chunk.offset, chunk.length)
+
+
+def format_tsv(chunk):
+    return "{}\t{}\t{}\n".format(chunk.hash, chunk.offset, chunk.length)
+
+
+def format_ndjson(chunk):
+    return '{{"hash": "{}", "offset": {}, "size": {}}}\n'.format(
+        chunk.hash, chunk.offset, chunk.length
+    )
+
+
+FORMATS = {
+    "pretty": format_pretty,
+    "plain": format_plain,
+    "tsv": format_tsv,
+    "ndjson": format_ndjson,
+}
+
+
 @click.command(cls=DefaultHelp)
 @click.version_option(version=__version__, message="fastcdc - %(version)s")
 @click.argument("file", type=click.File("rb"))
@@ -25,7 +70,57 @@ from fastcdc.utils import DefaultHelp, supported_hashes
 @click.option(
     "-hf", "--hash-function", type=click.STRING, default="sha256", show_default=True
 )
-def chunkify(file, size, min_size, max_size, hash_function):
+@click.option(
+    "--engine",
+    type=click.Choice(ENGINES),
+    default="fastcdc",
+    help="Chunking algorithm.",
+    show_default=True,
+)
+@click.option(
+    "--io",
+    "io_mode",
+    type=click.Choice(IO_MODES),
+    default="mmap",
+    help="Map files, or read them in blocks that are dropped from the page cache "
+    "(read) or bypass it with O_DIRECT (direct).",
+    show_default=True,
+)
+@click.option(
+    "-f",
+    "--format",
+    "fmt",
+    type=click.Choice(["auto"] + list(FORMATS)),
+    default="auto",
+    help="Output format (auto: pretty on a terminal, plain otherwise).",
+    show_default=True,
+)
+@click.option("-q", "--quiet", help="Do not print individual chunks.", is_flag=True)
+@click.option("--summary", help="Print aggregate chunk statistics.", is_flag=True)
+@click.option(
+    "--profile",
+    help="Report wall/CPU time per phase to stderr.",
+    is_flag=True,
+)
+@click.option(
+    "--profile-trace",
+    type=click.Path(dir_okay=False, writable=True),
+    help="Write a Chrome trace JSON timeline to this file (implies --profile).",
+)
+def chunkify(
+    file,
+    size,
+    min_size,
+    max_size,
+    hash_function,
+    engine,
+    io_mode,
+    fmt,
+    quiet,
+    summary,
+    profile,
+    profile_trace,
+):
     """Find variable sized chunks for FILE and compute hashes."""
     supported = supported_hashes()
     if hash_function not in supported:
@@ -34,18 +129,88 @@ def chunkify(file, size, min_size, max_size, hash_function):
         )
         raise click.BadOptionUsage("hf", msg)
 
-    hf = getattr(hashlib, hash_function)
-    chunker = fastcdc(file, min_size, size, max_size, hf=hf)
+    if fmt == "auto":
+        fmt = "pretty" if sys.stdout.isatty() else "plain"
+    formatter = FORMATS[fmt]
+
+    profiler = None
+    if profile or profile_trace:
+        profiler = Profiler(trace=bool(profile_trace))
+    stats = Stats() if profiler else None
+
+    if io_mode == "mmap":
+        chunker = fastcdc(
+            file, min_size, size, max_size, hf=hash_function, stats=stats, engine=engine
+        )
+    else:
+        chunker = chunk_file(
+            file.name,
+            min_size,
+            size,
+            max_size,
+            hf=hash_function,
+            stats=stats,
+            engine=engine,
+            direct=io_mode == "direct",
+        )
+
+    def write(lines):
+        with profiler.phase("output", lines=len(lines)) if profiler else nullcontext():
+            click.echo("".join(lines), nl=False)
 
     num_chunks = 0
-    for chunk in chunker:
-        click.secho("hash", fg="bright_magenta", nl=False)
-        click.secho("=", nl=False)
-        click.secho(chunk.hash, fg="bright_cyan", nl=False)
-        click.secho(" offset", fg="bright_magenta", nl=False)
-        click.secho("=", nl=False)
-        click.secho(str(chunk.offset), fg="bright_cyan", nl=False)
-        click.secho(" size", fg="bright_magenta", nl=False)
-        click.secho("=", nl=False)
-        click.secho(str(chunk.length), fg="bright_cyan")
-        num_chunks += 1
+    num_bytes = 0
+    smallest = 0
+    largest = 0
+    lines = []
+    if fmt == "tsv" and not quiet:
+        lines.append("hash\toffset\tsize\n")
+    if profiler:
+        timed = profiler.file(file.name, os.fstat(file.fileno()).st_size)
+    else:
+        timed = nullcontext()
+    with timed:
+        for chunk in chunker:
+            if not quiet:
+                lines.append(formatter(chunk))
+                if len(lines) >= BATCH_SIZE:
+                    write(lines)
+                    lines.clear()
+            if num_chunks == 0 or chunk.length < smallest:
+                smallest = chunk.length
+            if chunk.length > largest:
+                largest = chunk.length
+            num_bytes += chunk.length
+            num_chunks += 1
+        if lines:
+            write(lines)
+
+    if summary:
+        average = num_bytes // num_chunks if num_chunks else 0
+        if fmt == "ndjson":
+            summary_data = dict(
+                chunks=num_chunks,
+                bytes=num_bytes,
+                min=smallest,
+                avg=average,
+                max=largest,
+            )
+            click.echo(json.dumps(summary_data))
+        else:
+            click.echo("Chunks:         {}".format(intcomma(num_chunks)))
+            click.echo("Total Data:     {}".format(naturalsize(num_bytes)))
+            click.echo(
+                "Chunk Sizes:    min {} - avg {} - max {}".format(
+                    smallest, average, largest
+                )
+            )
+
+    if profiler:
+        profiler.add(
+            "mmap" if io_mode == "mmap" else "read", stats.time_io, count=stats.files
+        )
+        profiler.add("boundary scan", stats.time_scan, count=stats.chunks)
+        profiler.add("hashing", stats.time_hash, count=stats.chunks)
+        click.echo(profiler.report(), err=True)
+        if profile_trace:
+            profiler.write_trace(profile_trace)
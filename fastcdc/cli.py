@@ -1,10 +1,15 @@
 # -*- coding: utf-8 -*-
+import socket
 import click
 from click_default_group import DefaultGroup
 from fastcdc import __version__
 from fastcdc import chunkify
 from fastcdc import benchmark
 from fastcdc import scan
+from fastcdc import scan_merge
+from fastcdc import tune
+from fastcdc import watch
+from fastcdc import verify
 
 
 @click.group(cls=DefaultGroup, default="chunkify", default_if_no_args=False)
@@ -16,6 +21,15 @@ def cli():
 cli.add_command(chunkify.chunkify)
 cli.add_command(benchmark.benchmark)
 cli.add_command(scan.scan)
+cli.add_command(scan_merge.scan_merge)
+cli.add_command(tune.tune)
+cli.add_command(watch.watch)
+cli.add_command(verify.verify)
+# The chunking daemon listens on a Unix socket.
+if hasattr(socket, "AF_UNIX"):
+    from fastcdc import serve
+
+    cli.add_command(serve.serve)
 
 if __name__ == "__main__":
     cli()
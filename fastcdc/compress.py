@@ -0,0 +1,159 @@
+# -*- coding: utf-8 -*-
+import bz2
+import lzma
+import os
+import zlib
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, List, Optional
+from fastcdc.utils import pread
+
+
+# Number of pending compression jobs per thread before `add` waits for results.
+PENDING_PER_THREAD = 4
+# Valid compression levels of the stdlib codecs.
+LEVELS = {"zlib": (-1, 9), "bz2": (1, 9), "lzma": (0, 9)}
+# Fastest level of zstd (ZSTD_minCLevel), the strongest one depends on the build.
+ZSTD_MIN_LEVEL = -(1 << 17)
+
+
+def supported_codecs() -> List[str]:
+    supported = ["zlib", "bz2", "lzma"]
+    try:
+        import zstandard  # noqa: F401
+
+        supported.append("zstd")
+    except ImportError:
+        pass
+    return supported
+
+
+def compressor(codec, level=None):
+    # type: (str, Optional[int]) -> Callable[[bytes], int]
+    """
+    Function returning the compressed size of data with `codec` at `level`.
+
+    The stdlib codecs and zstandard release the GIL while compressing, so the
+    function can be run in parallel threads. Raises ValueError for an unknown
+    codec or a level the codec does not support.
+    """
+    if codec == "zstd":
+        import zstandard
+
+        low, high = ZSTD_MIN_LEVEL, zstandard.MAX_COMPRESSION_LEVEL
+    elif codec in LEVELS:
+        low, high = LEVELS[codec]
+    else:
+        raise ValueError("Unsupported codec: {}".format(codec))
+    if level is not None and not low <= level <= high:
+        raise ValueError(
+            "Level {} is not supported by {}, use {} to {}".format(
+                level, codec, low, high
+            )
+        )
+    if codec == "zlib":
+        level = 6 if level is None else level
+        return lambda data: len(zlib.compress(data, level))
+    if codec == "bz2":
+        level = 9 if level is None else level
+        return lambda data: len(bz2.compress(data, level))
+    if codec == "lzma":
+        preset = 6 if level is None else level
+        return lambda data: len(lzma.compress(data, preset=preset))
+    if codec == "zstd":
+        import zstandard
+
+        level = 3 if level is None else level
+
+        def zstd(data):
+            # ZstdCompressor instances are not thread safe.
+            return len(zstandard.ZstdCompressor(level=level).compress(data))
+
+        return zstd
+
+
+class CompressionEstimator:
+    """
+    Measure the compressed size of unique chunks on a thread pool.
+
+    Chunks are compressed individually, as a chunk store would. To bound the CPU
+    time only a content-based share `sample` of the unique chunks (selected by
+    the leading 32 bits of their hex digest) is compressed and the measured
+    ratio is applied to all unique bytes.
+
+    :param codec: One of `supported_codecs()` (default: "zlib")
+    :param level: Compression level (default: codec default)
+    :param sample: Share of unique chunks to compress (default: 1.0)
+    :param threads: Number of compression threads (default: number of CPUs)
+    """
+
+    def __init__(self, codec="zlib", level=None, sample=1.0, threads=None):
+        self.codec = codec
+        self.compress = compressor(codec, level)
+        self.threshold = int(sample * (1 << 32))
+        self.threads = threads or os.cpu_count() or 1
+        self.executor = ThreadPoolExecutor(self.threads)
+        self.pending = deque()
+        self.unique_bytes = 0
+        self.sampled_bytes = 0
+        self.sampled_compressed = 0
+        self.sampled_chunks = 0
+
+    def sampled(self, digest):
+        # type: (str) -> bool
+        """Whether the unique chunk with hex `digest` is compressed."""
+        return int(digest[:8], 16) < self.threshold
+
+    def add(self, digest, data):
+        # type: (str, bytes) -> None
+        """Add the data of a unique chunk with hex `digest`."""
+        self.unique_bytes += len(data)
+        if not self.sampled(digest):
+            return
+        self.sampled_chunks += 1
+        self.sampled_bytes += len(data)
+        self.pending.append(self.executor.submit(self.compress, data))
+        while len(self.pending) > self.threads * PENDING_PER_THREAD:
+            self.sampled_compressed += self.pending.popleft().result()
+
+    def add_range(self, digest, fd, offset, length):
+        # type: (str, int, int, int) -> None
+        """
+        Add a unique chunk of an open file and only read it if it is sampled.
+
+        :param digest: Hex digest of the chunk
+        :param fd: File descriptor of the chunked file
+        :param offset: Offset of the chunk in the file
+        :param length: Length of the chunk
+        """
+        if not self.sampled(digest):
+            self.unique_bytes += length
+            return
+        self.add(digest, pread(fd, length, offset))
+
+    def close(self):
+        # type: () -> None
+        """Wait for all pending jobs and stop the threads."""
+        while self.pending:
+            self.sampled_compressed += self.pending.popleft().result()
+        self.executor.shutdown()
+
+    @property
+    def ratio(self):
+        # type: () -> float
+        """Compressed to raw size of the sampled unique chunks."""
+        if not self.sampled_bytes:
+            return 1.0
+        return self.sampled_compressed / self.sampled_bytes
+
+    @property
+    def compressed_bytes(self):
+        # type: () -> int
+        """Estimated compressed size of all unique chunks."""
+        return round(self.unique_bytes * self.ratio)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
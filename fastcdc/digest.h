@@ -0,0 +1,48 @@
+/*
+ * Native chunk digests for fastcdc_cy.
+ *
+ * Hashes a chunk with XXH3 from the bundled xxhash.h (BSD 2-Clause, inlined so no
+ * library is linked) and writes the digest as lowercase hex in the canonical
+ * (big endian) byte order used by the hexdigest() of the xxhash package.
+ */
+#ifndef FASTCDC_DIGEST_H
+#define FASTCDC_DIGEST_H
+
+#include <stddef.h>
+#include <stdint.h>
+
+#define XXH_INLINE_ALL
+#include "xxhash.h"
+
+#define DIGEST_NONE 0
+#define DIGEST_XXH3_64 1
+#define DIGEST_XXH3_128 2
+
+static void digest_hex64(uint64_t value, char *out)
+{
+    static const char hex[] = "0123456789abcdef";
+    int k;
+    for (k = 15; k >= 0; k--) {
+        out[k] = hex[value & 0xF];
+        value >>= 4;
+    }
+}
+
+/* Hash data[0:size] with `kind` into out (32 bytes) and return the hex digits. */
+static size_t digest_hex(int kind, const uint8_t *data, size_t size, char *out)
+{
+    XXH128_hash_t h128;
+    switch (kind) {
+    case DIGEST_XXH3_64:
+        digest_hex64(XXH3_64bits(data, size), out);
+        return 16;
+    case DIGEST_XXH3_128:
+        h128 = XXH3_128bits(data, size);
+        digest_hex64(h128.high64, out);
+        digest_hex64(h128.low64, out + 16);
+        return 32;
+    }
+    return 0;
+}
+
+#endif
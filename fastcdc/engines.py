@@ -0,0 +1,183 @@
+# -*- coding: utf-8 -*-
+"""
+Alternative content-defined chunking algorithms.
+
+An engine finds the end of the next chunk at the start of a window of data. The
+gear based FastCDC engine is implemented in `fastcdc_py` and `fastcdc_cy`, the
+other engines are implemented here in pure python and natively in `fastcdc_cy`.
+Select them with the `engine` parameter of `fastcdc()` or `--engine` on the
+command line. All engines honor the minimum and maximum chunk size.
+
+- buzhash: Cyclic polynomial hash over a sliding window of BUZHASH_WINDOW bytes.
+- rabin: Rabin fingerprint over a sliding window of RABIN_WINDOW bytes.
+- ae: Asymmetric Extremum, cut a fixed distance after the last maximum.
+- ram: Rapid Asymmetric Maximum, cut at the first byte reaching the maximum of a
+  fixed window at the chunk start.
+"""
+
+from hashlib import sha256
+from math import e
+from typing import Callable, Dict, List
+from fastcdc.utils import logarithm2, mask
+
+
+ENGINES = ("fastcdc", "buzhash", "rabin", "ae", "ram")
+
+BUZHASH_WINDOW = 48
+RABIN_WINDOW = 64
+# Irreducible polynomial of degree 53 (the test polynomial of restic's chunker).
+RABIN_POLYNOMIAL = 0x3DA3358B4DC173
+RABIN_DEGREE = 53
+RABIN_SHIFT = RABIN_DEGREE - 8
+
+
+def buzhash_table():
+    # type: () -> List[int]
+    """Deterministic table of 256 random 32-bit values for Buzhash."""
+    return [
+        int.from_bytes(sha256(b"buzhash %d" % i).digest()[:4], "little")
+        for i in range(256)
+    ]
+
+
+def polynomial_mod(x, polynomial):
+    # type: (int, int) -> int
+    """Remainder of x divided by polynomial over GF(2)."""
+    degree = polynomial.bit_length() - 1
+    while x.bit_length() - 1 >= degree:
+        x ^= polynomial << (x.bit_length() - 1 - degree)
+    return x
+
+
+def rabin_tables():
+    # type: () -> tuple
+    """Tables to append a byte to (mod) and remove a byte from (out) a fingerprint."""
+    mod_table, out_table = [], []
+    for b in range(256):
+        mod_table.append(polynomial_mod(b << RABIN_DEGREE, RABIN_POLYNOMIAL))
+        mod_table[b] |= b << RABIN_DEGREE
+        out_table.append(
+            polynomial_mod(b << (8 * (RABIN_WINDOW - 1)), RABIN_POLYNOMIAL)
+        )
+    return mod_table, out_table
+
+
+BUZHASH_TABLE = buzhash_table()
+RABIN_MOD, RABIN_OUT = rabin_tables()
+
+
+def parameters(engine, min_size, avg_size, max_size):
+    # type: (str, int, int, int) -> Dict[str, int]
+    """
+    Mask and window size of an engine for the requested chunk sizes.
+
+    Hash based engines check for boundaries after `min_size` bytes, so their mask
+    is sized for the average distance from there. The window sizes of the extremum
+    based engines follow from their expected chunk sizes on random data.
+
+    :param engine: Name of the engine (one of ENGINES except "fastcdc")
+    :param min_size: Minimum chunk size
+    :param avg_size: Average chunk size
+    :param max_size: Maximum chunk size
+    :return: Dict with `mask` and `window`
+    """
+    if engine in ("buzhash", "rabin"):
+        bits = logarithm2(max(avg_size - min_size, 256))
+        return dict(mask=mask(bits), window=0)
+    if engine == "ae":
+        return dict(mask=0, window=max(1, round(avg_size / (e - 1))))
+    if engine == "ram":
+        return dict(mask=0, window=max(min_size, avg_size - 256))
+    raise ValueError("Unsupported engine: {}".format(engine))
+
+
+def offset_function(engine, min_size, avg_size, max_size):
+    # type: (str, int, int, int) -> Callable
+    """Function returning the end of the next chunk in a memoryview."""
+    params = parameters(engine, min_size, avg_size, max_size)
+    if engine == "buzhash":
+        return lambda data: buzhash_offset(
+            data, min_size, max_size, params["mask"], BUZHASH_TABLE
+        )
+    if engine == "rabin":
+        return lambda data: rabin_offset(
+            data, min_size, max_size, params["mask"], RABIN_MOD, RABIN_OUT
+        )
+    if engine == "ae":
+        return lambda data: ae_offset(data, min_size, max_size, params["window"])
+    return lambda data: ram_offset(data, min_size, max_size, params["window"])
+
+
+def buzhash_offset(data, mi, ma, mask_b, table):
+    # type: (memoryview, int, int, int, List[int]) -> int
+    """Chunk end where the Buzhash of the window matches `mask_b`."""
+    size = len(data)
+    if size <= mi:
+        return size
+    end = min(ma, size)
+    start = max(0, mi - BUZHASH_WINDOW)
+    rotate = BUZHASH_WINDOW % 32
+    h = 0
+    for i in range(start, end):
+        h = ((h << 1) | (h >> 31)) & 0xFFFFFFFF
+        h ^= table[data[i]]
+        if i - start >= BUZHASH_WINDOW:
+            out = table[data[i - BUZHASH_WINDOW]]
+            h ^= ((out << rotate) | (out >> (32 - rotate))) & 0xFFFFFFFF
+        if i >= mi and not h & mask_b:
+            return i + 1
+    return end
+
+
+def rabin_offset(data, mi, ma, mask_r, mod_table, out_table):
+    # type: (memoryview, int, int, int, List[int], List[int]) -> int
+    """Chunk end where the Rabin fingerprint of the window matches `mask_r`."""
+    size = len(data)
+    if size <= mi:
+        return size
+    end = min(ma, size)
+    start = max(0, mi - RABIN_WINDOW)
+    digest = 0
+    for i in range(start, end):
+        if i - start >= RABIN_WINDOW:
+            digest ^= out_table[data[i - RABIN_WINDOW]]
+        digest = ((digest << 8) | data[i]) ^ mod_table[digest >> RABIN_SHIFT]
+        if i >= mi and not digest & mask_r:
+            return i + 1
+    return end
+
+
+def ae_offset(data, mi, ma, window):
+    # type: (memoryview, int, int, int) -> int
+    """Chunk end `window` bytes after a maximum of the 32-bit values ending at i."""
+    size = len(data)
+    if size <= mi:
+        return size
+    end = min(ma, size)
+    value = 0
+    max_value = -1
+    max_pos = 0
+    for i in range(end):
+        value = ((value << 8) | data[i]) & 0xFFFFFFFF
+        if value > max_value:
+            max_value = value
+            max_pos = i
+        elif i - max_pos >= window and i >= mi:
+            return i + 1
+    return end
+
+
+def ram_offset(data, mi, ma, window):
+    # type: (memoryview, int, int, int) -> int
+    """Chunk end at the first byte after `window` not below the window maximum."""
+    size = len(data)
+    if size <= mi:
+        return size
+    end = min(ma, size)
+    if window >= end:
+        return end
+    max_value = max(data[:window])
+    for i in range(window, end):
+        if data[i] >= max_value:
+            return i + 1
+    return end
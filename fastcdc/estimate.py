@@ -0,0 +1,155 @@
+# -*- coding: utf-8 -*-
+import math
+from hashlib import sha1
+from typing import Tuple
+
+
+# Default maximum number of sampled fingerprints kept by DedupeEstimator.
+MAX_SAMPLES = 1 << 20
+# Number of index bits of the HyperLogLog registers (2**14 registers).
+HLL_PRECISION = 14
+# Two sided 95% quantile of the normal distribution.
+Z95 = 1.959964
+
+
+class HyperLogLog:
+    """
+    Estimate the number of distinct hex digests in fixed memory.
+
+    Uses 2**precision one byte registers, the standard error of the estimate is
+    about 1.04 / sqrt(2**precision).
+
+    :param precision: Number of index bits (default: HLL_PRECISION)
+    """
+
+    def __init__(self, precision=HLL_PRECISION):
+        self.precision = precision
+        self.registers = bytearray(1 << precision)
+
+    def add(self, digest):
+        # type: (str) -> None
+        """Add a hex digest (at least 4 bytes, uniformly distributed)."""
+        bits = min(len(digest), 16) * 4
+        value = int(digest[:16], 16)
+        index = value >> (bits - self.precision)
+        rest = value & ((1 << (bits - self.precision)) - 1)
+        rank = bits - self.precision - rest.bit_length() + 1
+        if rank > self.registers[index]:
+            self.registers[index] = rank
+
+    def count(self):
+        # type: () -> int
+        """Estimated number of distinct digests."""
+        m = len(self.registers)
+        alpha = 0.7213 / (1 + 1.079 / m)
+        estimate = alpha * m * m / sum(2.0**-r for r in self.registers)
+        zeros = self.registers.count(0)
+        if estimate <= 2.5 * m and zeros:
+            # Linear counting for small cardinalities.
+            estimate = m * math.log(m / zeros)
+        return round(estimate)
+
+    def error(self):
+        # type: () -> float
+        """Relative standard error of `count()`."""
+        return 1.04 / math.sqrt(len(self.registers))
+
+
+class DedupeEstimator:
+    """
+    Estimate deduplication from a content-based sample of chunk fingerprints.
+
+    A fingerprint is sampled if its leading 32 bits are below a threshold, so all
+    occurrences of a chunk are either sampled or not. If more than `max_samples`
+    fingerprints are sampled the threshold is halved and fingerprints above it
+    are dropped, which keeps memory bounded for any amount of data. The share of
+    unique bytes is estimated as ratio of unique to total bytes in the sample,
+    the number of unique chunks with a HyperLogLog over all fingerprints.
+
+    :param max_samples: Maximum number of sampled fingerprints (default: MAX_SAMPLES)
+    """
+
+    def __init__(self, max_samples=MAX_SAMPLES):
+        self.max_samples = max_samples
+        self.threshold = 1 << 32
+        self.samples = {}
+        self.hll = HyperLogLog()
+        self.chunks = 0
+        self.bytes_chunks = 0
+        self.bytes_extra_dupe = 0
+
+    @property
+    def rate(self):
+        # type: () -> float
+        """Current sampling rate."""
+        return self.threshold / (1 << 32)
+
+    @property
+    def bytes_total(self):
+        # type: () -> int
+        """Exact number of scanned bytes."""
+        return self.bytes_chunks + self.bytes_extra_dupe
+
+    def add(self, digest, length):
+        # type: (str, int) -> None
+        """Add a chunk with hex `digest` and `length` bytes."""
+        self.chunks += 1
+        self.bytes_chunks += length
+        self.hll.add(digest)
+        if int(digest[:8], 16) >= self.threshold:
+            return
+        key = int(digest[:16], 16)
+        record = self.samples.get(key)
+        if record is not None:
+            record[1] += 1
+            return
+        self.samples[key] = [length, 1]
+        if len(self.samples) > self.max_samples:
+            self.threshold //= 2
+            shift = len(digest[:16]) * 4 - 32
+            self.samples = {
+                k: v for k, v in self.samples.items() if k >> shift < self.threshold
+            }
+
+    def add_duplicate(self, length):
+        # type: (int) -> None
+        """Add `length` bytes known to be duplicates (e.g. identical files)."""
+        self.bytes_extra_dupe += length
+
+    def unique_share(self):
+        # type: () -> Tuple[float, float]
+        """Estimated share of unique bytes in the chunked data and its std error."""
+        unique = sum(size for size, _ in self.samples.values())
+        total = sum(size * count for size, count in self.samples.values())
+        if not total:
+            return 1.0, 0.0
+        ratio = unique / total
+        # Linearized variance of a ratio estimator under Poisson sampling.
+        residuals = sum(
+            (size - ratio * size * count) ** 2 for size, count in self.samples.values()
+        )
+        variance = (1 - self.rate) * residuals / (total * total)
+        return ratio, math.sqrt(variance)
+
+    def dedupe_ratio(self):
+        # type: () -> Tuple[float, float, float]
+        """Estimated dedupe ratio (share of duplicate bytes) with 95% bounds."""
+        if not self.bytes_total:
+            return 0.0, 0.0, 0.0
+        share, error = self.unique_share()
+        weight = self.bytes_chunks / self.bytes_total
+        extra = self.bytes_extra_dupe / self.bytes_total
+        ratio = extra + weight * (1 - share)
+        margin = weight * Z95 * error
+        return ratio, max(extra, ratio - margin), min(1.0, ratio + margin)
+
+
+def sample_file(path, rate):
+    # type: (str, float) -> bool
+    """Deterministically select a share of `rate` of all file paths."""
+    if rate >= 1:
+        return True
+    key = int.from_bytes(
+        sha1(path.encode("utf-8", "surrogateescape")).digest()[:4], "big"
+    )
+    return key < rate * (1 << 32)
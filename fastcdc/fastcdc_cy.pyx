@@ -1,14 +1,55 @@
 # -*- coding: utf-8 -*-
+from time import perf_counter
 from typing import Callable, Iterator
 
 cimport cython
-from libc.stdint cimport uint32_t, uint8_t
+from libc.stdint cimport uint32_t, uint64_t, uint8_t
 from libc.math cimport log2, lround
-from fastcdc.utils import get_memoryview, Data
+from libc.string cimport memcmp
+from fastcdc import engines
+from fastcdc.engines import ENGINES
+from fastcdc.utils import file_holes, get_memoryview, hash_constructor, NATIVE_HASHES, Data
 
 
-def fastcdc_cy(data, min_size=None, avg_size=8192, max_size=None, fat=False, hf=None):
-    # type: (Data, int|None, int, int|None, bool, Callable|None) -> Iterator["Chunk"]
+cdef extern from "gear.h":
+    size_t gear_scan(
+        const uint8_t *data,
+        size_t i,
+        size_t end,
+        uint32_t *state,
+        uint32_t mask,
+        const uint32_t *gear,
+    ) nogil
+    int gear_select(const char *name)
+    const char *gear_isa()
+
+
+cdef extern from "sketch.h":
+    enum: SKETCH_FEATURES
+    void chunk_sketch(
+        const uint8_t *data, size_t size, const uint32_t *gear, uint32_t *features
+    ) nogil
+
+
+cdef extern from "digest.h":
+    int DIGEST_NONE
+    int DIGEST_XXH3_64
+    int DIGEST_XXH3_128
+    size_t digest_hex(int kind, const uint8_t *data, size_t size, char *out) nogil
+
+
+def fastcdc_cy(
+    data,
+    min_size=None,
+    avg_size=8192,
+    max_size=None,
+    fat=False,
+    hf=None,
+    stats=None,
+    engine="fastcdc",
+    sketch=False,
+):
+    # type: (Data, int|None, int, int|None, bool, Callable|str|None, Stats|None, str, bool) -> Iterator["Chunk"]
     """
     Perform Fast Content-Defined Chunking (FastCDC) on input data.
 
@@ -17,7 +58,10 @@ def fastcdc_cy(data, min_size=None, avg_size=8192, max_size=None, fat=False, hf=
     :param avg_size: Average chunk size (default: 8192)
     :param max_size: Maximum chunk size (default: avg_size * 8)
     :param fat: If True, include chunk offset and size in output
-    :param hf: Hash function to use for chunking (default: None)
+    :param hf: Hash function or name of a supported hash function (default: None)
+    :param stats: Stats instance to collect counters and timings (default: None)
+    :param engine: Chunking algorithm, one of ENGINES (default: "fastcdc")
+    :param sketch: If True, include resemblance features in output
     :return: Generator yielding Chunk objects
     """
     if min_size is None:
@@ -28,15 +72,38 @@ def fastcdc_cy(data, min_size=None, avg_size=8192, max_size=None, fat=False, hf=
     assert MINIMUM_MIN <= min_size <= MINIMUM_MAX
     assert AVERAGE_MIN <= avg_size <= AVERAGE_MAX
     assert MAXIMUM_MIN <= max_size <= MAXIMUM_MAX
+    if engine not in ENGINES:
+        raise ValueError("Unsupported engine: {}".format(engine))
 
-    mview = get_memoryview(data)
-    return chunk_generator(mview, min_size, avg_size, max_size, fat, hf)
+    if stats is None:
+        mview = get_memoryview(data)
+        holes = file_holes(data)
+    else:
+        start = perf_counter()
+        mview = get_memoryview(data)
+        holes = file_holes(data)
+        stats.time_io += perf_counter() - start
+        stats.files += 1
+    return chunk_generator(
+        mview, min_size, avg_size, max_size, fat, hf, stats, engine, holes, sketch
+    )
 
 
 @cython.boundscheck(False)
 @cython.wraparound(False)
-def chunk_generator(memview, min_size, avg_size, max_size, fat, hf):
-    # type: (memoryview, int, int, int, bool, Callable) -> Iterator[Chunk]
+def chunk_generator(
+    memview,
+    min_size,
+    avg_size,
+    max_size,
+    fat,
+    hf,
+    stats=None,
+    engine="fastcdc",
+    holes=None,
+    sketch=False,
+):
+    # type: (memoryview, int, int, int, bool, Callable|str, Stats|None, str, list|None, bool) -> Iterator[Chunk]
     """
     Generate chunks from memoryview data using FastCDC algorithm.
 
@@ -45,53 +112,380 @@ def chunk_generator(memview, min_size, avg_size, max_size, fat, hf):
     :param avg_size: Average chunk size
     :param max_size: Maximum chunk size
     :param fat: If True, include chunk data in output
-    :param hf: Hash function to use for chunking
+    :param hf: Hash function or name of a supported hash function. The names in
+        NATIVE_HASHES are computed natively without calling back into Python.
+    :param stats: Stats instance to collect counters and timings
+    :param engine: Chunking algorithm, one of ENGINES
+    :param holes: Sorted (start, end) ranges of the data known to be zero, which
+        are chunked without reading them (see `file_holes`)
+    :param sketch: If True, compute the resemblance features of every chunk
+        while its data is still in the CPU cache
     :return: Generator yielding Chunk objects
     """
-    cs = center_size(avg_size, min_size, max_size)
-    bits = logarithm2(avg_size)
-    mask_s = mask(bits + 1)
-    mask_l = mask(bits - 1)
-    read_size = max(1024 * 64, max_size)
+    cdef uint32_t mi = min_size
+    cdef uint32_t ma = max_size
+    cdef uint32_t cs = center_size(avg_size, min_size, max_size)
+    cdef uint32_t bits = logarithm2(avg_size)
+    cdef uint32_t mask_s = mask(bits + 1)
+    cdef uint32_t mask_l = mask(bits - 1)
+    cdef size_t cp, offset, size, digits
+    cdef const uint8_t[:] view = memview
+    cdef int kind = DIGEST_NONE
+    cdef char hexdigest[32]
+    cdef int eng = ENGINES.index(engine)
+    cdef uint64_t emask = 0
+    cdef size_t window = 0
+    cdef Py_ssize_t hole = 0
+    cdef size_t hole_end = 0, run
+    cdef int byte
+    if eng != ENGINE_FASTCDC:
+        params = engines.parameters(engine, min_size, avg_size, max_size)
+        emask = params["mask"]
+        window = params["window"]
+    if isinstance(hf, str):
+        if hf in NATIVE_HASHES:
+            kind = DIGEST_XXH3_64 if hf == "xxh3_64" else DIGEST_XXH3_128
+            hf = None
+        else:
+            hf = hash_constructor(hf)
     offset = 0
-    while offset < len(memview):
-        blob = memview[offset:offset + read_size]
-        cp = cdc_offset(blob, min_size, max_size, cs, mask_s, mask_l)
-        raw = bytes(blob[:cp]) if fat else b''
-        h = hf(blob[:cp]).hexdigest() if hf else ''
-        yield Chunk(offset, cp, raw, h)
+    size = view.shape[0]
+    h = ''
+    features = ()
+    holes = holes or ()
+    runs = {}
+    while offset < size:
+        # Runs of identical bytes (and holes) are cut at the same length every
+        # time, so their chunks are looked up instead of scanned.
+        byte = -1
+        if hole < len(holes):
+            while hole < len(holes) and holes[hole][1] <= offset:
+                hole += 1
+            if hole < len(holes) and holes[hole][0] <= offset:
+                byte = 0
+                hole_end = holes[hole][1]
+        if byte < 0 and size - offset > mi and view[offset] == view[offset + mi]:
+            byte = view[offset]
+        if byte >= 0:
+            if byte not in runs:
+                runs[byte] = run_chunk(
+                    byte, eng, mi, ma, cs, mask_s, mask_l, emask, window, kind, hf
+                )
+            run, run_hash, run_features = runs[byte]
+            if offset + run <= size and (
+                offset + run <= hole_end
+                or memcmp(&view[offset], &view[offset + 1], run - 1) == 0
+                and view[offset] == byte
+            ):
+                raw = bytes((byte,)) * run if fat else b''
+                if stats is not None:
+                    stats.bytes_runs += run
+                    stats.add_chunk(run, max_size, offset + run == size)
+                yield Chunk(
+                    offset, run, raw, run_hash, run_features if sketch else ()
+                )
+                offset += run
+                continue
+        if stats is None:
+            with nogil:
+                cp = engine_offset(
+                    eng, &view[offset], size - offset, mi, ma, cs, mask_s, mask_l, emask, window
+                )
+                if kind != DIGEST_NONE:
+                    digits = digest_hex(kind, &view[offset], cp, hexdigest)
+            if kind != DIGEST_NONE:
+                h = hexdigest[:digits].decode('ascii')
+            elif hf:
+                h = hf(memview[offset:offset + cp]).hexdigest()
+            if sketch:
+                features = sketch_features(&view[offset], cp)
+            raw = bytes(memview[offset:offset + cp]) if fat else b''
+        else:
+            start = perf_counter()
+            with nogil:
+                cp = engine_offset(
+                    eng, &view[offset], size - offset, mi, ma, cs, mask_s, mask_l, emask, window
+                )
+            scanned = perf_counter()
+            raw = bytes(memview[offset:offset + cp]) if fat else b''
+            copied = perf_counter()
+            if kind != DIGEST_NONE:
+                with nogil:
+                    digits = digest_hex(kind, &view[offset], cp, hexdigest)
+                h = hexdigest[:digits].decode('ascii')
+            elif hf:
+                h = hf(memview[offset:offset + cp]).hexdigest()
+            if sketch:
+                features = sketch_features(&view[offset], cp)
+            stats.time_hash += perf_counter() - copied
+            stats.time_io += copied - scanned
+            stats.time_scan += scanned - start
+            stats.add_chunk(cp, max_size, offset + cp == size)
+        yield Chunk(offset, cp, raw, h, features)
         offset += cp
 
 
+def run_chunk(
+    int byte,
+    int eng,
+    uint32_t mi,
+    uint32_t ma,
+    uint32_t cs,
+    uint32_t mask_s,
+    uint32_t mask_l,
+    uint64_t emask,
+    size_t window,
+    int kind,
+    hf,
+):
+    # type: (...) -> tuple
+    """Length, hash and features of a chunk that starts in a long run of `byte`."""
+    cdef char hexdigest[32]
+    cdef size_t digits
+    data = bytes((byte,)) * ma
+    cdef const uint8_t[:] view = data
+    cdef size_t run = engine_offset(
+        eng, &view[0], ma, mi, ma, cs, mask_s, mask_l, emask, window
+    )
+    features = sketch_features(&view[0], run)
+    if kind != DIGEST_NONE:
+        digits = digest_hex(kind, &view[0], run, hexdigest)
+        return run, hexdigest[:digits].decode('ascii'), features
+    if hf:
+        return run, hf(data[:run]).hexdigest(), features
+    return run, '', features
+
+
+cdef tuple sketch_features(const uint8_t *data, size_t size):
+    cdef uint32_t features[SKETCH_FEATURES]
+    with nogil:
+        chunk_sketch(data, size, GEAR, features)
+    return tuple([features[k] for k in range(SKETCH_FEATURES)])
+
+
 @cython.boundscheck(False)
 @cython.wraparound(False)
-cdef uint32_t cdc_offset(
-    const uint8_t[:] data,
+cdef size_t cdc_offset(
+    const uint8_t *data,
+    size_t size,
     uint32_t mi,
     uint32_t ma,
     uint32_t cs,
     uint32_t mask_s,
     uint32_t mask_l
-):
-    cdef uint32_t pattern, i, size, barrier
-    pattern = 0
-    size = len(data)
+) noexcept nogil:
+    cdef uint32_t pattern = 0
+    cdef size_t i, barrier, cut
     i = min(mi, size)
     barrier = min(cs, size)
-    while i < barrier:
-        pattern = (pattern >> 1) + GEAR[data[i]]
-        if not pattern & mask_s:
-            return i + 1
-        i += 1
+    if i < barrier:
+        cut = gear_scan(data, i, barrier, &pattern, mask_s, GEAR)
+        if cut:
+            return cut
+        i = barrier
     barrier = min(ma, size)
-    while i < barrier:
-        pattern = (pattern >> 1) + GEAR[data[i]]
-        if not pattern & mask_l:
-            return i + 1
-        i += 1
+    if i < barrier:
+        cut = gear_scan(data, i, barrier, &pattern, mask_l, GEAR)
+        if cut:
+            return cut
+        i = barrier
     return i
 
 
+# Engine ids in the order of ENGINES.
+cdef enum:
+    ENGINE_FASTCDC
+    ENGINE_BUZHASH
+    ENGINE_RABIN
+    ENGINE_AE
+    ENGINE_RAM
+
+
+cdef size_t engine_offset(
+    int engine,
+    const uint8_t *data,
+    size_t size,
+    uint32_t mi,
+    uint32_t ma,
+    uint32_t cs,
+    uint32_t mask_s,
+    uint32_t mask_l,
+    uint64_t emask,
+    size_t window
+) noexcept nogil:
+    if engine == ENGINE_BUZHASH:
+        return buzhash_offset(data, size, mi, ma, <uint32_t>emask)
+    if engine == ENGINE_RABIN:
+        return rabin_offset(data, size, mi, ma, emask)
+    if engine == ENGINE_AE:
+        return ae_offset(data, size, mi, ma, window)
+    if engine == ENGINE_RAM:
+        return ram_offset(data, size, mi, ma, window)
+    return cdc_offset(data, size, mi, ma, cs, mask_s, mask_l)
+
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+cdef size_t buzhash_offset(
+    const uint8_t *data, size_t size, size_t mi, size_t ma, uint32_t mask_b
+) noexcept nogil:
+    cdef uint32_t h = 0, out
+    cdef size_t i, start, end
+    cdef uint32_t rotate = BUZHASH_WINDOW % 32
+    if size <= mi:
+        return size
+    end = min(ma, size)
+    start = mi - BUZHASH_WINDOW if mi > BUZHASH_WINDOW else 0
+    for i in range(start, end):
+        h = ((h << 1) | (h >> 31)) ^ BUZHASH[data[i]]
+        if i - start >= BUZHASH_WINDOW:
+            out = BUZHASH[data[i - BUZHASH_WINDOW]]
+            h ^= (out << rotate) | (out >> ((32 - rotate) & 31))
+        if i >= mi and not h & mask_b:
+            return i + 1
+    return end
+
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+cdef size_t rabin_offset(
+    const uint8_t *data, size_t size, size_t mi, size_t ma, uint64_t mask_r
+) noexcept nogil:
+    cdef uint64_t digest = 0
+    cdef size_t i, start, end
+    if size <= mi:
+        return size
+    end = min(ma, size)
+    start = mi - RABIN_WINDOW if mi > RABIN_WINDOW else 0
+    for i in range(start, end):
+        if i - start >= RABIN_WINDOW:
+            digest ^= RABIN_OUT[data[i - RABIN_WINDOW]]
+        digest = ((digest << 8) | data[i]) ^ RABIN_MOD[digest >> RABIN_SHIFT]
+        if i >= mi and not digest & mask_r:
+            return i + 1
+    return end
+
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+cdef size_t ae_offset(
+    const uint8_t *data, size_t size, size_t mi, size_t ma, size_t window
+) noexcept nogil:
+    cdef uint32_t value = 0, max_value = 0
+    cdef size_t i, end, max_pos = 0
+    if size <= mi:
+        return size
+    end = min(ma, size)
+    for i in range(end):
+        value = (value << 8) | data[i]
+        if value > max_value:
+            max_value = value
+            max_pos = i
+        elif i - max_pos >= window and i >= mi:
+            return i + 1
+    return end
+
+
+@cython.boundscheck(False)
+@cython.wraparound(False)
+cdef size_t ram_offset(
+    const uint8_t *data, size_t size, size_t mi, size_t ma, size_t window
+) noexcept nogil:
+    cdef uint8_t max_value = 0
+    cdef size_t i, end
+    if size <= mi:
+        return size
+    end = min(ma, size)
+    if window >= end:
+        return end
+    for i in range(window):
+        if data[i] > max_value:
+            max_value = data[i]
+    for i in range(window, end):
+        if data[i] >= max_value:
+            return i + 1
+    return end
+
+
+def cut(source, source_offset, source_size, min_size, avg_size, max_size, mask_s, mask_l):
+    # type: (bytes|mmap, int, int, int, int, int, int, int) -> int
+    """
+    Compiled `FastCDC.cut` of the fastcdc-rs port in `fastcdc.original`.
+
+    :param source: Buffer with the data to be chunked
+    :param source_offset: Start of the next chunk in source
+    :param source_size: Number of remaining bytes from source_offset
+    :param min_size: Minimum chunk size
+    :param avg_size: Average chunk size
+    :param max_size: Maximum chunk size
+    :param mask_s: Mask used before the center size
+    :param mask_l: Mask used after the center size
+    :return: Size of the chunk starting at source_offset
+    """
+    cdef const uint8_t[:] view = source
+    cdef size_t offset = source_offset
+    cdef size_t size = source_size
+    cdef uint32_t mi = min_size
+    cdef uint32_t ms = mask_s
+    cdef uint32_t ml = mask_l
+    cdef uint32_t cs
+    if size <= mi:
+        return size
+    if size > max_size:
+        size = max_size
+    cs = center_size(avg_size, min_size, size)
+    with nogil:
+        size = cdc_offset(&view[offset], size, mi, size, cs, ms, ml)
+    return size
+
+
+def native_digest(data, name):
+    # type: (bytes|memoryview, str) -> str
+    """
+    Hex digest of data with a hash in NATIVE_HASHES, computed without the GIL.
+
+    :param data: Buffer to hash
+    :param name: "xxh3_64" or "xxh3_128"
+    :return: Hex digest equal to the hexdigest() of the xxhash package
+    """
+    cdef const uint8_t[:] view = data
+    cdef char hexdigest[32]
+    cdef size_t digits
+    cdef size_t size = view.shape[0]
+    cdef int kind
+    cdef const uint8_t *start = NULL
+    if name == "xxh3_64":
+        kind = DIGEST_XXH3_64
+    elif name == "xxh3_128":
+        kind = DIGEST_XXH3_128
+    else:
+        raise ValueError("Not a native hash: {}".format(name))
+    if size:
+        start = &view[0]
+    with nogil:
+        digits = digest_hex(kind, start, size, hexdigest)
+    return hexdigest[:digits].decode('ascii')
+
+
+def isa():
+    # type: () -> str
+    """Name of the instruction set used for the boundary search (e.g. avx2)."""
+    return gear_isa().decode()
+
+
+def set_isa(name=None):
+    # type: (str|None) -> None
+    """
+    Select the instruction set used for the boundary search.
+
+    :param name: "avx2", "portable", "scalar" or None for the best supported one
+    """
+    if name is None:
+        gear_select(NULL)
+    elif gear_select(name.encode()) != 0:
+        raise ValueError("Unsupported instruction set: {}".format(name))
+
+
 ########################################################################################
 # Utility functions and classes                                                        #
 ########################################################################################
@@ -102,18 +496,23 @@ cdef class Chunk:
     cdef readonly int length
     cdef readonly bytes data
     cdef readonly str hash
+    cdef readonly tuple features
 
-    def __init__(self, offset, length, data, hash):
+    def __init__(self, offset, length, data, hash, features=()):
         self.offset = offset
         self.length = length
         self.data = data
         self.hash = hash
+        self.features = features
 
     def __str__(self):
         return "hash={} offset={} size={}".format(
             self.hash, self.offset, self.length
         )
 
+    def __reduce__(self):
+        return Chunk, (self.offset, self.length, self.data, self.hash, self.features)
+
 
 cdef uint32_t logarithm2(uint32_t value):
     return lround(log2(value))
@@ -155,6 +554,17 @@ cdef MAXIMUM_MIN = 1024
 cdef MAXIMUM_MAX = 1_073_741_824
 
 
+cdef size_t BUZHASH_WINDOW = engines.BUZHASH_WINDOW
+cdef size_t RABIN_WINDOW = engines.RABIN_WINDOW
+cdef uint32_t RABIN_SHIFT = engines.RABIN_SHIFT
+cdef uint32_t[256] BUZHASH
+cdef uint64_t[256] RABIN_MOD
+cdef uint64_t[256] RABIN_OUT
+for _i in range(256):
+    BUZHASH[_i] = engines.BUZHASH_TABLE[_i]
+    RABIN_MOD[_i] = engines.RABIN_MOD[_i]
+    RABIN_OUT[_i] = engines.RABIN_OUT[_i]
+
 cdef uint32_t[256]  GEAR = [
   1553318008, 574654857,  759734804,  310648967,  1393527547, 1195718329,
   694400241,  1154184075, 1319583805, 1298164590, 122602963,  989043992,
@@ -1,11 +1,23 @@
 # -*- coding: utf-8 -*-
+from time import perf_counter
 from typing import Callable, Iterator
-from fastcdc.utils import get_memoryview, Data
+from fastcdc.engines import ENGINES, offset_function
+from fastcdc.utils import file_holes, get_memoryview, hash_constructor, Data
 from math import log2
 
 
-def fastcdc_py(data, min_size=None, avg_size=8192, max_size=None, fat=False, hf=None):
-    # type: (Data, int|None, int, int|None, bool, Callable|None) -> Iterator["Chunk"]
+def fastcdc_py(
+    data,
+    min_size=None,
+    avg_size=8192,
+    max_size=None,
+    fat=False,
+    hf=None,
+    stats=None,
+    engine="fastcdc",
+    sketch=False,
+):
+    # type: (Data, int|None, int, int|None, bool, Callable|str|None, Stats|None, str, bool) -> Iterator["Chunk"]
     """
     Perform Fast Content-Defined Chunking (FastCDC) on input data.
 
@@ -14,7 +26,10 @@ def fastcdc_py(data, min_size=None, avg_size=8192, max_size=None, fat=False, hf=
     :param avg_size: Average chunk size (default: 8192)
     :param max_size: Maximum chunk size (default: avg_size * 8)
     :param fat: If True, include chunk offset and size in output
-    :param hf: Hash function to use for chunking (default: None)
+    :param hf: Hash function or name of a supported hash function (default: None)
+    :param stats: Stats instance to collect counters and timings (default: None)
+    :param engine: Chunking algorithm, one of ENGINES (default: "fastcdc")
+    :param sketch: If True, include resemblance features in output
     :return: Generator yielding Chunk objects
     """
     if min_size is None:
@@ -25,13 +40,36 @@ def fastcdc_py(data, min_size=None, avg_size=8192, max_size=None, fat=False, hf=
     assert MINIMUM_MIN <= min_size <= MINIMUM_MAX
     assert AVERAGE_MIN <= avg_size <= AVERAGE_MAX
     assert MAXIMUM_MIN <= max_size <= MAXIMUM_MAX
+    if engine not in ENGINES:
+        raise ValueError("Unsupported engine: {}".format(engine))
 
-    mview = get_memoryview(data)
-    return chunk_generator(mview, min_size, avg_size, max_size, fat, hf)
+    if stats is None:
+        mview = get_memoryview(data)
+        holes = file_holes(data)
+    else:
+        start = perf_counter()
+        mview = get_memoryview(data)
+        holes = file_holes(data)
+        stats.time_io += perf_counter() - start
+        stats.files += 1
+    return chunk_generator(
+        mview, min_size, avg_size, max_size, fat, hf, stats, engine, holes, sketch
+    )
 
 
-def chunk_generator(memview, min_size, avg_size, max_size, fat, hf):
-    # type: (memoryview, int, int, int, bool, Callable) -> Iterator[Chunk]
+def chunk_generator(
+    memview,
+    min_size,
+    avg_size,
+    max_size,
+    fat,
+    hf,
+    stats=None,
+    engine="fastcdc",
+    holes=None,
+    sketch=False,
+):
+    # type: (memoryview, int, int, int, bool, Callable|str, Stats|None, str, list|None, bool) -> Iterator[Chunk]
     """
     Generate chunks from memoryview data using FastCDC algorithm.
 
@@ -40,21 +78,84 @@ def chunk_generator(memview, min_size, avg_size, max_size, fat, hf):
     :param avg_size: Average chunk size
     :param max_size: Maximum chunk size
     :param fat: If True, include chunk data in output
-    :param hf: Hash function to use for chunking
+    :param hf: Hash function or name of a supported hash function
+    :param stats: Stats instance to collect counters and timings
+    :param engine: Chunking algorithm, one of ENGINES
+    :param holes: Sorted (start, end) ranges of the data known to be zero, which
+        are chunked without reading them (see `file_holes`)
+    :param sketch: If True, compute the resemblance features of every chunk
     :return: Generator yielding Chunk objects
     """
-    cs = center_size(avg_size, min_size, max_size)
-    bits = logarithm2(avg_size)
-    mask_s = mask(bits + 1)
-    mask_l = mask(bits - 1)
+    if isinstance(hf, str):
+        hf = hash_constructor(hf)
+    if engine == "fastcdc":
+        cs = center_size(avg_size, min_size, max_size)
+        bits = logarithm2(avg_size)
+        mask_s = mask(bits + 1)
+        mask_l = mask(bits - 1)
+
+        def find(data):
+            return cdc_offset(data, min_size, max_size, cs, mask_s, mask_l)
+
+    else:
+        find = offset_function(engine, min_size, avg_size, max_size)
     read_size = max(1024 * 64, max_size)
     offset = 0
-    while offset < len(memview):
+    size = len(memview)
+    holes = holes or ()
+    hole = 0
+    hole_end = 0
+    runs = {}
+    while offset < size:
+        # Runs of identical bytes (and holes) are cut at the same length every
+        # time, so their chunks are looked up instead of scanned.
+        byte = -1
+        while hole < len(holes) and holes[hole][1] <= offset:
+            hole += 1
+        if hole < len(holes) and holes[hole][0] <= offset:
+            byte = 0
+            hole_end = holes[hole][1]
+        elif size - offset > min_size and memview[offset] == memview[offset + min_size]:
+            byte = memview[offset]
+        if byte >= 0:
+            if byte not in runs:
+                run = find(bytes((byte,)) * max_size)
+                runs[byte] = (
+                    run,
+                    hf(bytes((byte,)) * run).hexdigest() if hf else "",
+                    chunk_sketch(bytes((byte,)) * run) if sketch else (),
+                )
+            run, run_hash, run_features = runs[byte]
+            if offset + run <= size and (
+                offset + run <= hole_end
+                or memview[offset : offset + run] == bytes((byte,)) * run
+            ):
+                if stats is not None:
+                    stats.bytes_runs += run
+                    stats.add_chunk(run, max_size, offset + run == size)
+                raw = bytes((byte,)) * run if fat else b""
+                yield Chunk(offset, run, raw, run_hash, run_features)
+                offset += run
+                continue
         blob = memview[offset : offset + read_size]
-        cp = cdc_offset(blob, min_size, max_size, cs, mask_s, mask_l)
-        raw = bytes(blob[:cp]) if fat else b""
-        h = hf(blob[:cp]).hexdigest() if hf else ""
-        yield Chunk(offset, cp, raw, h)
+        if stats is None:
+            cp = find(blob)
+            raw = bytes(blob[:cp]) if fat else b""
+            h = hf(blob[:cp]).hexdigest() if hf else ""
+            features = chunk_sketch(blob[:cp]) if sketch else ()
+        else:
+            start = perf_counter()
+            cp = find(blob)
+            scanned = perf_counter()
+            raw = bytes(blob[:cp]) if fat else b""
+            copied = perf_counter()
+            h = hf(blob[:cp]).hexdigest() if hf else ""
+            features = chunk_sketch(blob[:cp]) if sketch else ()
+            stats.time_hash += perf_counter() - copied
+            stats.time_io += copied - scanned
+            stats.time_scan += scanned - start
+            stats.add_chunk(cp, max_size, offset + cp == size)
+        yield Chunk(offset, cp, raw, h, features)
         offset += cp
 
 
@@ -89,17 +190,42 @@ def cdc_offset(data, mi, ma, cs, mask_s, mask_l):
     return i
 
 
+def chunk_sketch(data):
+    # type: (memoryview) -> tuple
+    """
+    Resemblance features of a chunk (see sketch.h).
+
+    :param data: Chunk data
+    :return: Largest gear hash in each of SKETCH_FEATURES equal sub-chunks
+    """
+    size = len(data)
+    features = []
+    h = 0
+    i = 0
+    for k in range(SKETCH_FEATURES):
+        end = size * (k + 1) // SKETCH_FEATURES
+        best = 0
+        while i < end:
+            h = ((h << 1) + GEAR[data[i]]) & 0xFFFFFFFF
+            if h > best:
+                best = h
+            i += 1
+        features.append(best)
+    return tuple(features)
+
+
 ########################################################################################
 # Utility functions and classes                                                        #
 ########################################################################################
 
 
 class Chunk:
-    def __init__(self, offset, length, data, hash):
+    def __init__(self, offset, length, data, hash, features=()):
         self.offset = offset
         self.length = length
         self.data = data
         self.hash = hash
+        self.features = features
 
     def __str__(self):
         return "hash={} offset={} size={}".format(self.hash, self.offset, self.length)
@@ -144,6 +270,8 @@ AVERAGE_MAX: int = 268_435_456
 MAXIMUM_MIN: int = 1024
 # Largest acceptable value for the maximum chunk size.
 MAXIMUM_MAX: int = 1_073_741_824
+# Number of resemblance features per chunk (sub-chunks of a chunk sketch).
+SKETCH_FEATURES: int = 12
 
 
 GEAR = [
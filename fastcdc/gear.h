@@ -0,0 +1,250 @@
+/*
+ * Gear hash boundary search for fastcdc_cy.
+ *
+ * The gear hash `p = (p >> 1) + GEAR[byte]` is a serial dependency chain, so a
+ * region is split into GEAR_LANES segments that are hashed side by side. Every
+ * lane except the first starts GEAR_WARMUP bytes ahead of its segment with a zero
+ * state. Because older bytes are shifted out of the 32-bit state, the speculative
+ * state almost always converges to the exact one during warmup. This is verified
+ * after each block by comparing a lane's start state with the exact end state of
+ * its predecessor. A lane that did not converge is recomputed sequentially, so the
+ * result always equals the sequential scan.
+ *
+ * The lanes are stepped with AVX2 gathers if the CPU supports it (selected at
+ * runtime). Other CPUs use the scalar loop: without a gather instruction (SSE4.1,
+ * NEON) the table lookups are serial loads and interleaving the chains in portable
+ * C was measured slower than the plain loop. The portable lane kernel can still be
+ * selected explicitly, e.g. to test the verification on any CPU.
+ */
+#ifndef FASTCDC_GEAR_H
+#define FASTCDC_GEAR_H
+
+#include <stddef.h>
+#include <stdint.h>
+#include <string.h>
+
+#if defined(__GNUC__) && (defined(__x86_64__) || defined(__i386__))
+#define GEAR_X86 1
+#include <immintrin.h>
+#endif
+
+#define GEAR_LANES 8
+/* Bytes hashed before a speculative lane reaches its segment (multiple of 4). */
+#define GEAR_WARMUP 48
+/* Smallest and largest segment per lane (multiples of 4). */
+#define GEAR_LANE_MIN 64
+#define GEAR_LANE_MAX 256
+/*
+ * Smallest mask for which lanes are used. With fewer mask bits a boundary is
+ * expected within a few hundred bytes and most of a lane block would be wasted.
+ */
+#define GEAR_LANE_MIN_MASK ((1u << 11) - 1)
+
+typedef void (*gear_kernel_t)(const uint8_t *, size_t, uint32_t, uint32_t,
+                              const uint32_t *, uint32_t *, uint32_t *, size_t *);
+
+/*
+ * Sequential scan of data[i:end] continuing from *state. Returns the position after
+ * the first byte where (state & mask) == 0, or 0 if there is none. *state holds the
+ * state after the last hashed byte.
+ */
+static size_t gear_scan_scalar(const uint8_t *data, size_t i, size_t end,
+                               uint32_t *state, uint32_t mask, const uint32_t *gear)
+{
+    uint32_t p = *state;
+    for (; i < end; i++) {
+        p = (p >> 1) + gear[data[i]];
+        if (!(p & mask)) {
+            *state = p;
+            return i + 1;
+        }
+    }
+    *state = p;
+    return 0;
+}
+
+/*
+ * Hash GEAR_LANES segments of length L starting at base. Lane 0 starts with the
+ * exact state p0, the others after warmup on the preceding bytes. Stores the lane
+ * states at segment start and end and the 1-based position of the first match per
+ * lane (0 if none). Returns early (without end states) if lane 0 has a match.
+ */
+static void gear_lanes_portable(const uint8_t *base, size_t L, uint32_t p0,
+                                uint32_t mask, const uint32_t *gear, uint32_t *start,
+                                uint32_t *end, size_t *hit)
+{
+    uint32_t p[GEAR_LANES];
+    size_t j, k;
+    for (k = 0; k < GEAR_LANES; k++) {
+        p[k] = 0;
+        hit[k] = 0;
+    }
+    for (j = 0; j < GEAR_WARMUP; j++)
+        for (k = 1; k < GEAR_LANES; k++)
+            p[k] = (p[k] >> 1) + gear[base[k * L + j - GEAR_WARMUP]];
+    p[0] = p0;
+    memcpy(start, p, sizeof(p));
+    for (j = 0; j < L; j++) {
+        uint32_t none = 1;
+        for (k = 0; k < GEAR_LANES; k++) {
+            p[k] = (p[k] >> 1) + gear[base[k * L + j]];
+            none &= (p[k] & mask) != 0;
+        }
+        if (!none) {
+            for (k = 0; k < GEAR_LANES; k++)
+                if (!(p[k] & mask) && !hit[k])
+                    hit[k] = j + 1;
+            if (hit[0])
+                return;
+        }
+    }
+    memcpy(end, p, sizeof(p));
+}
+
+#ifdef GEAR_X86
+/* Hash byte `shift / 8` of the gathered dwords in all lanes. */
+#define GEAR_AVX2_HASH(shift)                                                    \
+    idx = _mm256_and_si256(_mm256_srli_epi32(dw, shift), bytes);                 \
+    p = _mm256_add_epi32(_mm256_srli_epi32(p, 1),                                \
+                         _mm256_i32gather_epi32((const int *)gear, idx, 4));
+
+/* Hash and record first matches at 0-based lane position pos. */
+#define GEAR_AVX2_CHECK(shift, pos)                                              \
+    GEAR_AVX2_HASH(shift)                                                        \
+    bits = _mm256_movemask_ps(_mm256_castsi256_ps(                               \
+        _mm256_cmpeq_epi32(_mm256_and_si256(p, vmask), zero)));                  \
+    if (bits & ~found) {                                                         \
+        for (k = 0; k < GEAR_LANES; k++)                                         \
+            if ((bits & ~found) >> k & 1)                                        \
+                hit[k] = (pos) + 1;                                              \
+        found |= bits;                                                           \
+        if (found & 1)                                                           \
+            return;                                                              \
+    }
+
+/* AVX2 version of gear_lanes_portable. */
+__attribute__((target("avx2")))
+static void gear_lanes_avx2(const uint8_t *base, size_t L, uint32_t p0,
+                            uint32_t mask, const uint32_t *gear, uint32_t *start,
+                            uint32_t *end, size_t *hit)
+{
+    const int l = (int)L;
+    const __m256i offsets = _mm256_setr_epi32(0, l, 2 * l, 3 * l, 4 * l, 5 * l,
+                                              6 * l, 7 * l);
+    const __m256i bytes = _mm256_set1_epi32(0xFF);
+    const __m256i vmask = _mm256_set1_epi32((int)mask);
+    const __m256i zero = _mm256_setzero_si256();
+    __m256i p = zero, dw, idx;
+    size_t j, k;
+    int found = 0, bits;
+
+    for (k = 0; k < GEAR_LANES; k++)
+        hit[k] = 0;
+    for (j = 0; j < GEAR_WARMUP; j += 4) {
+        dw = _mm256_i32gather_epi32(
+            (const int *)(base + j - GEAR_WARMUP), offsets, 1);
+        GEAR_AVX2_HASH(0)
+        GEAR_AVX2_HASH(8)
+        GEAR_AVX2_HASH(16)
+        GEAR_AVX2_HASH(24)
+    }
+    p = _mm256_blend_epi32(p, _mm256_set1_epi32((int)p0), 1);
+    _mm256_storeu_si256((__m256i *)start, p);
+    for (j = 0; j < L; j += 4) {
+        dw = _mm256_i32gather_epi32((const int *)(base + j), offsets, 1);
+        GEAR_AVX2_CHECK(0, j)
+        GEAR_AVX2_CHECK(8, j + 1)
+        GEAR_AVX2_CHECK(16, j + 2)
+        GEAR_AVX2_CHECK(24, j + 3)
+    }
+    _mm256_storeu_si256((__m256i *)end, p);
+}
+#endif
+
+static int gear_selected = 0;
+static gear_kernel_t gear_kernel = NULL;
+static const char *gear_kernel_name = "scalar";
+
+/*
+ * Select the kernel by name ("avx2", "portable", "scalar") or NULL for the best
+ * one. Returns -1 if the kernel is not supported by this CPU or build.
+ */
+static int gear_select(const char *name)
+{
+    gear_selected = 1;
+#ifdef GEAR_X86
+    __builtin_cpu_init();
+    if ((name == NULL || strcmp(name, "avx2") == 0) &&
+        __builtin_cpu_supports("avx2")) {
+        gear_kernel = gear_lanes_avx2;
+        gear_kernel_name = "avx2";
+        return 0;
+    }
+#endif
+    if (name != NULL && strcmp(name, "portable") == 0) {
+        gear_kernel = gear_lanes_portable;
+        gear_kernel_name = "portable";
+        return 0;
+    }
+    if (name == NULL || strcmp(name, "scalar") == 0) {
+        gear_kernel = NULL;
+        gear_kernel_name = "scalar";
+        return 0;
+    }
+    return -1;
+}
+
+/* Name of the kernel in use. */
+static const char *gear_isa(void)
+{
+    if (!gear_selected)
+        gear_select(NULL);
+    return gear_kernel_name;
+}
+
+/*
+ * Scan data[i:end] continuing from *state, same contract as gear_scan_scalar.
+ * Bytes before i are read for warmup, so data[i - GEAR_WARMUP:i] must be valid
+ * when the region is long enough to be split into lanes.
+ */
+static size_t gear_scan(const uint8_t *data, size_t i, size_t end, uint32_t *state,
+                        uint32_t mask, const uint32_t *gear)
+{
+    uint32_t start[GEAR_LANES], stop[GEAR_LANES], p, q;
+    size_t hit[GEAR_LANES], L, k, segment, cut;
+
+    if (!gear_selected)
+        gear_select(NULL);
+    if (gear_kernel == NULL || mask < GEAR_LANE_MIN_MASK)
+        return gear_scan_scalar(data, i, end, state, mask, gear);
+    while (i >= GEAR_WARMUP && end - i >= GEAR_LANES * GEAR_LANE_MIN) {
+        L = (end - i) / GEAR_LANES;
+        if (L > GEAR_LANE_MAX)
+            L = GEAR_LANE_MAX;
+        L &= ~(size_t)3;
+        gear_kernel(data + i, L, *state, mask, gear, start, stop, hit);
+        p = *state;
+        for (k = 0; k < GEAR_LANES; k++) {
+            segment = i + k * L;
+            if (k > 0 && start[k] != p) {
+                /* Speculative state did not converge, recompute the segment. */
+                q = p;
+                cut = gear_scan_scalar(data, segment, segment + L, &q, mask, gear);
+                if (cut) {
+                    *state = q;
+                    return cut;
+                }
+                p = q;
+                continue;
+            }
+            if (hit[k])
+                return segment + hit[k];
+            p = stop[k];
+        }
+        *state = p;
+        i += GEAR_LANES * L;
+    }
+    return gear_scan_scalar(data, i, end, state, mask, gear);
+}
+
+#endif
@@ -0,0 +1,182 @@
+# -*- coding: utf-8 -*-
+"""
+Find near-duplicate files from MinHash signatures of their chunk digests.
+
+The Jaccard similarity of the chunk sets of two files is the share of their
+distinct chunks that they have in common. A signature keeps the smallest chunk
+digest in each of SIGNATURE_SIZE bins of the digest space (one permutation
+hashing, digests are already uniformly distributed), so the share of equal bins
+of two signatures estimates their similarity. LSH banding puts files whose
+signatures agree in all bins of a band into the same bucket, so candidate pairs
+are found in near-linear time and then verified with the whole signature.
+"""
+
+from typing import Dict, Iterable, Iterator, List, Tuple
+
+try:
+    from fastcdc.fastcdc_cy import Chunk
+except ImportError:
+    from fastcdc.fastcdc_py import Chunk
+
+
+# Number of bins of a signature.
+SIGNATURE_SIZE = 128
+# Minimum probability that a pair at the threshold shares a band.
+RECALL = 0.95
+# Value of a bin without chunks (larger than any 64-bit digest).
+EMPTY = 1 << 64
+# Hex digits of a digest used as its 64-bit value, shorter digests are rejected.
+DIGEST_CHARS = 16
+
+
+def lsh_params(threshold, size=SIGNATURE_SIZE):
+    # type: (float, int) -> Tuple[int, int]
+    """
+    Rows per band and number of bands for a similarity threshold.
+
+    Uses the most rows per band (fewest false candidates) for which a pair with
+    `threshold` similarity still shares at least one band with probability
+    RECALL.
+    """
+    for rows in range(size, 0, -1):
+        bands = size // rows
+        if 1 - (1 - threshold**rows) ** bands >= RECALL:
+            return rows, bands
+    return 1, size
+
+
+def signature(digests, size=SIGNATURE_SIZE):
+    # type: (Iterable[str], int) -> Tuple[int, ...]
+    """MinHash signature of hex digests (empty bins are filled from the next bin)."""
+    bins = [EMPTY] * size
+    for digest in digests:
+        if len(digest) < DIGEST_CHARS:
+            raise ValueError("MinHash signatures require digests of 64 bits or more")
+        value = int(digest[:DIGEST_CHARS], 16)
+        # Bins split the 64-bit range evenly for any size.
+        index = value * size >> 64
+        if value < bins[index]:
+            bins[index] = value
+    return densify(bins)
+
+
+def densify(bins):
+    # type: (List[int]) -> Tuple[int, ...]
+    """Fill empty bins with the value of the next non-empty bin and its distance."""
+    size = len(bins)
+    if all(value == EMPTY for value in bins):
+        return tuple(bins)
+    result = list(bins)
+    for index, value in enumerate(bins):
+        if value == EMPTY:
+            distance = 1
+            while bins[(index + distance) % size] == EMPTY:
+                distance += 1
+            result[index] = bins[(index + distance) % size] + distance * EMPTY
+    return tuple(result)
+
+
+def similarity(a, b):
+    # type: (Tuple[int, ...], Tuple[int, ...]) -> float
+    """Estimated Jaccard similarity of two signatures."""
+    return sum(x == y for x, y in zip(a, b)) / len(a)
+
+
+class MinHashIndex:
+    """
+    Collect file signatures and cluster near-duplicate files.
+
+    Wrap the chunks of each file with `feed()`. Files that were found to be
+    identical without chunking them can be added with `add_copy()`.
+
+    :param threshold: Minimum estimated Jaccard similarity of near-duplicates
+    :param size: Number of bins of a signature
+    """
+
+    def __init__(self, threshold=0.5, size=SIGNATURE_SIZE):
+        # type: (float, int) -> None
+        self.threshold = threshold
+        self.size = size
+        self.rows, self.bands = lsh_params(threshold, size)
+        self.names = []  # type: List[str]
+        self.sizes = []  # type: List[int]
+        self.signatures = []  # type: List[Tuple[int, ...]]
+        self.ids = {}  # type: Dict[str, int]
+
+    def feed(self, name, chunks):
+        # type: (str, Iterable[Chunk]) -> Iterator[Chunk]
+        """Yield the chunks and add the signature of `name` once all are read."""
+        size = self.size
+        bins = [EMPTY] * size
+        total = 0
+        for chunk in chunks:
+            if len(chunk.hash) < DIGEST_CHARS:
+                raise ValueError(
+                    "Near-duplicate detection requires hashes of 64 bits or more"
+                )
+            value = int(chunk.hash[:DIGEST_CHARS], 16)
+            index = value * size >> 64
+            if value < bins[index]:
+                bins[index] = value
+            total += chunk.length
+            yield chunk
+        if total:
+            self.add(name, total, densify(bins))
+
+    def add(self, name, size, sig):
+        # type: (str, int, Tuple[int, ...]) -> None
+        self.ids[name] = len(self.names)
+        self.names.append(name)
+        self.sizes.append(size)
+        self.signatures.append(sig)
+
+    def add_copy(self, name, original):
+        # type: (str, str) -> None
+        """Add `name` as an identical copy of the already added file `original`."""
+        index = self.ids.get(original)
+        if index is not None:
+            self.add(name, self.sizes[index], self.signatures[index])
+
+    def clusters(self):
+        # type: () -> List[Tuple[List[str], int, float]]
+        """
+        Groups of near-duplicate files, the largest first.
+
+        Only the first file of an LSH bucket is compared with the others, so
+        the cost stays linear even if many files fall into one bucket.
+
+        :return: List of (names, total size, mean similarity to the first file)
+        """
+        parent = list(range(len(self.names)))
+
+        def find(i):
+            while parent[i] != i:
+                parent[i] = parent[parent[i]]
+                i = parent[i]
+            return i
+
+        signatures = self.signatures
+        for band in range(self.bands):
+            start = band * self.rows
+            buckets = {}  # type: Dict[Tuple[int, ...], int]
+            for i, sig in enumerate(signatures):
+                key = sig[start : start + self.rows]
+                first = buckets.setdefault(key, i)
+                if first != i and find(first) != find(i):
+                    if similarity(signatures[first], sig) >= self.threshold:
+                        parent[find(i)] = find(first)
+        groups = {}  # type: Dict[int, List[int]]
+        for i in range(len(self.names)):
+            groups.setdefault(find(i), []).append(i)
+        result = []
+        for members in groups.values():
+            if len(members) < 2:
+                continue
+            first = signatures[members[0]]
+            mean = sum(similarity(first, signatures[i]) for i in members[1:]) / (
+                len(members) - 1
+            )
+            total = sum(self.sizes[i] for i in members)
+            result.append(([self.names[i] for i in members], total, mean))
+        result.sort(key=lambda cluster: cluster[1], reverse=True)
+        return result
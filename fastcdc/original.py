@@ -18,6 +18,11 @@ from fastcdc.const import (
 )
 from fastcdc.utils import center_size, logarithm2, mask
 
+try:
+    from fastcdc.fastcdc_cy import cut as cut_native
+except ImportError:
+    cut_native = None
+
 
 @dataclass
 class Chunk:
@@ -58,10 +63,24 @@ class FastCDC:
             source.seek(0)
         if isinstance(source, Text):
             infile = os.open(source, os.O_RDONLY)
-            source = mmap(infile, 0, access=ACCESS_READ)
+            try:
+                source = mmap(infile, 0, access=ACCESS_READ)
+            finally:
+                os.close(infile)
         return cls(source, 0, len(source), min_size, avg_size, max_size, mask_s, mask_l)
 
     def cut(self, source_offset: int, source_size: int) -> int:
+        if cut_native is not None:
+            return cut_native(
+                self.source,
+                source_offset,
+                source_size,
+                self.min_size,
+                self.avg_size,
+                self.max_size,
+                self.mask_s,
+                self.mask_l,
+            )
         if source_size <= self.min_size:
             return source_size
         else:
@@ -0,0 +1,188 @@
+# -*- coding: utf-8 -*-
+"""
+Partial scan results that can be merged across shards of a scan.
+
+A partial file starts with MAGIC, the header length (uint32) and a JSON header
+with the chunking parameters and totals of the shard. It is followed by fixed-width
+records sorted by digest, each with the raw digest, the chunk size (uint32) and
+the number of occurrences (uint64).
+"""
+
+import heapq
+import json
+import struct
+from typing import Dict, Iterable, Iterator, List, Tuple
+
+
+MAGIC = b"FCDCPART"
+VERSION = 1
+RECORD = struct.Struct("<IQ")
+HEADER_LENGTH = struct.Struct("<I")
+# Number of records read or written per I/O call.
+RECORDS_PER_BLOCK = 4096
+# Header fields that must be equal to merge partials.
+PARAMETERS = (
+    "hash_function",
+    "digest_size",
+    "engine",
+    "min_size",
+    "avg_size",
+    "max_size",
+)
+
+
+def write_partial(path, header, fingerprints):
+    # type: (str, dict, Dict[bytes, List[int]]) -> None
+    """
+    Write a partial file.
+
+    :param path: Output file
+    :param header: Chunking parameters and shard totals (see `read_header`)
+    :param fingerprints: Mapping of hex digest to [size, count]
+    """
+    # Lowercase hex digests sort in the same order as the raw digests.
+    records = (
+        (bytes.fromhex(digest), *fingerprints[digest])
+        for digest in sorted(fingerprints)
+    )
+    with open(path, "wb") as outfile:
+        write_header(outfile, header)
+        write_records(outfile, records)
+
+
+def write_header(outfile, header):
+    # type: (object, dict) -> None
+    """Write MAGIC and the JSON header."""
+    header = dict(header, version=VERSION)
+    data = json.dumps(header, sort_keys=True).encode("utf-8")
+    outfile.write(MAGIC + HEADER_LENGTH.pack(len(data)) + data)
+
+
+def write_records(outfile, records):
+    # type: (object, Iterable[Tuple[bytes, int, int]]) -> int
+    """Write (digest, size, count) records in blocks and return their number."""
+    block = []
+    written = 0
+    for digest, size, count in records:
+        block.append(digest + RECORD.pack(size, count))
+        if len(block) >= RECORDS_PER_BLOCK:
+            outfile.write(b"".join(block))
+            written += len(block)
+            block = []
+    outfile.write(b"".join(block))
+    return written + len(block)
+
+
+def read_header(infile):
+    # type: (object) -> dict
+    """
+    Read the header of a partial file opened in binary mode.
+
+    Besides the PARAMETERS the header holds `files` (number of scanned files) and
+    `extra_dupe` (bytes of whole files that were counted as duplicates without
+    chunking).
+    """
+    if infile.read(len(MAGIC)) != MAGIC:
+        raise ValueError("Not a fastcdc partial file: {}".format(infile.name))
+    (length,) = HEADER_LENGTH.unpack(infile.read(HEADER_LENGTH.size))
+    header = json.loads(infile.read(length).decode("utf-8"))
+    if header.get("version") != VERSION:
+        raise ValueError("Unsupported partial file version: {}".format(infile.name))
+    return header
+
+
+def read_records(infile, digest_size):
+    # type: (object, int) -> Iterator[Tuple[bytes, int, int]]
+    """Yield (digest, size, count) records from the current position of infile."""
+    width = digest_size + RECORD.size
+    while True:
+        block = infile.read(width * RECORDS_PER_BLOCK)
+        if not block:
+            return
+        for start in range(0, len(block), width):
+            size, count = RECORD.unpack_from(block, start + digest_size)
+            yield block[start : start + digest_size], size, count
+
+
+def merge_records(streams):
+    # type: (List[Iterator[Tuple[bytes, int, int]]]) -> Iterator[Tuple[bytes, int, int]]
+    """K-way merge sorted record streams and sum the counts of equal digests."""
+    current = None
+    for digest, size, count in heapq.merge(*streams, key=lambda record: record[0]):
+        if current is not None and current[0] == digest:
+            current[2] += count
+            continue
+        if current is not None:
+            yield tuple(current)
+        current = [digest, size, count]
+    if current is not None:
+        yield tuple(current)
+
+
+class MergeResult:
+    """Global totals of merged partial files."""
+
+    def __init__(self):
+        self.partials = 0
+        self.files = 0
+        self.unique_chunks = 0
+        self.unique_bytes = 0
+        self.bytes_total = 0
+        self.extra_dupe = 0
+
+    @property
+    def bytes_dupe(self):
+        # type: () -> int
+        """Bytes that are duplicates of other data in any of the partials."""
+        return self.bytes_total - self.unique_bytes
+
+
+def merge_partials(paths, output=None):
+    # type: (List[str], str|None) -> MergeResult
+    """
+    Merge partial files with bounded memory and compute the global totals.
+
+    :param paths: Partial files to merge
+    :param output: Optional path to write the merged partial file
+    :return: MergeResult with the global totals
+    """
+    result = MergeResult()
+    files = [open(path, "rb") for path in paths]
+    try:
+        headers = [read_header(infile) for infile in files]
+        for header, path in zip(headers[1:], paths[1:]):
+            for key in PARAMETERS:
+                if header[key] != headers[0][key]:
+                    raise ValueError(
+                        "{} of {} differs: {} != {}".format(
+                            key, path, header[key], headers[0][key]
+                        )
+                    )
+        result.partials = len(files)
+        result.files = sum(header["files"] for header in headers)
+        result.extra_dupe = sum(header["extra_dupe"] for header in headers)
+        result.bytes_total = result.extra_dupe
+        digest_size = headers[0]["digest_size"] if headers else 0
+        streams = [read_records(infile, digest_size) for infile in files]
+
+        def count(records):
+            for digest, size, occurrences in records:
+                result.unique_chunks += 1
+                result.unique_bytes += size
+                result.bytes_total += size * occurrences
+                yield digest, size, occurrences
+
+        records = count(merge_records(streams))
+        if output is None:
+            for _ in records:
+                pass
+        else:
+            header = {key: headers[0][key] for key in PARAMETERS}
+            header.update(files=result.files, extra_dupe=result.extra_dupe)
+            with open(output, "wb") as outfile:
+                write_header(outfile, header)
+                write_records(outfile, records)
+    finally:
+        for infile in files:
+            infile.close()
+    return result
@@ -0,0 +1,209 @@
+# -*- coding: utf-8 -*-
+import multiprocessing
+import os
+from array import array
+from typing import Iterable, Iterator, Optional, Tuple
+import fastcdc
+from fastcdc.engines import ENGINES
+from fastcdc.utils import hash_constructor
+
+try:
+    from multiprocessing import resource_tracker
+    from multiprocessing.shared_memory import SharedMemory
+except ImportError:
+    # Shared memory is available from Python 3.8.
+    SharedMemory = None
+
+# On Windows a segment is freed when its last handle closes, which can happen
+# before the parent attaches, so results are pickled there instead.
+SHARED_RESULTS = SharedMemory is not None and os.name != "nt"
+
+# Chunking parameters of a worker process, set by `init_worker`.
+worker_params = {}
+
+
+def init_worker(params):
+    # type: (dict) -> None
+    """Store the chunking parameters in a new worker process."""
+    worker_params.update(params)
+
+
+def chunk_file(path):
+    # type: (str) -> Tuple[str, Optional[str], int, Optional[str]]
+    """
+    Chunk the file at `path` in a worker and write the results to shared memory.
+
+    The segment holds `count` offsets (uint64), followed by `count` lengths (uint64)
+    and `count` raw digests of `digest_size` bytes. The parent takes ownership of
+    the segment and unlinks it.
+
+    Without shared memory the results are returned as bytes in the same layout.
+
+    :return: Tuple of path, segment name or bytes (None if there are no chunks),
+        number of chunks and an error message (None on success)
+    """
+    p = worker_params
+    offsets, lengths, digests = array("Q"), array("Q"), bytearray()
+    try:
+        for chunk in fastcdc.fastcdc(
+            path,
+            p["min_size"],
+            p["avg_size"],
+            p["max_size"],
+            hf=p["hf"],
+            engine=p["engine"],
+        ):
+            offsets.append(chunk.offset)
+            lengths.append(chunk.length)
+            digests += bytes.fromhex(chunk.hash)
+    except Exception as e:
+        return path, None, 0, repr(e)
+    count = len(offsets)
+    if not count:
+        return path, None, 0, None
+    if not p["shared"]:
+        return path, offsets.tobytes() + lengths.tobytes() + bytes(digests), count, None
+    shm = SharedMemory(create=True, size=count * (16 + p["digest_size"]))
+    shm.buf[: count * 8] = offsets.tobytes()
+    shm.buf[count * 8 : count * 16] = lengths.tobytes()
+    shm.buf[count * 16 : count * 16 + len(digests)] = digests
+    name = shm.name
+    shm.close()
+    return path, name, count, None
+
+
+class ChunkResult:
+    """
+    Chunks of a single file in a shared memory segment written by a worker.
+
+    `offsets` and `lengths` are memoryviews of unsigned 64-bit integers and
+    `digests` is a memoryview of all raw digests back to back. They are views
+    into the shared memory and are valid until `close()` is called. Use the
+    instance as a context manager or call `close()` to release the segment.
+
+    :param path: Path of the chunked file
+    :param name: Name of the shared memory segment, or the results as bytes
+        (None if there are no chunks)
+    :param count: Number of chunks
+    :param digest_size: Size of a raw digest in bytes
+    :param error: Error message if the file could not be chunked
+    """
+
+    def __init__(self, path, name, count, digest_size, error=None):
+        self.path = path
+        self.count = count
+        self.digest_size = digest_size
+        self.error = error
+        self.shm = SharedMemory(name=name) if isinstance(name, str) else None
+        if not name:
+            self.offsets = memoryview(b"").cast("Q")
+            self.lengths = memoryview(b"").cast("Q")
+            self.digests = memoryview(b"")
+        else:
+            buf = self.shm.buf if self.shm is not None else memoryview(name)
+            self.offsets = buf[: count * 8].cast("Q")
+            self.lengths = buf[count * 8 : count * 16].cast("Q")
+            self.digests = buf[count * 16 : count * (16 + digest_size)]
+
+    def __len__(self):
+        return self.count
+
+    def digest(self, index):
+        # type: (int) -> bytes
+        """Raw digest of the chunk at `index`."""
+        start = index * self.digest_size
+        return bytes(self.digests[start : start + self.digest_size])
+
+    def __iter__(self):
+        # type: () -> Iterator[Tuple[int, int, bytes]]
+        """Yield (offset, length, digest) per chunk (copies the digests)."""
+        for index in range(self.count):
+            yield self.offsets[index], self.lengths[index], self.digest(index)
+
+    def close(self):
+        # type: () -> None
+        """Release the views and unlink the shared memory segment."""
+        self.offsets.release()
+        self.lengths.release()
+        self.digests.release()
+        if self.shm is not None:
+            self.shm.close()
+            self.shm.unlink()
+            self.shm = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+class ChunkPool:
+    """
+    Chunk files in a pool of warm worker processes.
+
+    Workers chunk whole files with the fastest available implementation and
+    write offsets, lengths and raw digests into shared memory. Only the path,
+    the segment name and the number of chunks are pickled, so the parent reads
+    the results without deserializing chunk objects. On Windows and Python 3.7
+    the same arrays are pickled as bytes instead.
+
+    :param processes: Number of worker processes (default: number of CPUs)
+    :param min_size: Minimum chunk size (default: avg_size // 4)
+    :param avg_size: Average chunk size (default: 8192)
+    :param max_size: Maximum chunk size (default: avg_size * 8)
+    :param hf: Name of a supported hash function (default: "sha256")
+    :param engine: Chunking algorithm, one of ENGINES (default: "fastcdc")
+    """
+
+    def __init__(
+        self,
+        processes=None,
+        min_size=None,
+        avg_size=8192,
+        max_size=None,
+        hf="sha256",
+        engine="fastcdc",
+    ):
+        if engine not in ENGINES:
+            raise ValueError("Unsupported engine: {}".format(engine))
+        self.digest_size = hash_constructor(hf)().digest_size
+        params = dict(
+            min_size=avg_size // 4 if min_size is None else min_size,
+            avg_size=avg_size,
+            max_size=avg_size * 8 if max_size is None else max_size,
+            hf=hf,
+            engine=engine,
+            digest_size=self.digest_size,
+            shared=SHARED_RESULTS,
+        )
+        if SHARED_RESULTS:
+            # Workers must share the resource tracker of the parent, which
+            # unlinks the segments they create.
+            resource_tracker.ensure_running()
+        self.pool = multiprocessing.Pool(processes, init_worker, (params,))
+
+    def imap(self, paths, chunksize=1):
+        # type: (Iterable[str], int) -> Iterator[ChunkResult]
+        """Yield a ChunkResult per path in the order of `paths`."""
+        for path, name, count, error in self.pool.imap(chunk_file, paths, chunksize):
+            yield ChunkResult(path, name, count, self.digest_size, error)
+
+    def imap_unordered(self, paths, chunksize=1):
+        # type: (Iterable[str], int) -> Iterator[ChunkResult]
+        """Yield a ChunkResult per path as soon as a worker has finished it."""
+        results = self.pool.imap_unordered(chunk_file, paths, chunksize)
+        for path, name, count, error in results:
+            yield ChunkResult(path, name, count, self.digest_size, error)
+
+    def close(self):
+        # type: () -> None
+        """Stop the worker processes."""
+        self.pool.close()
+        self.pool.join()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
@@ -0,0 +1,143 @@
+# -*- coding: utf-8 -*-
+from typing import Callable, Iterator, Optional
+from fastcdc.engines import ENGINES
+from fastcdc.utils import get_memoryview, hash_constructor, Data
+
+try:
+    from fastcdc.fastcdc_cy import chunk_generator, Chunk
+except ImportError:
+    from fastcdc.fastcdc_py import chunk_generator, Chunk
+
+
+# Default maximum number of successors remembered by a Predictor.
+MAX_ENTRIES = 1 << 22
+
+
+class Predictor:
+    """
+    Remember the chunk that followed each chunk (RapidCDC).
+
+    Maps the digest of a chunk to the length and digest of the chunk that came
+    after it the last time. Pass the same instance to `chunk_predicted` for
+    all files of a backup so that predictions carry over between files. The
+    oldest entries are dropped beyond `max_entries`.
+
+    :param max_entries: Maximum number of remembered successors
+    """
+
+    def __init__(self, max_entries=MAX_ENTRIES):
+        self.max_entries = max_entries
+        self.successors = {}
+        self.hits = 0
+        self.misses = 0
+
+    def add(self, digest, length, successor):
+        # type: (str, int, str) -> None
+        """Record that the chunk `digest` was followed by `successor`."""
+        successors = self.successors
+        successors[digest] = (length, successor)
+        if len(successors) > self.max_entries:
+            del successors[next(iter(successors))]
+
+    @property
+    def hit_rate(self):
+        # type: () -> float
+        """Share of predictions that were confirmed."""
+        tried = self.hits + self.misses
+        return self.hits / tried if tried else 0.0
+
+
+def chunk_predicted(
+    data,
+    min_size=None,
+    avg_size=8192,
+    max_size=None,
+    fat=False,
+    hf="sha256",
+    stats=None,
+    engine="fastcdc",
+    predictor=None,
+):
+    # type: (Data, int|None, int, int|None, bool, Callable|str, Stats|None, str, Predictor|None) -> Iterator[Chunk]
+    """
+    Chunk data and skip the boundary search where the next chunk is predicted.
+
+    After a chunk whose successor is known, the bytes at the predicted length
+    are hashed first. If the digest matches the recorded successor the bytes
+    are identical, so the cut point is too and the chunk is emitted without
+    scanning it. Otherwise the data is scanned as usual until the next chunk
+    with a known successor. The result is identical to `fastcdc()`.
+
+    :param data: Input data to be chunked
+    :param min_size: Minimum chunk size (default: avg_size // 4)
+    :param avg_size: Average chunk size (default: 8192)
+    :param max_size: Maximum chunk size (default: avg_size * 8)
+    :param fat: If True, include chunk data in output
+    :param hf: Hash function or name of a supported hash function (default: "sha256")
+    :param stats: Stats instance to collect counters (default: None)
+    :param engine: Chunking algorithm, one of ENGINES (default: "fastcdc")
+    :param predictor: Predictor with the successors of earlier chunks, shared
+        between calls (default: a new Predictor for this data only)
+    :return: Generator yielding Chunk objects
+    """
+    if min_size is None:
+        min_size = avg_size // 4
+    if max_size is None:
+        max_size = avg_size * 8
+    if engine not in ENGINES:
+        raise ValueError("Unsupported engine: {}".format(engine))
+    if not hf:
+        raise ValueError("Predicting chunks requires a hash function")
+    if predictor is None:
+        predictor = Predictor()
+    mview = get_memoryview(data)
+    hasher = hash_constructor(hf) if isinstance(hf, str) else hf
+    chunks = generate(
+        mview, predictor, min_size, avg_size, max_size, fat, hf, hasher, engine
+    )
+    if stats is None:
+        return chunks
+    stats.files += 1
+    return counted(chunks, stats, max_size, len(mview))
+
+
+def generate(mview, predictor, min_size, avg_size, max_size, fat, hf, hasher, engine):
+    # type: (memoryview, Predictor, int, int, int, bool, Callable|str, Callable, str) -> Iterator[Chunk]
+    successors = predictor.successors
+    size = len(mview)
+    offset = 0
+    previous = None  # type: Optional[str]
+    while offset < size:
+        if previous in successors:
+            length, h = successors[previous]
+            if offset + length <= size:
+                blob = mview[offset : offset + length]
+                if hasher(blob).hexdigest() == h:
+                    predictor.hits += 1
+                    yield Chunk(offset, length, bytes(blob) if fat else b"", h)
+                    previous = h
+                    offset += length
+                    continue
+            predictor.misses += 1
+        chunks = chunk_generator(
+            mview[offset:], min_size, avg_size, max_size, fat, hf, None, engine
+        )
+        start = offset
+        for chunk in chunks:
+            offset = start + chunk.offset
+            yield Chunk(offset, chunk.length, chunk.data, chunk.hash)
+            offset += chunk.length
+            if previous is not None and (offset < size or chunk.length == max_size):
+                # A chunk cut by the end of the data may be longer elsewhere.
+                predictor.add(previous, chunk.length, chunk.hash)
+            previous = chunk.hash
+            if previous in successors:
+                break
+
+
+def counted(chunks, stats, max_size, size):
+    # type: (Iterator[Chunk], Stats, int, int) -> Iterator[Chunk]
+    """Record the chunks in stats (without timings)."""
+    for chunk in chunks:
+        stats.add_chunk(chunk.length, max_size, chunk.offset + chunk.length == size)
+        yield chunk
@@ -0,0 +1,153 @@
+# -*- coding: utf-8 -*-
+import heapq
+import json
+import os
+import threading
+from contextlib import contextmanager
+from time import perf_counter, process_time
+from humanize import intcomma, naturalsize
+
+
+class Profiler:
+    """
+    Record wall and CPU time per phase and per file.
+
+    Phases are timed with the `phase()` context manager or added from external
+    measurements (e.g. a `Stats` instance) with `add()`. Files are timed with the
+    `file()` context manager, the slowest of them are kept for the report. If
+    `trace` is True all timed sections are also recorded as Chrome trace events
+    that can be written with `write_trace()` and opened in chrome://tracing or
+    https://ui.perfetto.dev.
+
+    :param slowest: Number of slowest files to keep (default: 10)
+    :param trace: If True record a timeline of trace events (default: False)
+    """
+
+    def __init__(self, slowest=10, trace=False):
+        self.slowest = slowest
+        self.trace = trace
+        self.phases = {}
+        self.files = []
+        self.events = []
+        self.origin = perf_counter()
+
+    def add(self, name, wall, cpu=None, count=1):
+        # type: (str, float, float|None, int) -> None
+        """
+        Add an externally measured duration to a phase.
+
+        :param name: Name of the phase
+        :param wall: Wall clock time in seconds
+        :param cpu: CPU time in seconds (None if unknown)
+        :param count: Number of measurements covered by the duration
+        """
+        record = self.phases.setdefault(name, [0.0, 0.0, 0])
+        record[0] += wall
+        if cpu is None or record[1] is None:
+            record[1] = None
+        else:
+            record[1] += cpu
+        record[2] += count
+
+    @contextmanager
+    def phase(self, name, **args):
+        """Time the enclosed block as phase `name` (args are stored in the trace)."""
+        wall, cpu = perf_counter(), process_time()
+        try:
+            yield
+        finally:
+            wall_end, cpu_end = perf_counter(), process_time()
+            self.add(name, wall_end - wall, cpu_end - cpu)
+            if self.trace:
+                self.event(name, wall, wall_end, args)
+
+    @contextmanager
+    def file(self, path, size):
+        """Time processing of a single file with `size` bytes at `path`."""
+        wall, cpu = perf_counter(), process_time()
+        try:
+            yield
+        finally:
+            wall_end, cpu_end = perf_counter(), process_time()
+            self.add("file", wall_end - wall, cpu_end - cpu)
+            record = (wall_end - wall, cpu_end - cpu, size, str(path))
+            if len(self.files) < self.slowest:
+                heapq.heappush(self.files, record)
+            else:
+                heapq.heappushpop(self.files, record)
+            if self.trace:
+                self.event("file", wall, wall_end, dict(path=str(path), size=size))
+
+    def iterate(self, iterable, name):
+        """Yield from `iterable` timing each wait for the next item as phase `name`."""
+        iterator = iter(iterable)
+        while True:
+            with self.phase(name):
+                item = next(iterator, StopIteration)
+            if item is StopIteration:
+                return
+            yield item
+
+    def event(self, name, start, end, args):
+        # type: (str, float, float, dict) -> None
+        """Append a complete trace event for a section timed with perf_counter."""
+        self.events.append(
+            dict(
+                name=name,
+                ph="X",
+                ts=(start - self.origin) * 1e6,
+                dur=(end - start) * 1e6,
+                pid=os.getpid(),
+                tid=threading.get_ident(),
+                args=args,
+            )
+        )
+
+    def as_dict(self):
+        # type: () -> dict
+        """Export phase totals and the slowest files as a dict."""
+        return dict(
+            phases={
+                name: dict(wall=wall, cpu=cpu, count=count)
+                for name, (wall, cpu, count) in self.phases.items()
+            },
+            slowest=[
+                dict(path=path, size=size, wall=wall, cpu=cpu)
+                for wall, cpu, size, path in sorted(self.files, reverse=True)
+            ],
+        )
+
+    def write_trace(self, path):
+        # type: (str) -> None
+        """Write recorded events as Chrome trace JSON to `path`."""
+        with open(path, "w") as outfile:
+            json.dump(dict(traceEvents=self.events, displayTimeUnit="ms"), outfile)
+
+    def report(self):
+        # type: () -> str
+        """Printable multi-line report of phases and slowest files."""
+        lines = ["{:<16} {:>10} {:>10} {:>10}".format("Phase", "Wall", "CPU", "Count")]
+        for name, (wall, cpu, count) in self.phases.items():
+            lines.append(
+                "{:<16} {:>9.3f}s {:>10} {:>10}".format(
+                    name,
+                    wall,
+                    "-" if cpu is None else "{:.3f}s".format(cpu),
+                    intcomma(count),
+                )
+            )
+        if self.files:
+            lines.append("Slowest Files:")
+            for wall, cpu, size, path in sorted(self.files, reverse=True):
+                lines.append(
+                    "  {:>8.3f}s {:>10} {:>12}/s  {}".format(
+                        wall,
+                        naturalsize(size),
+                        naturalsize(size / wall if wall else 0),
+                        path,
+                    )
+                )
+        return "\n".join(lines)
+
+    def __str__(self):
+        return self.report()
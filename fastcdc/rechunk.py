@@ -0,0 +1,153 @@
+# -*- coding: utf-8 -*-
+from bisect import bisect_right
+from typing import Callable, Dict, Iterator, Optional, Sequence, Tuple
+from fastcdc.engines import ENGINES
+from fastcdc.utils import get_memoryview, hash_constructor, Data
+
+try:
+    from fastcdc.fastcdc_cy import chunk_generator, Chunk
+except ImportError:
+    from fastcdc.fastcdc_py import chunk_generator, Chunk
+
+
+def rechunk(
+    data,
+    previous,
+    dirty=None,
+    min_size=None,
+    avg_size=8192,
+    max_size=None,
+    fat=False,
+    hf=None,
+    engine="fastcdc",
+):
+    # type: (Data, Sequence, Optional[Sequence[Tuple[int, int]]], int|None, int, int|None, bool, Callable|str|None, str) -> Iterator[Chunk]
+    """
+    Chunk edited data reusing the chunks of a previous run.
+
+    The cut point of a chunk only depends on the bytes from its start up to the cut.
+    A previous chunk whose bytes are unchanged at its new position is therefore
+    reused without scanning. Only from the end of a changed chunk the data is
+    scanned again, until a cut lands on the start of a reusable chunk. The result
+    is identical to chunking the new data with the same parameters.
+
+    Changes are taken from `dirty` ranges of in-place modifications (the data may
+    also have grown or shrunk at the end). Without `dirty` they are detected by
+    hashing the bytes of each previous chunk with `hf` and comparing the digest
+    with its `hash`. This also finds chunks that moved by the size difference
+    after a single insertion or deletion. Hashes of reused chunks are taken from
+    the previous chunks, so they must have been computed with the same `hf`.
+
+    :param data: Edited input data
+    :param previous: Chunks of the previous run (objects with offset, length and
+        hash or tuples of offset, length and optionally hash)
+    :param dirty: Changed (offset, length) ranges or None to detect them via hashes
+    :param min_size: Minimum chunk size (default: avg_size // 4)
+    :param avg_size: Average chunk size (default: 8192)
+    :param max_size: Maximum chunk size (default: avg_size * 8)
+    :param fat: If True, include chunk data in output
+    :param hf: Hash function or name of a supported hash function (default: None)
+    :param engine: Chunking algorithm, one of ENGINES (default: "fastcdc")
+    :return: Generator yielding Chunk objects
+    """
+    if min_size is None:
+        min_size = avg_size // 4
+    if max_size is None:
+        max_size = avg_size * 8
+    if engine not in ENGINES:
+        raise ValueError("Unsupported engine: {}".format(engine))
+    previous = [as_tuple(chunk) for chunk in previous]
+    if dirty is None and (hf is None or any(h is None for _, _, h in previous)):
+        raise ValueError("Detecting changes requires hf and previous hashes")
+    mview = get_memoryview(data)
+    hasher = hash_constructor(hf) if isinstance(hf, str) else hf
+    if dirty is None:
+        reusable = reusable_by_hash(mview, previous, max_size, hasher)
+    else:
+        reusable = reusable_by_ranges(len(mview), previous, dirty, max_size)
+    return generate(mview, reusable, min_size, avg_size, max_size, fat, hf, engine)
+
+
+def generate(mview, reusable, min_size, avg_size, max_size, fat, hf, engine):
+    # type: (memoryview, Dict[int, Tuple[int, str]], int, int, int, bool, Callable|str|None, str) -> Iterator[Chunk]
+    """Yield reusable chunks and rescan the gaps between them."""
+    hasher = hash_constructor(hf) if isinstance(hf, str) else hf
+    size = len(mview)
+    offset = 0
+    while offset < size:
+        if offset in reusable:
+            length, h = reusable[offset]
+            blob = mview[offset : offset + length]
+            if hf and not h:
+                h = hasher(blob).hexdigest()
+            yield Chunk(offset, length, bytes(blob) if fat else b"", h if hf else "")
+            offset += length
+            continue
+        chunks = chunk_generator(
+            mview[offset:], min_size, avg_size, max_size, fat, hf, None, engine
+        )
+        start = offset
+        for chunk in chunks:
+            offset = start + chunk.offset
+            yield Chunk(offset, chunk.length, chunk.data, chunk.hash)
+            offset += chunk.length
+            if offset in reusable:
+                break
+
+
+def as_tuple(chunk):
+    # type: (object) -> Tuple[int, int, Optional[str]]
+    """Offset, length and hash (None if unknown) of a previous chunk."""
+    if isinstance(chunk, (tuple, list)):
+        return chunk[0], chunk[1], chunk[2] if len(chunk) > 2 else None
+    return chunk.offset, chunk.length, getattr(chunk, "hash", None) or None
+
+
+def reusable_by_ranges(size, previous, dirty, max_size):
+    # type: (int, list, Sequence[Tuple[int, int]], int) -> Dict[int, Tuple[int, str]]
+    """Previous chunks that do not overlap a dirty range, keyed by offset."""
+    ranges = sorted((offset, offset + length) for offset, length in dirty if length)
+    starts = [start for start, _ in ranges]
+    ends = []
+    for _, end in ranges:
+        ends.append(max(end, ends[-1]) if ends else end)
+    old_size = max((o + length for o, length, _ in previous), default=0)
+    reusable = {}
+    for offset, length, h in previous:
+        end = offset + length
+        # Last dirty range starting before the end of the chunk.
+        index = bisect_right(starts, end - 1) - 1
+        if index >= 0 and ends[index] > offset:
+            continue
+        if fits(offset, length, end == old_size, size, max_size):
+            reusable[offset] = (length, h)
+    return reusable
+
+
+def reusable_by_hash(mview, previous, max_size, hasher):
+    # type: (memoryview, list, int, Callable) -> Dict[int, Tuple[int, str]]
+    """Previous chunks found unchanged at the same or shifted offset by hash."""
+    size = len(mview)
+    old_size = max((o + length for o, length, _ in previous), default=0)
+    delta = size - old_size
+    reusable = {}
+    for offset, length, h in previous:
+        last = offset + length == old_size
+        for start in (offset, offset + delta) if delta else (offset,):
+            if start < 0 or not fits(start, length, last, size, max_size):
+                continue
+            if hasher(mview[start : start + length]).hexdigest() == h:
+                reusable[start] = (length, h)
+                break
+    return reusable
+
+
+def fits(start, length, last, size, max_size):
+    # type: (int, int, bool, int, int) -> bool
+    """Check if a chunk with unchanged bytes at start is cut at the same length."""
+    if start + length > size:
+        return False
+    if last and length < max_size:
+        # The chunk may have been cut by the end of the data.
+        return start + length == size
+    return True
@@ -0,0 +1,92 @@
+# -*- coding: utf-8 -*-
+"""
+Find chunks that are similar to earlier chunks (candidates for delta encoding).
+
+Chunks that differ in a few bytes have different digests and do not dedupe. With
+`sketch=True` the chunker computes resemblance features of every chunk (the
+largest rolling hash in each of 12 equal sub-chunks, see sketch.h). Like Finesse,
+the features are grouped into 3 super-features: the sub-chunks are split into 4
+groups of 3 neighbours, each group is sorted and a super-feature combines the
+features of the same rank in all groups. Chunks that share a super-feature share
+4 features and are very likely similar.
+"""
+
+from typing import Dict, Iterator, Optional, Tuple
+
+try:
+    from fastcdc.fastcdc_cy import Chunk
+except ImportError:
+    from fastcdc.fastcdc_py import Chunk
+
+
+# Number of super-features per chunk.
+SUPER_FEATURES = 3
+# Default maximum number of chunks remembered by a SimilarityIndex.
+MAX_ENTRIES = 1 << 20
+
+
+def super_features(features):
+    # type: (Tuple[int, ...]) -> Iterator[int]
+    """Combine the 12 features of a chunk into SUPER_FEATURES super-features."""
+    groups = [
+        sorted(features[i : i + SUPER_FEATURES], reverse=True)
+        for i in range(0, len(features), SUPER_FEATURES)
+    ]
+    for rank in range(SUPER_FEATURES):
+        # Hashes of int tuples are not randomized, so they are stable across runs.
+        yield hash((rank,) + tuple(group[rank] for group in groups))
+
+
+class SimilarityIndex:
+    """
+    Local index of the super-features of earlier unique chunks.
+
+    Pass each new (not duplicate) chunk to `add()`. A chunk that shares a
+    super-feature with an earlier chunk is counted as similar, and the share of
+    their features that match estimates how much of it a delta against that base
+    chunk would save. The oldest entries are dropped beyond `max_entries`.
+
+    :param max_entries: Maximum number of remembered super-features
+    """
+
+    def __init__(self, max_entries=MAX_ENTRIES):
+        self.max_entries = max_entries
+        self.bases = {}  # type: Dict[int, Tuple[int, ...]]
+        self.similar_chunks = 0
+        self.similar_bytes = 0
+        self.bytes_saved = 0
+
+    def find(self, features):
+        # type: (Tuple[int, ...]) -> Optional[Tuple[int, ...]]
+        """Features of an earlier chunk similar to `features` or None."""
+        for sf in super_features(features):
+            base = self.bases.get(sf)
+            if base is not None:
+                return base
+        return None
+
+    def add(self, chunk):
+        # type: (Chunk) -> int
+        """
+        Look up a new chunk and remember it as base for later chunks.
+
+        :param chunk: Chunk with features (from a chunker called with sketch=True)
+        :return: Estimated bytes saved by delta encoding the chunk (0 if none)
+        """
+        features = chunk.features
+        if not features:
+            raise ValueError("Finding similar chunks requires chunk features")
+        base = self.find(features)
+        if base is not None:
+            shared = len(set(features).intersection(base))
+            saved = chunk.length * shared // len(features)
+            self.similar_chunks += 1
+            self.similar_bytes += chunk.length
+            self.bytes_saved += saved
+            return saved
+        bases = self.bases
+        for sf in super_features(features):
+            bases[sf] = features
+        while len(bases) > self.max_entries:
+            del bases[next(iter(bases))]
+        return 0
@@ -1,11 +1,30 @@
 # -*- coding: utf-8 -*-
-import hashlib
+import os
 from humanize import intcomma, naturalsize
 import click
 from codetiming import Timer
+from contextlib import nullcontext
+from functools import partial
 
 import fastcdc
-from fastcdc.utils import DefaultHelp, iter_files, supported_hashes
+from fastcdc.archive import chunk_archive, is_archive
+from fastcdc.compress import CompressionEstimator, supported_codecs
+from fastcdc.blockio import IO_MODES, chunk_file
+from fastcdc.engines import ENGINES
+from fastcdc.estimate import DedupeEstimator, MAX_SAMPLES, sample_file
+from fastcdc.minhash import MinHashIndex
+from fastcdc.partial import write_partial
+from fastcdc.predict import Predictor, chunk_predicted
+from fastcdc.profiler import Profiler
+from fastcdc.resemblance import SimilarityIndex
+from fastcdc.stats import Stats
+from fastcdc.superchunk import SuperChunkIndex
+from fastcdc.utils import DefaultHelp, hash_constructor, supported_hashes, walk_files
+from fastcdc.wholefile import WholeFileIndex
+
+
+# Number of files listed per near-duplicate cluster.
+CLUSTER_NAMES = 10
 
 
 @click.command(cls=DefaultHelp)
@@ -20,6 +39,44 @@ from fastcdc.utils import DefaultHelp, iter_files, supported_hashes
     help="Scan directory tree recursively.",
     is_flag=True,
 )
+@click.option(
+    "-i",
+    "--include",
+    multiple=True,
+    help="Only scan files matching this glob pattern (repeatable).",
+)
+@click.option(
+    "-e",
+    "--exclude",
+    multiple=True,
+    help="Skip files and directories matching this glob pattern (repeatable).",
+)
+@click.option(
+    "--min-file-size", type=click.INT, help="Skip files smaller than this (bytes)."
+)
+@click.option(
+    "--max-file-size", type=click.INT, help="Skip files larger than this (bytes)."
+)
+@click.option(
+    "-x",
+    "--one-file-system",
+    help="Do not descend into directories on other filesystems.",
+    is_flag=True,
+)
+@click.option(
+    "-H",
+    "--skip-hardlinks",
+    help="Scan hardlinked files only once.",
+    is_flag=True,
+)
+@click.option(
+    "-w",
+    "--walk-threads",
+    type=click.INT,
+    default=8,
+    help="Number of threads listing directories.",
+    show_default=True,
+)
 @click.option(
     "-s",
     "--size",
@@ -37,7 +94,158 @@ from fastcdc.utils import DefaultHelp, iter_files, supported_hashes
 @click.option(
     "-hf", "--hash-function", type=click.STRING, default="sha256", show_default=True
 )
-def scan(paths, recursive, size, min_size, max_size, hash_function):
+@click.option(
+    "--engine",
+    type=click.Choice(ENGINES),
+    default="fastcdc",
+    help="Chunking algorithm.",
+    show_default=True,
+)
+@click.option(
+    "--io",
+    "io_mode",
+    type=click.Choice(IO_MODES),
+    default="mmap",
+    help="Map files, or read them in blocks that are dropped from the page cache "
+    "(read) or bypass it with O_DIRECT (direct).",
+    show_default=True,
+)
+@click.option(
+    "--archives",
+    help="Chunk the members of tar, zip and gzip files as virtual files.",
+    is_flag=True,
+)
+@click.option(
+    "--archive-stream",
+    help="Chunk all members of an archive as one stream (implies --archives).",
+    is_flag=True,
+)
+@click.option(
+    "--predict",
+    help="Skip the boundary search where the chunk after a duplicate is known.",
+    is_flag=True,
+)
+@click.option(
+    "--superchunks",
+    type=click.IntRange(min=0),
+    default=0,
+    help="Also group this many chunks on average into content-defined "
+    "superchunks and report their dedupe (0: off).",
+    show_default=True,
+)
+@click.option(
+    "--similar",
+    help="Find unique chunks similar to earlier chunks and estimate the savings "
+    "of delta encoding them.",
+    is_flag=True,
+)
+@click.option(
+    "--near-dupes",
+    type=click.FloatRange(0, 1, min_open=True, max_open=True),
+    help="Report clusters of files whose chunks are at least this similar "
+    "(estimated Jaccard similarity).",
+)
+@click.option(
+    "--top-clusters",
+    type=click.INT,
+    default=10,
+    help="Number of near-duplicate clusters reported.",
+    show_default=True,
+)
+@click.option(
+    "--file-dedupe/--no-file-dedupe",
+    default=True,
+    help="Count identical files as duplicates without chunking them.",
+    show_default=True,
+)
+@click.option(
+    "--emit-partial",
+    type=click.Path(dir_okay=False, writable=True),
+    help="Write sorted fingerprints with sizes and counts for `scan-merge`.",
+)
+@click.option(
+    "--estimate",
+    help="Estimate dedupe from sampled fingerprints with bounded memory.",
+    is_flag=True,
+)
+@click.option(
+    "--max-samples",
+    type=click.INT,
+    default=MAX_SAMPLES,
+    help="Maximum number of sampled fingerprints kept by --estimate.",
+    show_default=True,
+)
+@click.option(
+    "--sample-files",
+    type=click.FloatRange(0, 1, min_open=True),
+    default=1.0,
+    help="Only scan this share of files, selected by path (implies --estimate).",
+    show_default=True,
+)
+@click.option(
+    "--compress",
+    type=click.Choice(supported_codecs()),
+    help="Measure the compressed size of the unique chunks with this codec.",
+)
+@click.option("--compress-level", type=click.INT, help="Compression level.")
+@click.option(
+    "--compress-sample",
+    type=click.FloatRange(0, 1, min_open=True),
+    default=1.0,
+    help="Only compress this share of the unique chunks.",
+    show_default=True,
+)
+@click.option(
+    "--stats",
+    "show_stats",
+    help="Report chunking counters, timings and size histogram.",
+    is_flag=True,
+)
+@click.option(
+    "--profile",
+    help="Report wall/CPU time per phase and the slowest files.",
+    is_flag=True,
+)
+@click.option(
+    "--profile-trace",
+    type=click.Path(dir_okay=False, writable=True),
+    help="Write a Chrome trace JSON timeline to this file (implies --profile).",
+)
+def scan(
+    paths,
+    recursive,
+    include,
+    exclude,
+    min_file_size,
+    max_file_size,
+    one_file_system,
+    skip_hardlinks,
+    walk_threads,
+    size,
+    min_size,
+    max_size,
+    hash_function,
+    engine,
+    io_mode,
+    archives,
+    archive_stream,
+    predict,
+    superchunks,
+    similar,
+    near_dupes,
+    top_clusters,
+    file_dedupe,
+    emit_partial,
+    estimate,
+    max_samples,
+    sample_files,
+    compress,
+    compress_level,
+    compress_sample,
+    show_stats,
+    profile,
+    profile_trace,
+):
     """Scan files in directories and report duplication."""
     if min_size is None:
         min_size = size // 4
@@ -46,7 +254,35 @@ def scan(paths, recursive, size, min_size, max_size, hash_function):
 
     bytes_total = 0
     bytes_dupe = 0
-    fingerprints = set()
+    bytes_sparse = 0
+    # With --emit-partial map each fingerprint to [size, count].
+    fingerprints = {} if emit_partial else set()
+    estimate = estimate or sample_files < 1
+    if estimate and emit_partial:
+        raise click.BadOptionUsage(
+            "estimate", "--estimate cannot be combined with --emit-partial"
+        )
+    if estimate and compress:
+        raise click.BadOptionUsage(
+            "compress", "--compress cannot be combined with --estimate"
+        )
+    if estimate and similar:
+        raise click.BadOptionUsage(
+            "similar", "--similar cannot be combined with --estimate"
+        )
+    estimator = DedupeEstimator(max_samples) if estimate else None
+    compression = None
+    if compress:
+        try:
+            compression = CompressionEstimator(
+                compress, compress_level, compress_sample
+            )
+        except ValueError as e:
+            raise click.BadParameter(str(e), param_hint="--compress-level")
+    profiler = None
+    if profile or profile_trace:
+        profiler = Profiler(trace=bool(profile_trace))
+    stats = Stats() if show_stats or profiler else None
     supported = supported_hashes()
     if hash_function not in supported:
         msg = "'{}' is not a supported hash.\nTry one of these:\n{}".format(
@@ -54,40 +290,315 @@ def scan(paths, recursive, size, min_size, max_size, hash_function):
         )
         raise click.BadOptionUsage("hf", msg)
 
-    hf = getattr(hashlib, hash_function)
-    files = []
-    for path in paths:
-        files += list(iter_files(path, recursive))
+    files = walk_files(
+        paths,
+        recursive,
+        include=include,
+        exclude=exclude,
+        min_size=min_file_size,
+        max_size=max_file_size,
+        one_filesystem=one_file_system,
+        skip_hardlinks=skip_hardlinks,
+        threads=walk_threads,
+    )
+    if profiler:
+        files = profiler.iterate(files, "walk")
+    file_index = (
+        WholeFileIndex(hash_constructor(hash_function)) if file_dedupe else None
+    )
+    predictor = None
+    if predict:
+        if io_mode != "mmap":
+            raise click.BadOptionUsage("predict", "--predict requires --io mmap")
+        if similar:
+            raise click.BadOptionUsage(
+                "similar", "--similar cannot be combined with --predict"
+            )
+        predictor = Predictor()
+        chunk_path = partial(chunk_predicted, predictor=predictor)
+    elif io_mode == "mmap":
+        chunk_path = fastcdc.fastcdc
+    else:
+        chunk_path = partial(chunk_file, direct=io_mode == "direct")
+    archives = archives or archive_stream
+    if superchunks in (1, 2):
+        raise click.BadOptionUsage(
+            "superchunks", "--superchunks must be 0 (off) or at least 3"
+        )
+    super_index = SuperChunkIndex(hash_function, superchunks) if superchunks else None
+    similarity = SimilarityIndex() if similar else None
+    if near_dupes and hash_constructor(hash_function)().digest_size < 8:
+        raise click.BadOptionUsage(
+            "near_dupes", "--near-dupes requires a hash function of 64 bits or more"
+        )
+    minhash = MinHashIndex(near_dupes) if near_dupes else None
+    num_files = 0
+    num_members = 0
+    skipped_files = 0
+    dupe_files = 0
+    extra_dupe = 0
     t = Timer("scan", logger=None)
     t.start()
-    with click.progressbar(files) as pgbar:
+    with click.progressbar(files, show_pos=True) as pgbar:
         for entry in pgbar:
-            try:
-                chunker = fastcdc.fastcdc(entry.path, min_size, size, max_size, hf=hf)
-            except Exception as e:
-                click.echo("\n for {}".format(entry.path))
-                click.echo(repr(e))
+            if sample_files < 1 and not sample_file(entry.path, sample_files):
+                skipped_files += 1
                 continue
-            for chunk in chunker:
-                bytes_total += chunk.length
-                if chunk.hash in fingerprints:
-                    bytes_dupe += chunk.length
-                fingerprints.add(chunk.hash)
+            num_files += 1
+            st = entry.stat()
+            file_size = st.st_size
+            # Holes of sparse files are not stored and chunked without reading.
+            blocks = getattr(st, "st_blocks", None)
+            if blocks is not None:
+                bytes_sparse += max(0, file_size - blocks * 512)
+            if profiler:
+                timed = profiler.file(entry.path, file_size)
+            else:
+                timed = nullcontext()
+            in_archive = archives and is_archive(entry.path)
+            # Members of archives are counted one by one, even in copies.
+            whole_file = file_index and not in_archive
+            # Unique chunks of files are read back only if they are compressed,
+            # archive members are streams and their chunks carry the data.
+            source = None
+            with timed:
+                try:
+                    # All chunks of an identical file are known already. The
+                    # superchunk totals of an old original may be forgotten,
+                    # then the copy is chunked.
+                    if (
+                        whole_file
+                        and file_index.is_duplicate(entry.path, file_size)
+                        and (
+                            not super_index
+                            or super_index.add_copy(entry.path, file_index.original)
+                        )
+                    ):
+                        dupe_files += 1
+                        bytes_total += file_size
+                        bytes_dupe += file_size
+                        extra_dupe += file_size
+                        if estimator:
+                            estimator.add_duplicate(file_size)
+                        if minhash:
+                            minhash.add_copy(entry.path, file_index.original)
+                        continue
+                    params = dict(
+                        fat=bool(compression) and in_archive,
+                        hf=hash_function,
+                        stats=stats,
+                        engine=engine,
+                    )
+                    if similar:
+                        params["sketch"] = True
+                    if in_archive:
+                        chunkers = chunk_archive(
+                            entry.path,
+                            min_size,
+                            size,
+                            max_size,
+                            reset=not archive_stream,
+                            **params,
+                        )
+                    else:
+                        if compression:
+                            source = os.open(
+                                entry.path, os.O_RDONLY | getattr(os, "O_BINARY", 0)
+                            )
+                        chunker = chunk_path(
+                            entry.path, min_size, size, max_size, **params
+                        )
+                        chunkers = [(entry.path, chunker)]
+                    for name, chunker in chunkers:
+                        if name != entry.path:
+                            num_members += 1
+                        if super_index:
+                            chunker = super_index.feed(chunker, name)
+                        if minhash:
+                            chunker = minhash.feed(name, chunker)
+                        if estimator:
+                            for chunk in chunker:
+                                estimator.add(chunk.hash, chunk.length)
+                            continue
+                        for chunk in chunker:
+                            bytes_total += chunk.length
+                            if chunk.hash in fingerprints:
+                                bytes_dupe += chunk.length
+                                if emit_partial:
+                                    fingerprints[chunk.hash][1] += 1
+                                continue
+                            if emit_partial:
+                                fingerprints[chunk.hash] = [chunk.length, 1]
+                            else:
+                                fingerprints.add(chunk.hash)
+                            if compression:
+                                if in_archive:
+                                    compression.add(chunk.hash, chunk.data)
+                                else:
+                                    compression.add_range(
+                                        chunk.hash, source, chunk.offset, chunk.length
+                                    )
+                            if similarity:
+                                similarity.add(chunk)
+                except Exception as e:
+                    click.echo("\n for {}".format(entry.path))
+                    click.echo(repr(e))
+                    continue
+                finally:
+                    if source is not None:
+                        os.close(source)
+                if whole_file:
+                    file_index.add(entry.path, file_size)
+    if compression:
+        compression.close()
     t.stop()
+    if profiler:
+        profiler.add(
+            "mmap" if io_mode == "mmap" else "read", stats.time_io, count=stats.files
+        )
+        profiler.add("boundary scan", stats.time_scan, count=stats.chunks)
+        profiler.add("hashing", stats.time_hash, count=stats.chunks)
+    if emit_partial:
+        header = dict(
+            hash_function=hash_function,
+            digest_size=hash_constructor(hash_function)().digest_size,
+            engine=engine,
+            min_size=min_size,
+            avg_size=size,
+            max_size=max_size,
+            files=num_files,
+            extra_dupe=extra_dupe,
+        )
+        write_partial(emit_partial, header, fingerprints)
+    if estimator:
+        bytes_total = estimator.bytes_total
+        ratio, low, high = estimator.dedupe_ratio()
+        bytes_dupe = round(ratio * bytes_total)
     if bytes_total:
         data_per_s = bytes_total / Timer.timers.mean("scan")
         dd_ratio = bytes_dupe / bytes_total * 100
-        click.echo("Files:          {}".format(intcomma(len(files))))
+        click.echo("Files:          {}".format(intcomma(num_files)))
+        if num_members:
+            click.echo("Archive Files:  {}".format(intcomma(num_members)))
+        if dupe_files:
+            click.echo("Dupe Files:     {}".format(intcomma(dupe_files)))
         click.echo(
             "Chunk Sizes:    min {} - avg {} - max {}".format(min_size, size, max_size)
         )
-        click.echo("Unique Chunks:  {}".format(intcomma(len(fingerprints))))
+        if estimator:
+            click.echo(
+                "Unique Chunks:  ~{} (+/- {:.1f} %)".format(
+                    intcomma(estimator.hll.count()), estimator.hll.error() * 100
+                )
+            )
+        else:
+            click.echo("Unique Chunks:  {}".format(intcomma(len(fingerprints))))
         click.echo("Total Data:     {}".format(naturalsize(bytes_total)))
         click.echo("Dupe Data:      {}".format(naturalsize(bytes_dupe)))
-        click.echo("DeDupe Ratio:   {:.2f} %".format(dd_ratio))
+        if bytes_sparse:
+            click.echo("Sparse Data:    {}".format(naturalsize(bytes_sparse)))
+        if estimator:
+            click.echo(
+                "DeDupe Ratio:   {:.2f} % (95% CI {:.2f} - {:.2f} %)".format(
+                    dd_ratio, low * 100, high * 100
+                )
+            )
+            click.echo(
+                "Sample Rate:    {:.4g} ({} fingerprints)".format(
+                    estimator.rate, intcomma(len(estimator.samples))
+                )
+            )
+            if skipped_files:
+                click.echo(
+                    "Sampled Files:  {} of {}".format(
+                        intcomma(num_files), intcomma(num_files + skipped_files)
+                    )
+                )
+        else:
+            click.echo("DeDupe Ratio:   {:.2f} %".format(dd_ratio))
+        if similarity:
+            click.echo(
+                "Similar Chunks: {} ({})".format(
+                    intcomma(similarity.similar_chunks),
+                    naturalsize(similarity.similar_bytes),
+                )
+            )
+            unique = bytes_total - bytes_dupe
+            click.echo(
+                "Delta Savings:  ~{} ({:.2f} % of unique data)".format(
+                    naturalsize(similarity.bytes_saved),
+                    similarity.bytes_saved / unique * 100 if unique else 0,
+                )
+            )
+        if super_index and super_index.superchunks:
+            click.echo(
+                "Superchunks:    {} unique of {} (avg {:.1f} chunks)".format(
+                    intcomma(len(super_index.fingerprints)),
+                    intcomma(super_index.superchunks),
+                    super_index.chunks / super_index.superchunks,
+                )
+            )
+            click.echo(
+                "Super DeDupe:   {:.2f} % ({} of {} chunks looked up)".format(
+                    super_index.dedupe_ratio * 100,
+                    intcomma(super_index.chunks_new),
+                    intcomma(super_index.chunks),
+                )
+            )
+        if compression:
+            stored = compression.compressed_bytes
+            click.echo(
+                "Compressed:     {} ({}, {:.2f} % of unique data)".format(
+                    naturalsize(stored), compress, compression.ratio * 100
+                )
+            )
+            if compress_sample < 1:
+                click.echo(
+                    "Sampled Chunks: {} ({})".format(
+                        intcomma(compression.sampled_chunks),
+                        naturalsize(compression.sampled_bytes),
+                    )
+                )
+            click.echo(
+                "Total Ratio:    {:.2f} : 1 ({:.2f} % space savings)".format(
+                    bytes_total / stored if stored else 0,
+                    (1 - stored / bytes_total) * 100,
+                )
+            )
+        if predictor:
+            click.echo(
+                "Predicted:      {} chunks ({:.2f} % hit rate)".format(
+                    intcomma(predictor.hits), predictor.hit_rate * 100
+                )
+            )
         click.echo("Throughput:     {}/s".format(naturalsize(data_per_s)))
+        if minhash:
+            clusters = minhash.clusters()
+            click.echo(
+                "Near-Dupes:     {} files in {} clusters ({:.0f} % similar)".format(
+                    intcomma(sum(len(names) for names, _, _ in clusters)),
+                    intcomma(len(clusters)),
+                    near_dupes * 100,
+                )
+            )
+            for names, cluster_size, mean in clusters[:top_clusters]:
+                click.echo(
+                    "  {} files, {}, ~{:.0f} % similar:".format(
+                        len(names), naturalsize(cluster_size), mean * 100
+                    )
+                )
+                for name in names[:CLUSTER_NAMES]:
+                    click.echo("    {}".format(name))
+                if len(names) > CLUSTER_NAMES:
+                    click.echo("    ... {} more".format(len(names) - CLUSTER_NAMES))
+        if show_stats:
+            click.echo(stats.report())
     else:
         click.echo("No data.")
+    if profiler:
+        click.echo(profiler.report())
+        if profile_trace:
+            profiler.write_trace(profile_trace)
 
 
 if __name__ == "__main__":
@@ -0,0 +1,42 @@
+# -*- coding: utf-8 -*-
+import click
+from codetiming import Timer
+from humanize import intcomma, naturalsize
+from fastcdc.partial import merge_partials
+from fastcdc.utils import DefaultHelp
+
+
+@click.command("scan-merge", cls=DefaultHelp)
+@click.argument(
+    "partials", type=click.Path(exists=True, dir_okay=False), nargs=-1, required=True
+)
+@click.option(
+    "-o",
+    "--output",
+    type=click.Path(dir_okay=False, writable=True),
+    help="Write the merged partial file (to merge in several stages).",
+)
+def scan_merge(partials, output):
+    """Merge partial results of `scan --emit-partial` and report duplication."""
+    t = Timer("scan-merge", logger=None)
+    t.start()
+    try:
+        result = merge_partials(list(partials), output)
+    except ValueError as e:
+        raise click.BadParameter(str(e), param_hint="PARTIALS")
+    t.stop()
+    if not result.bytes_total:
+        click.echo("No data.")
+        return
+    dd_ratio = result.bytes_dupe / result.bytes_total * 100
+    click.echo("Partials:       {}".format(intcomma(result.partials)))
+    click.echo("Files:          {}".format(intcomma(result.files)))
+    click.echo("Unique Chunks:  {}".format(intcomma(result.unique_chunks)))
+    click.echo("Total Data:     {}".format(naturalsize(result.bytes_total)))
+    click.echo("Dupe Data:      {}".format(naturalsize(result.bytes_dupe)))
+    click.echo("DeDupe Ratio:   {:.2f} %".format(dd_ratio))
+    click.echo("Merge Time:     {:.3f}s".format(Timer.timers.total("scan-merge")))
+
+
+if __name__ == "__main__":
+    scan_merge()
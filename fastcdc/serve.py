@@ -0,0 +1,454 @@
+# -*- coding: utf-8 -*-
+"""
+Chunking daemon on a Unix domain socket.
+
+A client sends any number of requests on one connection and reads one response
+per request. A request is REQUEST (opcode, params length, data length) followed
+by the UTF-8 JSON params and the raw data. A response is RESPONSE (status,
+meta length, body length) followed by the UTF-8 JSON meta and the raw body.
+On error the status is ERROR and the meta holds the "error" message.
+
+Chunk lists are sent as a columnar body with `count` offsets (uint64), `count`
+lengths (uint64) and `count` raw digests of `digest_size` bytes, the meta holds
+`count` and `digest_size`.
+
+Operations:
+
+- PING: Empty response, to check that the daemon is up.
+- CHUNK: Chunk the file at params "path" or the request data. Params may set
+  "min_size", "avg_size", "max_size", "hf" and "engine".
+- SCAN: Scan the files of params "paths" (optionally "recursive") on the warm
+  process pool and return the dedupe totals in the meta.
+- DIFF: Chunk the files at params "a" and "b", return the shared totals in the
+  meta and the chunks of "b" that are not in "a" as body.
+"""
+
+import json
+import os
+import signal
+import socket
+import socketserver
+import stat
+import struct
+import tempfile
+import threading
+from array import array
+from collections import OrderedDict
+from typing import Dict, List, Optional, Tuple
+import click
+
+import fastcdc
+from fastcdc.engines import ENGINES
+from fastcdc.pool import ChunkPool
+from fastcdc.utils import hash_constructor, walk_files
+
+try:
+    from fastcdc.fastcdc_cy import Chunk
+except ImportError:
+    from fastcdc.fastcdc_py import Chunk
+
+
+REQUEST = struct.Struct("<BII")
+RESPONSE = struct.Struct("<BII")
+PING, CHUNK, SCAN, DIFF = range(4)
+OK, ERROR = range(2)
+# Default number of chunked files kept in the cache of the daemon.
+CACHE_SIZE = 1024
+DEFAULTS = dict(min_size=None, avg_size=8192, max_size=None, hf="sha256")
+
+
+class ServeError(Exception):
+    """Error reported by the daemon."""
+
+
+def default_socket():
+    # type: () -> str
+    """Socket path in the runtime directory or a private temp directory of the user."""
+    runtime = os.environ.get("XDG_RUNTIME_DIR")
+    if runtime:
+        return os.path.join(runtime, "fastcdc.sock")
+    directory = "fastcdc-{}".format(os.getuid())
+    return os.path.join(tempfile.gettempdir(), directory, "fastcdc.sock")
+
+
+def private_directory(path):
+    # type: (str) -> None
+    """Create the directory of `path` for the user only or check that it is."""
+    directory = os.path.dirname(path)
+    try:
+        os.mkdir(directory, 0o700)
+    except FileExistsError:
+        pass
+    st = os.lstat(directory)
+    if not stat.S_ISDIR(st.st_mode) or st.st_uid != os.getuid() or st.st_mode & 0o077:
+        raise OSError("{} is not a private directory".format(directory))
+
+
+# Windows has no Unix sockets, there only the protocol and client are importable.
+UnixStreamServer = getattr(socketserver, "UnixStreamServer", socketserver.BaseServer)
+
+
+def chunk_params(params):
+    # type: (dict) -> Tuple[int, int, int, str, str]
+    """Chunking parameters of a request with defaults applied."""
+    avg_size = params.get("avg_size") or DEFAULTS["avg_size"]
+    min_size = params.get("min_size") or avg_size // 4
+    max_size = params.get("max_size") or avg_size * 8
+    hf = params.get("hf") or DEFAULTS["hf"]
+    engine = params.get("engine") or "fastcdc"
+    if engine not in ENGINES:
+        raise ValueError("Unsupported engine: {}".format(engine))
+    hash_constructor(hf)
+    return min_size, avg_size, max_size, hf, engine
+
+
+def encode_chunks(chunks, digest_size):
+    # type: (List, int) -> Tuple[dict, bytes]
+    """Columnar meta and body of (offset, length, hex digest) chunks."""
+    offsets = array("Q", (chunk[0] for chunk in chunks))
+    lengths = array("Q", (chunk[1] for chunk in chunks))
+    digests = b"".join(bytes.fromhex(chunk[2]) for chunk in chunks)
+    meta = dict(count=len(chunks), digest_size=digest_size)
+    return meta, offsets.tobytes() + lengths.tobytes() + digests
+
+
+def decode_chunks(meta, body):
+    # type: (dict, bytes) -> List[Chunk]
+    """Chunk objects (without data) of a columnar body."""
+    count, size = meta["count"], meta["digest_size"]
+    view = memoryview(body)
+    offsets = view[: count * 8].cast("Q")
+    lengths = view[count * 8 : count * 16].cast("Q")
+    start = count * 16
+    return [
+        Chunk(
+            offsets[i],
+            lengths[i],
+            b"",
+            body[start + i * size : start + (i + 1) * size].hex(),
+        )
+        for i in range(count)
+    ]
+
+
+class ChunkCache:
+    """
+    LRU cache of the chunks of files, keyed by path, chunking parameters and stat.
+
+    A file is chunked again if its size, mtime or inode changed.
+
+    :param size: Maximum number of cached files
+    """
+
+    def __init__(self, size=CACHE_SIZE):
+        self.size = size
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def chunks(self, path, params):
+        # type: (str, tuple) -> List[Tuple[int, int, str]]
+        """Chunks of the file at `path` as (offset, length, hex digest) tuples."""
+        st = os.stat(path)
+        key = (path, params, st.st_size, st.st_mtime_ns, st.st_ino)
+        with self.lock:
+            chunks = self.entries.get(key)
+            if chunks is not None:
+                self.entries.move_to_end(key)
+                self.hits += 1
+                return chunks
+            self.misses += 1
+        chunks = chunk_data(path, params) if st.st_size else []
+        if self.size:
+            with self.lock:
+                self.entries[key] = chunks
+                while len(self.entries) > self.size:
+                    self.entries.popitem(last=False)
+        return chunks
+
+
+def chunk_data(data, params):
+    # type: (object, tuple) -> List[Tuple[int, int, str]]
+    """Chunk a path or buffer with (min, avg, max, hf, engine) params."""
+    min_size, avg_size, max_size, hf, engine = params
+    return [
+        (chunk.offset, chunk.length, chunk.hash)
+        for chunk in fastcdc.fastcdc(
+            data, min_size, avg_size, max_size, hf=hf, engine=engine
+        )
+    ]
+
+
+class Daemon:
+    """
+    State shared by all connections: the chunk cache and warm process pools.
+
+    :param processes: Number of worker processes of a scan pool
+    :param cache_size: Maximum number of files in the chunk cache
+    """
+
+    def __init__(self, processes=None, cache_size=CACHE_SIZE):
+        self.processes = processes
+        self.cache = ChunkCache(cache_size)
+        self.pools = {}  # type: Dict[tuple, ChunkPool]
+        self.lock = threading.Lock()
+
+    def pool(self, params):
+        # type: (tuple) -> ChunkPool
+        """Warm process pool for the chunking parameters."""
+        with self.lock:
+            if params not in self.pools:
+                min_size, avg_size, max_size, hf, engine = params
+                self.pools[params] = ChunkPool(
+                    self.processes, min_size, avg_size, max_size, hf, engine
+                )
+            return self.pools[params]
+
+    def handle(self, opcode, params, data):
+        # type: (int, dict, bytes) -> Tuple[dict, bytes]
+        """Execute a request and return the response meta and body."""
+        if opcode == PING:
+            return dict(hits=self.cache.hits, misses=self.cache.misses), b""
+        cparams = chunk_params(params)
+        digest_size = hash_constructor(cparams[3])().digest_size
+        if opcode == CHUNK:
+            if params.get("path"):
+                chunks = self.cache.chunks(params["path"], cparams)
+            else:
+                chunks = chunk_data(data, cparams) if data else []
+            return encode_chunks(chunks, digest_size)
+        if opcode == SCAN:
+            return self.scan(params, cparams), b""
+        if opcode == DIFF:
+            old = self.cache.chunks(params["a"], cparams)
+            new = self.cache.chunks(params["b"], cparams)
+            known = {digest for _, _, digest in old}
+            added = [chunk for chunk in new if chunk[2] not in known]
+            meta, body = encode_chunks(added, digest_size)
+            meta.update(
+                chunks=len(new),
+                bytes_total=sum(chunk[1] for chunk in new),
+                bytes_new=sum(chunk[1] for chunk in added),
+            )
+            return meta, body
+        raise ValueError("Unknown opcode: {}".format(opcode))
+
+    def scan(self, params, cparams):
+        # type: (dict, tuple) -> dict
+        """Exact dedupe totals of the files of params "paths"."""
+        paths = [
+            entry.path
+            for entry in walk_files(params["paths"], params.get("recursive", False))
+        ]
+        fingerprints = set()
+        result = dict(files=0, chunks=0, bytes_total=0, bytes_dupe=0, errors=[])
+        for chunks in self.pool(cparams).imap_unordered(paths):
+            with chunks:
+                if chunks.error:
+                    result["errors"].append([chunks.path, chunks.error])
+                    continue
+                result["files"] += 1
+                result["chunks"] += len(chunks)
+                for index in range(len(chunks)):
+                    length = chunks.lengths[index]
+                    digest = chunks.digest(index)
+                    result["bytes_total"] += length
+                    if digest in fingerprints:
+                        result["bytes_dupe"] += length
+                    else:
+                        fingerprints.add(digest)
+        result["unique_chunks"] = len(fingerprints)
+        return result
+
+    def close(self):
+        # type: () -> None
+        """Stop the process pools."""
+        for pool in self.pools.values():
+            pool.close()
+        self.pools.clear()
+
+
+def read_exact(rfile, size):
+    # type: (object, int) -> Optional[bytes]
+    """Read `size` bytes or return None at the end of the stream."""
+    data = rfile.read(size)
+    if len(data) < size:
+        return None
+    return data
+
+
+class Handler(socketserver.StreamRequestHandler):
+    """Serve the requests of one connection until the client disconnects."""
+
+    def handle(self):
+        while True:
+            header = read_exact(self.rfile, REQUEST.size)
+            if header is None:
+                return
+            opcode, params_length, data_length = REQUEST.unpack(header)
+            params = read_exact(self.rfile, params_length)
+            data = read_exact(self.rfile, data_length)
+            if params is None or data is None:
+                return
+            try:
+                params = json.loads(params.decode("utf-8")) if params else {}
+                meta, body = self.server.daemon.handle(opcode, params, data)
+                status = OK
+            except Exception as e:
+                meta, body, status = dict(error=repr(e)), b"", ERROR
+            meta = json.dumps(meta).encode("utf-8")
+            header = RESPONSE.pack(status, len(meta), len(body))
+            try:
+                self.wfile.write(b"".join((header, meta, body)))
+                self.wfile.flush()
+            except (BrokenPipeError, ConnectionResetError):
+                # The client went away before reading the response.
+                return
+
+
+class Server(socketserver.ThreadingMixIn, UnixStreamServer):
+    """Threaded Unix socket server with a shared Daemon."""
+
+    daemon_threads = True
+
+    def __init__(self, path, daemon):
+        # type: (str, Daemon) -> None
+        if not hasattr(socket, "AF_UNIX"):
+            raise OSError("The daemon requires Unix domain sockets")
+        self.daemon = daemon
+        # Only the owner may let the daemon read files on its behalf. The socket
+        # is created without access for others, so there is no window to connect.
+        umask = os.umask(0o077)
+        try:
+            super(Server, self).__init__(path, Handler)
+        finally:
+            os.umask(umask)
+
+
+class Client:
+    """
+    Client of a chunking daemon.
+
+    :param path: Path of the Unix socket (default: `default_socket()`)
+    """
+
+    def __init__(self, path=None):
+        # type: (Optional[str]) -> None
+        path = path or default_socket()
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        self.sock.connect(path)
+        self.rfile = self.sock.makefile("rb")
+
+    def request(self, opcode, params=None, data=b""):
+        # type: (int, Optional[dict], bytes) -> Tuple[dict, bytes]
+        """Send a request and return the response meta and body."""
+        payload = json.dumps(params).encode("utf-8") if params else b""
+        self.sock.sendall(REQUEST.pack(opcode, len(payload), len(data)) + payload)
+        if data:
+            self.sock.sendall(data)
+        header = read_exact(self.rfile, RESPONSE.size)
+        if header is None:
+            raise ServeError("Connection closed by the daemon")
+        status, meta_length, body_length = RESPONSE.unpack(header)
+        meta = json.loads(self.rfile.read(meta_length).decode("utf-8"))
+        body = self.rfile.read(body_length)
+        if status != OK:
+            raise ServeError(meta.get("error"))
+        return meta, body
+
+    def ping(self):
+        # type: () -> dict
+        """Check the daemon and return its cache hits and misses."""
+        return self.request(PING)[0]
+
+    def chunk(self, path=None, data=b"", **params):
+        # type: (Optional[str], bytes, **object) -> List[Chunk]
+        """Chunk a file (by absolute path) or data. See `chunk_params` for params."""
+        if path is not None:
+            params["path"] = os.path.abspath(path)
+        return decode_chunks(*self.request(CHUNK, params, data))
+
+    def scan(self, paths, recursive=False, **params):
+        # type: (List[str], bool, **object) -> dict
+        """Dedupe totals of the files in directories `paths`."""
+        paths = [os.path.abspath(path) for path in paths]
+        return self.request(SCAN, dict(params, paths=paths, recursive=recursive))[0]
+
+    def diff(self, a, b, **params):
+        # type: (str, str, **object) -> Tuple[dict, List[Chunk]]
+        """Totals of file `b` against file `a` and the chunks of `b` not in `a`."""
+        params.update(a=os.path.abspath(a), b=os.path.abspath(b))
+        meta, body = self.request(DIFF, params)
+        return meta, decode_chunks(meta, body)
+
+    def close(self):
+        # type: () -> None
+        self.rfile.close()
+        self.sock.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+
+@click.command("serve")
+@click.option(
+    "--socket",
+    "path",
+    type=click.Path(dir_okay=False),
+    help="Path of the Unix socket (default: $XDG_RUNTIME_DIR/fastcdc.sock).",
+)
+@click.option(
+    "-p",
+    "--processes",
+    type=click.INT,
+    help="Worker processes per scan pool (default: number of CPUs).",
+)
+@click.option(
+    "--cache-size",
+    type=click.INT,
+    default=CACHE_SIZE,
+    help="Number of chunked files kept in memory.",
+    show_default=True,
+)
+def serve(path, processes, cache_size):
+    """Serve chunk, scan and diff requests on a Unix socket."""
+    if path is None:
+        path = default_socket()
+        try:
+            private_directory(path)
+        except OSError as e:
+            raise click.ClickException(str(e))
+    if os.path.exists(path):
+        if not stat.S_ISSOCK(os.stat(path).st_mode):
+            raise click.BadParameter("{} is not a socket".format(path))
+        try:
+            Client(path).close()
+        except OSError:
+            # Stale socket of a daemon that did not shut down cleanly.
+            os.unlink(path)
+        else:
+            raise click.ClickException("A daemon is listening on {}".format(path))
+    daemon = Daemon(processes, cache_size)
+    server = Server(path, daemon)
+    click.echo("Listening on {}".format(path))
+
+    def stop(signum, frame):
+        raise SystemExit(0)
+
+    signal.signal(signal.SIGTERM, stop)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        daemon.close()
+        os.unlink(path)
+
+
+if __name__ == "__main__":
+    serve()
@@ -0,0 +1,37 @@
+/*
+ * Resemblance sketches for fastcdc_cy.
+ *
+ * Finesse-style features: the chunk is split into SKETCH_FEATURES sub-chunks of
+ * equal size and the feature of each is the largest gear hash
+ * `h = (h << 1) + GEAR[byte]` (a rolling hash over the last 32 bytes) within it.
+ * Chunks that differ in a few bytes share most features. The features are
+ * grouped into super-features by `fastcdc.resemblance`. Must match
+ * `chunk_sketch` of fastcdc_py.
+ */
+#ifndef FASTCDC_SKETCH_H
+#define FASTCDC_SKETCH_H
+
+#include <stddef.h>
+#include <stdint.h>
+
+#define SKETCH_FEATURES 12
+
+static void chunk_sketch(
+    const uint8_t *data, size_t size, const uint32_t *gear, uint32_t *features)
+{
+    uint32_t hash = 0, best;
+    size_t i = 0, end;
+    int k;
+    for (k = 0; k < SKETCH_FEATURES; k++) {
+        end = size * (k + 1) / SKETCH_FEATURES;
+        best = 0;
+        for (; i < end; i++) {
+            hash = (hash << 1) + gear[data[i]];
+            if (hash > best)
+                best = hash;
+        }
+        features[k] = best;
+    }
+}
+
+#endif
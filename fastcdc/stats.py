@@ -0,0 +1,125 @@
+# -*- coding: utf-8 -*-
+import json
+from humanize import intcomma, naturalsize
+
+
+# Number of log2 size buckets (bucket k counts chunks of size 2**k to 2**(k+1)-1).
+BUCKETS = 32
+
+
+class Stats:
+    """
+    Counters collected while chunking.
+
+    Pass an instance as `stats` to `fastcdc()`, `chunk_generator()` or the `scan`
+    command to collect them. Chunks of exactly `max_size` are counted as max-size
+    cuts, a shorter chunk at the end of the data as an end-of-data cut and all
+    other chunks as content-defined cuts. Bytes in runs of a single byte value (or
+    in file holes) are chunked without a boundary scan and also counted in
+    `bytes_runs`. Timings are in seconds.
+    """
+
+    def __init__(self):
+        self.files = 0
+        self.bytes_scanned = 0
+        self.bytes_runs = 0
+        self.chunks = 0
+        self.cuts_content = 0
+        self.cuts_max_size = 0
+        self.cuts_eof = 0
+        self.time_io = 0.0
+        self.time_scan = 0.0
+        self.time_hash = 0.0
+        self.histogram = [0] * BUCKETS
+
+    def add_chunk(self, length, max_size, eof):
+        # type: (int, int, bool) -> None
+        """
+        Record a single chunk.
+
+        :param length: Size of the chunk in bytes
+        :param max_size: Maximum chunk size used by the chunker
+        :param eof: True if the chunk ends at the end of the data
+        """
+        self.chunks += 1
+        self.bytes_scanned += length
+        if length == max_size:
+            self.cuts_max_size += 1
+        elif eof:
+            self.cuts_eof += 1
+        else:
+            self.cuts_content += 1
+        self.histogram[length.bit_length() - 1] += 1
+
+    def merge(self, other):
+        # type: (Stats) -> Stats
+        """Add the counters of another Stats instance to this one."""
+        self.files += other.files
+        self.bytes_scanned += other.bytes_scanned
+        self.bytes_runs += other.bytes_runs
+        self.chunks += other.chunks
+        self.cuts_content += other.cuts_content
+        self.cuts_max_size += other.cuts_max_size
+        self.cuts_eof += other.cuts_eof
+        self.time_io += other.time_io
+        self.time_scan += other.time_scan
+        self.time_hash += other.time_hash
+        for bucket, count in enumerate(other.histogram):
+            self.histogram[bucket] += count
+        return self
+
+    def as_dict(self):
+        # type: () -> dict
+        """Export counters as a dict (histogram keyed by bucket lower bound)."""
+        return dict(
+            files=self.files,
+            bytes_scanned=self.bytes_scanned,
+            bytes_runs=self.bytes_runs,
+            chunks=self.chunks,
+            cuts_content=self.cuts_content,
+            cuts_max_size=self.cuts_max_size,
+            cuts_eof=self.cuts_eof,
+            time_io=self.time_io,
+            time_scan=self.time_scan,
+            time_hash=self.time_hash,
+            histogram={
+                2**bucket: count for bucket, count in enumerate(self.histogram) if count
+            },
+        )
+
+    def to_json(self, **kwargs):
+        # type: (...) -> str
+        """Export counters as a JSON string (kwargs are passed to json.dumps)."""
+        return json.dumps(self.as_dict(), **kwargs)
+
+    def report(self):
+        # type: () -> str
+        """Printable multi-line report of the counters."""
+        lines = [
+            "Chunks:         {}".format(intcomma(self.chunks)),
+            "Bytes Scanned:  {}".format(naturalsize(self.bytes_scanned)),
+            "Bytes in Runs:  {}".format(naturalsize(self.bytes_runs)),
+            "Cuts:           content {} - max-size {} - end {}".format(
+                intcomma(self.cuts_content),
+                intcomma(self.cuts_max_size),
+                intcomma(self.cuts_eof),
+            ),
+            "Time:           io {:.3f}s - scan {:.3f}s - hash {:.3f}s".format(
+                self.time_io, self.time_scan, self.time_hash
+            ),
+            "Size Histogram:",
+        ]
+        largest = max(self.histogram) or 1
+        for bucket, count in enumerate(self.histogram):
+            if count:
+                lines.append(
+                    "  {:>10} {:>12} {}".format(
+                        naturalsize(2**bucket, binary=True),
+                        intcomma(count),
+                        "#" * max(1, count * 40 // largest),
+                    )
+                )
+        return "\n".join(lines)
+
+    def __str__(self):
+        return self.report()
@@ -0,0 +1,183 @@
+# -*- coding: utf-8 -*-
+"""
+Group consecutive chunks into content-defined superchunks.
+
+A second level of content-defined chunking that works on the digests of the
+chunks instead of the data: a superchunk ends after a chunk whose digest matches
+a pattern. Because the boundaries only depend on the chunks, an edit changes the
+superchunk around it and leaves the others intact, like chunks around an edit
+in the data. An index of superchunk digests is `avg_count` times smaller than
+the chunk index and only the chunks of new superchunks need to be looked up.
+"""
+
+from collections import OrderedDict
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Set, Tuple
+from fastcdc.utils import hash_constructor
+
+try:
+    from fastcdc.fastcdc_cy import Chunk
+except ImportError:
+    from fastcdc.fastcdc_py import Chunk
+
+
+# Default average number of chunks per superchunk.
+AVG_COUNT = 64
+# Number of files whose totals SuperChunkIndex remembers for copies.
+MAX_FILES = 65536
+
+
+class SuperChunk:
+    """
+    A run of consecutive chunks.
+
+    The hash is computed over the digests of the chunks, so it identifies the
+    content of the superchunk without hashing the data again.
+    """
+
+    def __init__(self, offset, length, hash, chunks):
+        # type: (int, int, str, List[Chunk]) -> None
+        self.offset = offset
+        self.length = length
+        self.hash = hash
+        self.chunks = chunks
+
+    def __str__(self):
+        return "hash={} offset={} size={} chunks={}".format(
+            self.hash, self.offset, self.length, len(self.chunks)
+        )
+
+
+def superchunks(chunks, hf, avg_count=AVG_COUNT, min_count=None, max_count=None):
+    # type: (Iterable[Chunk], Callable|str, int, int|None, int|None) -> Iterator[SuperChunk]
+    """
+    Group chunks into superchunks with boundaries chosen from the chunk digests.
+
+    A superchunk ends after a chunk whose digest (read as a number from its last
+    8 hex digits) is divisible by `avg_count - min_count`, once it has at least
+    `min_count` chunks, or when it has `max_count` chunks.
+
+    :param chunks: Chunks with hashes, e.g. from `fastcdc()` or `chunk_generator()`
+    :param hf: Hash function or name of a supported hash function for superchunk
+        hashes (usually the one used for the chunks)
+    :param avg_count: Average number of chunks per superchunk (default: 64)
+    :param min_count: Minimum number of chunks (default: avg_count // 4, at least 1)
+    :param max_count: Maximum number of chunks (default: avg_count * 4)
+    :return: Generator yielding SuperChunk objects
+    """
+    if min_count is None:
+        min_count = max(1, avg_count // 4)
+    if max_count is None:
+        max_count = avg_count * 4
+    if not 1 <= min_count < avg_count <= max_count:
+        raise ValueError("Superchunk sizes must be 1 <= min < avg <= max")
+    if avg_count - min_count < 2:
+        # A divisor of 1 would end a superchunk after every chunk.
+        raise ValueError("Superchunk avg must exceed min by at least 2")
+    if isinstance(hf, str):
+        hf = hash_constructor(hf)
+    divisor = avg_count - min_count
+    group = []  # type: List[Chunk]
+    for chunk in chunks:
+        if not chunk.hash:
+            raise ValueError("Superchunks require chunk hashes")
+        group.append(chunk)
+        if len(group) >= max_count or (
+            len(group) >= min_count and int(chunk.hash[-8:], 16) % divisor == 0
+        ):
+            yield make_superchunk(group, hf)
+            group = []
+    if group:
+        yield make_superchunk(group, hf)
+
+
+def make_superchunk(group, hf):
+    # type: (List[Chunk], Callable) -> SuperChunk
+    hasher = hf()
+    for chunk in group:
+        hasher.update(chunk.hash.encode("ascii"))
+    length = group[-1].offset + group[-1].length - group[0].offset
+    return SuperChunk(group[0].offset, length, hasher.hexdigest(), group)
+
+
+class SuperChunkIndex:
+    """
+    Count duplicate superchunks while passing their chunks through.
+
+    Wrap a chunk iterator with `feed()` to track dedupe at the superchunk level
+    next to the dedupe of the chunks themselves.
+
+    :param hf: Hash function or name of a supported hash function
+    :param avg_count: Average number of chunks per superchunk
+    :param max_files: Number of files remembered for `add_copy()`
+    """
+
+    def __init__(self, hf, avg_count=AVG_COUNT, max_files=MAX_FILES):
+        # type: (Callable|str, int, int) -> None
+        self.hf = hash_constructor(hf) if isinstance(hf, str) else hf
+        self.avg_count = avg_count
+        self.fingerprints = set()  # type: Set[str]
+        self.superchunks = 0
+        self.chunks = 0
+        # Chunks of new superchunks, the only ones looked up in a chunk index.
+        self.chunks_new = 0
+        self.bytes_total = 0
+        self.bytes_dupe = 0
+        # Number of superchunks, chunks and bytes of recently named inputs.
+        self.files = OrderedDict()  # type: Dict[str, Tuple[int, int, int]]
+        self.max_files = max_files
+
+    def feed(self, chunks, name=None):
+        # type: (Iterable[Chunk], Optional[str]) -> Iterator[Chunk]
+        """
+        Yield the chunks, grouped into superchunks on the way.
+
+        :param chunks: Chunks of one file or stream
+        :param name: Remember the totals under this name for `add_copy()`
+        """
+        totals = [0, 0, 0]
+        for superchunk in superchunks(chunks, self.hf, self.avg_count):
+            self.superchunks += 1
+            self.chunks += len(superchunk.chunks)
+            self.bytes_total += superchunk.length
+            totals[0] += 1
+            totals[1] += len(superchunk.chunks)
+            totals[2] += superchunk.length
+            if superchunk.hash in self.fingerprints:
+                self.bytes_dupe += superchunk.length
+            else:
+                self.fingerprints.add(superchunk.hash)
+                self.chunks_new += len(superchunk.chunks)
+            yield from superchunk.chunks
+        if name is not None:
+            self.remember(name, tuple(totals))
+
+    def remember(self, name, totals):
+        # type: (str, Tuple[int, int, int]) -> None
+        self.files[name] = totals
+        self.files.move_to_end(name)
+        if len(self.files) > self.max_files:
+            self.files.popitem(last=False)
+
+    def add_copy(self, name, original):
+        # type: (str, str) -> bool
+        """
+        Add `name` as an identical copy of the already fed file `original`.
+
+        :return: False if `original` is no longer remembered and `name` must be
+            fed instead
+        """
+        totals = self.files.get(original)
+        if totals is None:
+            return False
+        self.remember(name, totals)
+        self.superchunks += totals[0]
+        self.chunks += totals[1]
+        self.bytes_total += totals[2]
+        self.bytes_dupe += totals[2]
+        return True
+
+    @property
+    def dedupe_ratio(self):
+        # type: () -> float
+        """Share of the data in duplicate superchunks."""
+        return self.bytes_dupe / self.bytes_total if self.bytes_total else 0.0
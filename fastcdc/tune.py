@@ -0,0 +1,287 @@
+# -*- coding: utf-8 -*-
+import mmap
+import time
+from concurrent.futures import ThreadPoolExecutor
+from itertools import product
+from typing import List, Sequence, Tuple
+import click
+from humanize import intcomma, naturalsize
+
+import fastcdc
+from fastcdc.const import (
+    AVERAGE_MAX,
+    AVERAGE_MIN,
+    MAXIMUM_MAX,
+    MAXIMUM_MIN,
+    MINIMUM_MAX,
+    MINIMUM_MIN,
+)
+from fastcdc.engines import ENGINES
+from fastcdc.estimate import sample_file
+from fastcdc.utils import DefaultHelp, hash_constructor, supported_hashes, walk_files
+
+
+# Bytes per unique chunk in an index besides the digest (offset and length).
+INDEX_ENTRY_OVERHEAD = 16
+
+
+class Config:
+    """
+    Chunking parameters and dedupe totals of one configuration of a sweep.
+
+    :param engine: Chunking algorithm, one of ENGINES
+    :param min_size: Minimum chunk size
+    :param avg_size: Average chunk size
+    :param max_size: Maximum chunk size
+    :param hf: Name of a supported hash function
+    """
+
+    def __init__(self, engine, min_size, avg_size, max_size, hf):
+        self.engine = engine
+        self.min_size = min_size
+        self.avg_size = avg_size
+        self.max_size = max_size
+        self.hf = hf
+        self.fingerprints = set()
+        self.chunks = 0
+        self.bytes_total = 0
+        self.bytes_dupe = 0
+        self.cpu_time = 0.0
+
+    def chunk(self, data):
+        # type: (mmap.mmap) -> None
+        """Chunk the data of one file and update the totals."""
+        start = time.thread_time()
+        fingerprints = self.fingerprints
+        for chunk in fastcdc.fastcdc(
+            data,
+            self.min_size,
+            self.avg_size,
+            self.max_size,
+            hf=self.hf,
+            engine=self.engine,
+        ):
+            self.chunks += 1
+            self.bytes_total += chunk.length
+            if chunk.hash in fingerprints:
+                self.bytes_dupe += chunk.length
+            else:
+                fingerprints.add(chunk.hash)
+        self.cpu_time += time.thread_time() - start
+
+    @property
+    def dedupe_ratio(self):
+        # type: () -> float
+        return self.bytes_dupe / self.bytes_total if self.bytes_total else 0.0
+
+    def index_size(self, digest_size):
+        # type: (int) -> int
+        """Bytes of an index with digest, offset and length per unique chunk."""
+        return len(self.fingerprints) * (digest_size + INDEX_ENTRY_OVERHEAD)
+
+
+def parse_config(value):
+    # type: (str) -> Tuple[int, int, int]
+    """Parse MIN:AVG:MAX chunk sizes (MIN and MAX may be empty for defaults)."""
+    try:
+        min_size, avg_size, max_size = value.split(":")
+        avg_size = int(avg_size)
+        min_size = int(min_size) if min_size else avg_size // 4
+        max_size = int(max_size) if max_size else avg_size * 8
+    except ValueError:
+        raise click.BadParameter("expected MIN:AVG:MAX, got {}".format(value))
+    check_config(min_size, avg_size, max_size, "--config")
+    return min_size, avg_size, max_size
+
+
+def check_config(min_size, avg_size, max_size, param_hint):
+    # type: (int, int, int, str) -> None
+    """Reject chunk sizes that `fastcdc()` does not accept before the sweep."""
+    for name, size, low, high in (
+        ("MIN", min_size, MINIMUM_MIN, MINIMUM_MAX),
+        ("AVG", avg_size, AVERAGE_MIN, AVERAGE_MAX),
+        ("MAX", max_size, MAXIMUM_MIN, MAXIMUM_MAX),
+    ):
+        if not low <= size <= high:
+            msg = "{} size {} is not between {} and {}".format(name, size, low, high)
+            raise click.BadParameter(msg, param_hint=param_hint)
+    if not min_size <= avg_size <= max_size:
+        msg = "expected MIN <= AVG <= MAX, got {}:{}:{}".format(
+            min_size, avg_size, max_size
+        )
+        raise click.BadParameter(msg, param_hint=param_hint)
+
+
+def sweep(files, configs, threads):
+    # type: (Sequence[str], List[Config], int) -> int
+    """
+    Chunk each file once with all configs in parallel and return the bytes read.
+
+    A file is mapped once and scanned by one thread per config while its pages
+    are in memory. The compiled version releases the GIL while searching cut
+    points and computing native digests, so configs run on several cores.
+    """
+    bytes_read = 0
+    with ThreadPoolExecutor(threads) as executor:
+        with click.progressbar(files, show_pos=True) as pgbar:
+            for path in pgbar:
+                try:
+                    with open(path, "rb") as infile:
+                        data = mmap.mmap(infile.fileno(), 0, access=mmap.ACCESS_READ)
+                except (OSError, ValueError) as e:
+                    click.echo("\n for {}".format(path))
+                    click.echo(repr(e))
+                    continue
+                try:
+                    jobs = [executor.submit(config.chunk, data) for config in configs]
+                    for job in jobs:
+                        job.result()
+                    bytes_read += len(data)
+                finally:
+                    data.close()
+    return bytes_read
+
+
+@click.command(cls=DefaultHelp)
+@click.argument(
+    "paths",
+    type=click.Path(exists=True, file_okay=False, resolve_path=True),
+    nargs=-1,
+)
+@click.option(
+    "-r",
+    "--recursive",
+    help="Scan directory tree recursively.",
+    is_flag=True,
+)
+@click.option(
+    "-i",
+    "--include",
+    multiple=True,
+    help="Only scan files matching this glob pattern (repeatable).",
+)
+@click.option(
+    "-e",
+    "--exclude",
+    multiple=True,
+    help="Skip files and directories matching this glob pattern (repeatable).",
+)
+@click.option(
+    "--sample-files",
+    type=click.FloatRange(0, 1, min_open=True),
+    default=1.0,
+    help="Only read this share of files, selected by path.",
+    show_default=True,
+)
+@click.option(
+    "-s",
+    "--size",
+    "sizes",
+    type=click.INT,
+    multiple=True,
+    help="Average chunk size to try with default min/max (repeatable).",
+)
+@click.option(
+    "-c",
+    "--config",
+    "configs",
+    multiple=True,
+    help="MIN:AVG:MAX chunk sizes to try (repeatable).",
+)
+@click.option(
+    "--engine",
+    "engines",
+    type=click.Choice(ENGINES),
+    multiple=True,
+    default=["fastcdc"],
+    help="Chunking algorithm to try (repeatable).",
+    show_default=True,
+)
+@click.option(
+    "-hf", "--hash-function", type=click.STRING, default="sha256", show_default=True
+)
+@click.option(
+    "-t",
+    "--threads",
+    type=click.INT,
+    help="Number of configurations chunked in parallel (default: all).",
+)
+def tune(
+    paths,
+    recursive,
+    include,
+    exclude,
+    sample_files,
+    sizes,
+    configs,
+    engines,
+    hash_function,
+    threads,
+):
+    """Compare chunking parameters on the same data in a single pass."""
+    supported = supported_hashes()
+    if hash_function not in supported:
+        msg = "'{}' is not a supported hash.\nTry one of these:\n{}".format(
+            hash_function, ", ".join(supported)
+        )
+        raise click.BadOptionUsage("hf", msg)
+    if not sizes and not configs:
+        sizes = (4096, 8192, 16384, 32768, 65536)
+    params = [(size // 4, size, size * 8) for size in sizes]
+    for config in params:
+        check_config(*config, param_hint="--size")
+    params += [parse_config(value) for value in configs]
+    sweeps = [
+        Config(engine, min_size, avg_size, max_size, hash_function)
+        for engine, (min_size, avg_size, max_size) in product(engines, params)
+    ]
+    files = [
+        entry.path
+        for entry in walk_files(paths, recursive, include=include, exclude=exclude)
+        if entry.stat().st_size and sample_file(entry.path, sample_files)
+    ]
+    files.sort()
+    start = time.perf_counter()
+    bytes_read = sweep(files, sweeps, threads or len(sweeps))
+    elapsed = time.perf_counter() - start
+    if not bytes_read:
+        click.echo("No data.")
+        return
+    digest_size = hash_constructor(hash_function)().digest_size
+    click.echo("Files:          {}".format(intcomma(len(files))))
+    click.echo("Data:           {}".format(naturalsize(bytes_read)))
+    click.echo("Sweep Time:     {:.2f} s".format(elapsed))
+    click.echo()
+    row = "{:<8} {:>7} {:>7} {:>8} {:>11} {:>11} {:>8} {:>10} {:>11}"
+    click.echo(
+        row.format(
+            "Engine",
+            "Min",
+            "Avg",
+            "Max",
+            "Chunks",
+            "Unique",
+            "DeDupe",
+            "Index",
+            "Throughput",
+        )
+    )
+    for config in sweeps:
+        throughput = config.bytes_total / config.cpu_time if config.cpu_time else 0
+        click.echo(
+            row.format(
+                config.engine,
+                config.min_size,
+                config.avg_size,
+                config.max_size,
+                intcomma(config.chunks),
+                intcomma(len(config.fingerprints)),
+                "{:.2f} %".format(config.dedupe_ratio * 100),
+                naturalsize(config.index_size(digest_size)),
+                "{}/s".format(naturalsize(throughput)),
+            )
+        )
+
+
+if __name__ == "__main__":
+    tune()
@@ -1,10 +1,15 @@
 # -*- coding: utf-8 -*-
 import math
 import mmap
+import os
+import queue
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from fnmatch import fnmatch
 from io import BufferedReader
 from os import scandir
 from pathlib import Path
-from typing import List
+from typing import Callable, Iterator, List, Optional, Sequence, Tuple
 import hashlib
 import click
 from typing import Union
@@ -57,9 +62,11 @@ def supported_hashes() -> List[str]:
     try:
         import xxhash
 
-        supported.extend(["xxh32", "xxh64"])
+        supported.extend(["xxh32", "xxh64", "xxh3_64", "xxh3_128"])
         hashlib.xxh32 = xxhash.xxh32
         hashlib.xxh64 = xxhash.xxh64
+        hashlib.xxh3_64 = xxhash.xxh3_64
+        hashlib.xxh3_128 = xxhash.xxh3_128
     except ImportError:
         pass
     try:
@@ -72,6 +79,17 @@ def supported_hashes() -> List[str]:
     return supported
 
 
+# Hashes that the cython version computes natively when passed by name as `hf`.
+NATIVE_HASHES = ("xxh3_64", "xxh3_128")
+
+
+def hash_constructor(name: str) -> Callable:
+    """Hash constructor for a name returned by `supported_hashes()`."""
+    if name not in supported_hashes():
+        raise ValueError("Unsupported hash function: {}".format(name))
+    return getattr(hashlib, name)
+
+
 def iter_files(path, recursive=False):
     try:
         if recursive:
@@ -88,6 +106,162 @@ def iter_files(path, recursive=False):
         click.echo("\nPermissionError for {}".format(path))
 
 
+# Maximum number of file batches buffered ahead of the consumer of `walk_files`.
+WALK_QUEUE_SIZE = 1024
+# Maximum number of files passed from a directory scanning thread in one batch.
+WALK_BATCH_SIZE = 1024
+
+
+def walk_files(
+    paths: Sequence[str],
+    recursive: bool = False,
+    include: Sequence[str] = (),
+    exclude: Sequence[str] = (),
+    min_size: Optional[int] = None,
+    max_size: Optional[int] = None,
+    one_filesystem: bool = False,
+    skip_hardlinks: bool = False,
+    threads: int = 8,
+) -> Iterator[os.DirEntry]:
+    """
+    Walk directories concurrently and yield regular files as they are found.
+
+    Directories are scanned by a pool of threads so that slow (network) filesystems
+    are listed in parallel while the consumer already processes the first entries.
+    The order of the yielded entries is not deterministic. Glob patterns are
+    matched against the entry name and its path relative to the scanned root.
+
+    :param paths: Directories to walk
+    :param recursive: Descend into subdirectories
+    :param include: Only yield files matching one of these glob patterns
+    :param exclude: Skip files and directories matching one of these glob patterns
+    :param min_size: Skip files smaller than this number of bytes
+    :param max_size: Skip files larger than this number of bytes
+    :param one_filesystem: Do not descend into directories on other filesystems
+    :param skip_hardlinks: Only yield the first found link of hardlinked files
+    :param threads: Number of directory scanning threads
+    :return: Generator yielding DirEntry objects
+    """
+    found = queue.Queue(maxsize=WALK_QUEUE_SIZE)
+    stop = threading.Event()
+    lock = threading.Lock()
+    seen = set()
+    executor = ThreadPoolExecutor(max_workers=threads)
+
+    def matches(entry, root, patterns):
+        relpath = os.path.relpath(entry.path, root).replace(os.sep, "/")
+        return any(fnmatch(entry.name, p) or fnmatch(relpath, p) for p in patterns)
+
+    def accept(entry, root):
+        if include and not matches(entry, root, include):
+            return False
+        if exclude and matches(entry, root, exclude):
+            return False
+        if min_size is None and max_size is None and not skip_hardlinks:
+            return True
+        st = entry.stat(follow_symlinks=False)
+        if min_size is not None and st.st_size < min_size:
+            return False
+        if max_size is not None and st.st_size > max_size:
+            return False
+        if skip_hardlinks and st.st_nlink > 1:
+            with lock:
+                if (st.st_dev, st.st_ino) in seen:
+                    return False
+                seen.add((st.st_dev, st.st_ino))
+        return True
+
+    def put(item):
+        while not stop.is_set():
+            try:
+                found.put(item, timeout=0.1)
+                return
+            except queue.Full:
+                pass
+
+    def visit(root, path, device):
+        try:
+            if stop.is_set():
+                return
+            batch = []
+            with scandir(path) as entries:
+                for entry in entries:
+                    if stop.is_set():
+                        break
+                    if entry.is_dir(follow_symlinks=False):
+                        if not recursive or (exclude and matches(entry, root, exclude)):
+                            continue
+                        if device is not None:
+                            if entry.stat(follow_symlinks=False).st_dev != device:
+                                continue
+                        schedule(root, entry.path, device)
+                    elif entry.is_file(follow_symlinks=False) and accept(entry, root):
+                        batch.append(entry)
+                        if len(batch) >= WALK_BATCH_SIZE:
+                            put(batch)
+                            batch = []
+            if batch:
+                put(batch)
+        except OSError as e:
+            click.echo("\n{} for {}".format(type(e).__name__, path))
+        except RuntimeError:
+            # Executor was shut down because the consumer stopped iterating.
+            pass
+        finally:
+            with lock:
+                outstanding[0] -= 1
+                finished = outstanding[0] == 0
+            if finished:
+                put(None)
+
+    def schedule(root, path, device):
+        # Count before submitting so the total cannot drop to zero while the
+        # parent directory is still being scanned.
+        with lock:
+            outstanding[0] += 1
+        executor.submit(visit, root, path, device)
+
+    if not paths:
+        return
+    outstanding = [len(paths)]
+    try:
+        for path in paths:
+            device = os.stat(path).st_dev if one_filesystem else None
+            executor.submit(visit, path, path, device)
+        while True:
+            batch = found.get()
+            if batch is None:
+                break
+            yield from batch
+    finally:
+        stop.set()
+        executor.shutdown(wait=False)
+
+
+# Serializes seek and read where os.pread is missing.
+seek_lock = threading.Lock()
+
+
+def pread(fd: int, size: int, offset: int) -> bytes:
+    """Read up to `size` bytes at `offset` without moving a shared file position."""
+    if hasattr(os, "pread"):
+        return os.pread(fd, size, offset)
+    # Windows: no positional reads on file descriptors.
+    with seek_lock:
+        os.lseek(fd, offset, os.SEEK_SET)
+        return os.read(fd, size)
+
+
+def preadinto(fd: int, view: memoryview, offset: int) -> int:
+    """Read into `view` at `offset` and return the number of bytes read."""
+    if hasattr(os, "preadv"):
+        return os.preadv(fd, [view], offset)
+    # Windows and some macOS builds: read into a copy.
+    data = pread(fd, len(view), offset)
+    view[: len(data)] = data
+    return len(data)
+
+
 def get_memoryview(data):
     # Handle file path string and Path object
     if isinstance(data, (str, Path)):
@@ -110,3 +284,54 @@ def get_memoryview(data):
         return memoryview(data)
 
     raise TypeError("Unsupported data type")
+
+
+def file_holes(data) -> List[Tuple[int, int]]:
+    """
+    Find the holes of a sparse file with SEEK_DATA and SEEK_HOLE.
+
+    Holes read as zero bytes without being stored. Returns an empty list if the
+    platform or filesystem does not report holes or `data` is not a file.
+
+    :param data: File path or file object with a file descriptor
+    :return: Sorted (start, end) offsets of the holes
+    """
+    if not hasattr(os, "SEEK_HOLE"):
+        return []
+    if isinstance(data, (str, Path)):
+        fd = os.open(data, os.O_RDONLY)
+        try:
+            return find_holes(fd)
+        finally:
+            os.close(fd)
+    if hasattr(data, "fileno"):
+        try:
+            fd = data.fileno()
+        except (OSError, ValueError):
+            return []
+        position = os.lseek(fd, 0, os.SEEK_CUR)
+        try:
+            return find_holes(fd)
+        finally:
+            os.lseek(fd, position, os.SEEK_SET)
+    return []
+
+
+def find_holes(fd: int) -> List[Tuple[int, int]]:
+    size = os.fstat(fd).st_size
+    holes = []
+    offset = 0
+    try:
+        while offset < size:
+            hole = os.lseek(fd, offset, os.SEEK_HOLE)
+            if hole >= size:
+                break
+            try:
+                offset = os.lseek(fd, hole, os.SEEK_DATA)
+            except OSError:
+                # No data after the hole (ENXIO).
+                offset = size
+            holes.append((hole, offset))
+    except OSError:
+        return []
+    return holes
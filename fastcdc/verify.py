@@ -0,0 +1,263 @@
+# -*- coding: utf-8 -*-
+"""
+Verify a file against a stored chunk list without chunking it again.
+
+The chunks of a manifest are grouped into segments of consecutive chunks of up
+to `block_size` bytes. Each segment is read with one positional read and its
+chunks are hashed in memory on a thread pool, so no boundary search is needed
+and the reads stay large and sequential.
+"""
+
+import json
+import os
+import time
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+from typing import Callable, Iterable, Iterator, List, Tuple
+import click
+from humanize import intcomma, naturalsize
+from fastcdc.utils import (
+    DefaultHelp,
+    NATIVE_HASHES,
+    hash_constructor,
+    pread,
+    supported_hashes,
+)
+
+try:
+    from fastcdc.fastcdc_cy import native_digest
+except ImportError:
+    native_digest = None
+
+
+# Maximum number of bytes read at once.
+BLOCK_SIZE = 8 * 1024 * 1024
+# Number of pending segments per thread before results are collected.
+PENDING_PER_THREAD = 2
+# Lines of the `chunkify --summary` output that are not chunks.
+SUMMARY_PREFIXES = ("Chunks:", "Total Data:", "Chunk Sizes:")
+
+# (offset, length, hex digest) of a chunk.
+Entry = Tuple[int, int, str]
+
+
+class Mismatch:
+    """A chunk of the manifest whose data does not match its digest."""
+
+    def __init__(self, offset, length, expected, actual):
+        # type: (int, int, str, str) -> None
+        self.offset = offset
+        self.length = length
+        self.expected = expected
+        # Empty if the range is (partly) beyond the end of the file.
+        self.actual = actual
+
+    def __str__(self):
+        return "offset={} size={} expected={} actual={}".format(
+            self.offset, self.length, self.expected, self.actual or "<missing>"
+        )
+
+
+def parse_manifest(lines):
+    # type: (Iterable[str]) -> Iterator[Entry]
+    """
+    Parse chunk lists in any output format of `chunkify` (pretty, plain, tsv,
+    ndjson). Summary lines are skipped.
+
+    :param lines: Lines of the manifest
+    :return: Generator yielding (offset, length, hex digest)
+    """
+    for number, line in enumerate(lines, 1):
+        line = click.unstyle(line).strip()
+        if (
+            not line
+            or line == "hash\toffset\tsize"
+            or line.startswith(SUMMARY_PREFIXES)
+        ):
+            continue
+        try:
+            if line.startswith("{"):
+                record = json.loads(line)
+                if "hash" not in record:
+                    continue
+                yield int(record["offset"]), int(record["size"]), record["hash"]
+            elif "\t" in line:
+                digest, offset, size = line.split("\t")
+                yield int(offset), int(size), digest
+            else:
+                fields = dict(field.split("=", 1) for field in line.split())
+                yield int(fields["offset"]), int(fields["size"]), fields["hash"]
+        except (ValueError, KeyError):
+            raise ValueError("Invalid manifest line {}: {}".format(number, line))
+
+
+def segments(chunks, block_size=BLOCK_SIZE):
+    # type: (Iterable[Entry], int) -> Iterator[List[Entry]]
+    """Group chunks into runs of adjacent chunks of up to block_size bytes."""
+    segment = []  # type: List[Entry]
+    end = 0
+    for chunk in chunks:
+        offset, length, _ = chunk
+        if segment and (offset != end or offset + length - segment[0][0] > block_size):
+            yield segment
+            segment = []
+        segment.append(chunk)
+        end = offset + length
+    if segment:
+        yield segment
+
+
+def digest_function(hf):
+    # type: (str) -> Callable[[memoryview], str]
+    """Function returning the hex digest of a buffer with hash function `hf`."""
+    if native_digest is not None and hf in NATIVE_HASHES:
+        return lambda data: native_digest(data, hf)
+    constructor = hash_constructor(hf)
+    return lambda data: constructor(data).hexdigest()
+
+
+def check_segment(fd, segment, digest):
+    # type: (int, List[Entry], Callable[[memoryview], str]) -> Tuple[List[Mismatch], int]
+    """Read a segment and return its mismatches and the number of bytes read."""
+    start = segment[0][0]
+    last = segment[-1]
+    data = pread(fd, last[0] + last[1] - start, start)
+    view = memoryview(data)
+    mismatches = []
+    for offset, length, expected in segment:
+        blob = view[offset - start : offset - start + length]
+        if len(blob) != length:
+            mismatches.append(Mismatch(offset, length, expected, ""))
+            continue
+        actual = digest(blob)
+        if actual != expected:
+            mismatches.append(Mismatch(offset, length, expected, actual))
+    return mismatches, len(data)
+
+
+class VerifyResult:
+    """Outcome of `verify_file`."""
+
+    def __init__(self):
+        self.chunks = 0
+        self.bytes_verified = 0
+        self.mismatches = []  # type: List[Mismatch]
+        # Bytes of the file beyond the last chunk of the manifest.
+        self.trailing_bytes = 0
+        self.complete = True
+
+    @property
+    def ok(self):
+        # type: () -> bool
+        return not self.mismatches and not self.trailing_bytes
+
+
+def verify_file(
+    path, chunks, hf="sha256", threads=None, block_size=BLOCK_SIZE, max_errors=None
+):
+    # type: (str, Iterable[Entry], str, int|None, int, int|None) -> VerifyResult
+    """
+    Hash the ranges of a chunk list in a file and compare them with the digests.
+
+    :param path: File to verify
+    :param chunks: (offset, length, hex digest) of the chunks, e.g. from
+        `parse_manifest`
+    :param hf: Name of the hash function of the digests (default: "sha256")
+    :param threads: Number of hashing threads (default: number of CPUs)
+    :param block_size: Maximum size of a read
+    :param max_errors: Stop after this many mismatches (default: check all)
+    :return: VerifyResult with the mismatches in file order
+    """
+    digest = digest_function(hf)
+    threads = threads or os.cpu_count() or 1
+    result = VerifyResult()
+    fd = os.open(path, os.O_RDONLY | getattr(os, "O_BINARY", 0))
+    pending = deque()
+    end = 0
+    try:
+        with ThreadPoolExecutor(threads) as executor:
+
+            def collect():
+                mismatches, _ = pending.popleft().result()
+                result.mismatches.extend(mismatches)
+
+            for segment in segments(sorted(chunks), block_size):
+                if max_errors is not None and len(result.mismatches) >= max_errors:
+                    result.complete = False
+                    break
+                pending.append(executor.submit(check_segment, fd, segment, digest))
+                result.chunks += len(segment)
+                last = segment[-1]
+                result.bytes_verified += last[0] + last[1] - segment[0][0]
+                end = max(end, last[0] + last[1])
+                if len(pending) >= threads * PENDING_PER_THREAD:
+                    collect()
+            while pending:
+                collect()
+        if result.complete:
+            result.trailing_bytes = max(0, os.fstat(fd).st_size - end)
+    finally:
+        for future in pending:
+            future.cancel()
+        os.close(fd)
+    if max_errors is not None and len(result.mismatches) > max_errors:
+        # The last segments may add more mismatches than requested.
+        del result.mismatches[max_errors:]
+        result.complete = False
+    return result
+
+
+@click.command(cls=DefaultHelp)
+@click.argument("manifest", type=click.File("r"))
+@click.argument("file", type=click.Path(exists=True, dir_okay=False))
+@click.option(
+    "-hf", "--hash-function", type=click.STRING, default="sha256", show_default=True
+)
+@click.option(
+    "-t",
+    "--threads",
+    type=click.INT,
+    help="Number of hashing threads (default: number of CPUs).",
+)
+@click.option(
+    "--max-errors",
+    type=click.INT,
+    default=10,
+    help="Stop after this many mismatching chunks (0: check all).",
+    show_default=True,
+)
+def verify(manifest, file, hash_function, threads, max_errors):
+    """Verify FILE against the chunk list MANIFEST written by chunkify."""
+    supported = supported_hashes()
+    if hash_function not in supported:
+        msg = "'{}' is not a supported hash.\nTry one of these:\n{}".format(
+            hash_function, ", ".join(supported)
+        )
+        raise click.BadOptionUsage("hf", msg)
+    try:
+        chunks = list(parse_manifest(manifest))
+    except ValueError as e:
+        raise click.ClickException(str(e))
+    started = time.perf_counter()
+    result = verify_file(
+        file, chunks, hash_function, threads, max_errors=max_errors or None
+    )
+    elapsed = time.perf_counter() - started
+    click.echo(
+        "Chunks:         {} ({})".format(
+            intcomma(result.chunks), naturalsize(result.bytes_verified)
+        )
+    )
+    click.echo("Mismatches:     {}".format(intcomma(len(result.mismatches))))
+    for mismatch in result.mismatches:
+        click.echo("  {}".format(mismatch))
+    if not result.complete:
+        click.echo("Stopped after {} mismatches.".format(max_errors))
+    if result.trailing_bytes:
+        click.echo("Trailing Data:  {}".format(naturalsize(result.trailing_bytes)))
+    click.echo(
+        "Throughput:     {}/s".format(naturalsize(result.bytes_verified / elapsed))
+    )
+    click.echo("Result:         {}".format("OK" if result.ok else "FAILED"))
+    if not result.ok:
+        raise SystemExit(1)
@@ -0,0 +1,626 @@
+# -*- coding: utf-8 -*-
+"""
+Keep the chunk index of live directories up to date.
+
+`watch` chunks all files once and afterwards only the files that changed. Changes
+are detected with inotify on Linux and by comparing the size, mtime and inode of
+all files elsewhere (or with `--poll`). Every digest has a reference count, so
+the chunks of rewritten, moved and removed files are released and the dedupe
+metrics stay exact at a cost proportional to the churn. With `--state` the index
+is saved on exit and loaded on start, so unchanged files are not chunked again.
+
+A state file starts with MAGIC, the header length (uint32) and a JSON header with
+the chunking parameters and the files (path, size, mtime, inode and number of
+chunks). It is followed by the chunks of all files in the same order, each with
+the raw digest and the chunk length (uint32).
+"""
+
+import ctypes
+import json
+import os
+import select
+import signal
+import stat
+import struct
+import sys
+import time
+from typing import Dict, Iterator, List, Optional, Set, Tuple
+import click
+from humanize import intcomma, naturalsize
+import fastcdc
+from fastcdc.engines import ENGINES
+from fastcdc.utils import DefaultHelp, hash_constructor, supported_hashes, walk_files
+
+
+MAGIC = b"FCDCWTCH"
+VERSION = 1
+HEADER_LENGTH = struct.Struct("<I")
+LENGTH = struct.Struct("<I")
+# Header fields that must match to continue from a state file.
+PARAMETERS = ("hash_function", "engine", "min_size", "avg_size", "max_size")
+
+# inotify event masks (linux/inotify.h).
+IN_MODIFY = 0x00000002
+IN_CLOSE_WRITE = 0x00000008
+IN_MOVED_FROM = 0x00000040
+IN_MOVED_TO = 0x00000080
+IN_CREATE = 0x00000100
+IN_DELETE = 0x00000200
+IN_Q_OVERFLOW = 0x00004000
+IN_IGNORED = 0x00008000
+IN_ISDIR = 0x40000000
+WATCH_MASK = (
+    IN_MODIFY | IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE
+)
+EVENT = struct.Struct("iIII")
+
+# (size, mtime_ns, inode) of a file, it is chunked again if this changes.
+Key = Tuple[int, int, int]
+
+
+def stat_key(st):
+    # type: (os.stat_result) -> Key
+    return st.st_size, st.st_mtime_ns, st.st_ino
+
+
+def parents(path):
+    # type: (str) -> Iterator[str]
+    """Yield the directories above `path`, innermost first."""
+    parent = os.path.dirname(path)
+    while parent and parent != path:
+        yield parent
+        path, parent = parent, os.path.dirname(parent)
+
+
+class ChunkIndex:
+    """
+    Reference counted chunks of a set of files.
+
+    :param min_size: Minimum chunk size
+    :param avg_size: Average chunk size
+    :param max_size: Maximum chunk size
+    :param hf: Name of a supported hash function
+    :param engine: Chunking algorithm, one of ENGINES
+    """
+
+    def __init__(self, min_size, avg_size, max_size, hf, engine="fastcdc"):
+        self.params = dict(
+            hash_function=hf,
+            engine=engine,
+            min_size=min_size,
+            avg_size=avg_size,
+            max_size=max_size,
+        )
+        # Map path to (key, [(digest, length), ...]).
+        self.files = {}  # type: Dict[str, Tuple[Key, List[Tuple[str, int]]]]
+        # Map directory to the number of indexed files below it.
+        self.dirs = {}  # type: Dict[str, int]
+        # Map digest to [length, references].
+        self.refs = {}  # type: Dict[str, List[int]]
+        self.bytes_total = 0
+        self.bytes_unique = 0
+        # Counters since the last call of `reset_counters()`.
+        self.rechunked_files = 0
+        self.rechunked_bytes = 0
+        self.moved_files = 0
+        self.removed_files = 0
+        self.errors = 0
+
+    @property
+    def dedupe_ratio(self):
+        # type: () -> float
+        """Share of the data in duplicate chunks."""
+        return 1 - self.bytes_unique / self.bytes_total if self.bytes_total else 0.0
+
+    def chunk(self, path, size):
+        # type: (str, int) -> List[Tuple[str, int]]
+        if not size:
+            return []
+        p = self.params
+        chunks = fastcdc.fastcdc(
+            path,
+            p["min_size"],
+            p["avg_size"],
+            p["max_size"],
+            hf=p["hash_function"],
+            engine=p["engine"],
+        )
+        return [(chunk.hash, chunk.length) for chunk in chunks]
+
+    def update(self, path, st=None):
+        # type: (str, Optional[os.stat_result]) -> bool
+        """Chunk `path` again if it changed, return True if it was chunked."""
+        try:
+            if st is None:
+                st = os.stat(path)
+            key = stat_key(st)
+            entry = self.files.get(path)
+            if entry is not None and entry[0] == key:
+                return False
+            chunks = self.chunk(path, st.st_size)
+        except (OSError, ValueError):
+            # Removed or truncated while it was chunked.
+            self.errors += 1
+            self.remove(path)
+            return False
+        self.acquire(chunks)
+        if entry is not None:
+            self.release(entry[1])
+        self.add_file(path, (key, chunks))
+        self.rechunked_files += 1
+        self.rechunked_bytes += st.st_size
+        return True
+
+    def add_file(self, path, entry):
+        # type: (str, Tuple[Key, List[Tuple[str, int]]]) -> None
+        if path not in self.files:
+            for directory in parents(path):
+                self.dirs[directory] = self.dirs.get(directory, 0) + 1
+        self.files[path] = entry
+
+    def pop_file(self, path):
+        # type: (str) -> Optional[Tuple[Key, List[Tuple[str, int]]]]
+        entry = self.files.pop(path, None)
+        if entry is not None:
+            for directory in parents(path):
+                count = self.dirs[directory] - 1
+                if count:
+                    self.dirs[directory] = count
+                else:
+                    del self.dirs[directory]
+        return entry
+
+    def below(self, path):
+        # type: (str) -> List[str]
+        """Indexed files below directory `path` (only scanned for directories)."""
+        path = path.rstrip(os.sep) or os.sep
+        if path not in self.dirs:
+            return []
+        prefix = path if path.endswith(os.sep) else path + os.sep
+        return [name for name in self.files if name.startswith(prefix)]
+
+    def remove(self, path):
+        # type: (str) -> bool
+        """Release the chunks of `path` and of all files below it."""
+        removed = False
+        entry = self.pop_file(path)
+        if entry is not None:
+            self.release(entry[1])
+            self.removed_files += 1
+            removed = True
+        for name in self.below(path):
+            self.release(self.pop_file(name)[1])
+            self.removed_files += 1
+            removed = True
+        return removed
+
+    def move(self, old, new):
+        # type: (str, str) -> None
+        """Rename `old` (a file or directory) to `new` without chunking."""
+        prefix = old.rstrip(os.sep) + os.sep
+        moved = self.below(old)
+        if old in self.files:
+            moved.append(old)
+        for name in moved:
+            target = os.path.join(new, name[len(prefix) :]) if name != old else new
+            entry = self.pop_file(name)
+            replaced = self.pop_file(target)
+            if replaced is not None:
+                self.release(replaced[1])
+            self.add_file(target, entry)
+            self.moved_files += 1
+
+    def sync(self, found):
+        # type: (Dict[str, os.stat_result]) -> None
+        """
+        Reconcile the index with a complete listing of (path, stat) of the files.
+
+        A missing file that reappears under a new path with the same size, mtime
+        and inode is taken as renamed and not chunked again.
+        """
+        # Hardlinks, or files without inode numbers (Windows), share a key.
+        missing = {}  # type: Dict[Key, List[str]]
+        for path, (key, _) in self.files.items():
+            if path not in found:
+                missing.setdefault(key, []).append(path)
+        for path, st in found.items():
+            paths = missing.get(stat_key(st)) if path not in self.files else None
+            if paths:
+                self.move(paths.pop(), path)
+            else:
+                self.update(path, st)
+        for paths in missing.values():
+            for path in paths:
+                self.remove(path)
+
+    def acquire(self, chunks):
+        # type: (List[Tuple[str, int]]) -> None
+        refs = self.refs
+        for digest, length in chunks:
+            self.bytes_total += length
+            ref = refs.get(digest)
+            if ref is None:
+                refs[digest] = [length, 1]
+                self.bytes_unique += length
+            else:
+                ref[1] += 1
+
+    def release(self, chunks):
+        # type: (List[Tuple[str, int]]) -> None
+        refs = self.refs
+        for digest, length in chunks:
+            self.bytes_total -= length
+            ref = refs[digest]
+            ref[1] -= 1
+            if not ref[1]:
+                del refs[digest]
+                self.bytes_unique -= length
+
+    def reset_counters(self):
+        # type: () -> None
+        self.rechunked_files = 0
+        self.rechunked_bytes = 0
+        self.moved_files = 0
+        self.removed_files = 0
+        self.errors = 0
+
+    def save(self, path):
+        # type: (str) -> None
+        """Write the index to a state file (atomically replaced)."""
+        files = [
+            [name, key[0], key[1], key[2], len(chunks)]
+            for name, (key, chunks) in self.files.items()
+        ]
+        header = dict(self.params, version=VERSION, files=files)
+        data = json.dumps(header).encode("utf-8")
+        temp = path + ".tmp"
+        with open(temp, "wb") as outfile:
+            outfile.write(MAGIC + HEADER_LENGTH.pack(len(data)) + data)
+            for _, chunks in self.files.values():
+                outfile.write(
+                    b"".join(
+                        bytes.fromhex(digest) + LENGTH.pack(length)
+                        for digest, length in chunks
+                    )
+                )
+        os.replace(temp, path)
+
+    def load(self, path):
+        # type: (str) -> None
+        """Read the files and chunks of a state file written with `save()`."""
+        with open(path, "rb") as infile:
+            if infile.read(len(MAGIC)) != MAGIC:
+                raise ValueError("Not a fastcdc watch state file: {}".format(path))
+            (length,) = HEADER_LENGTH.unpack(infile.read(HEADER_LENGTH.size))
+            header = json.loads(infile.read(length).decode("utf-8"))
+            if header.get("version") != VERSION:
+                raise ValueError("Unsupported state file version: {}".format(path))
+            for name in PARAMETERS:
+                if header[name] != self.params[name]:
+                    raise ValueError(
+                        "State file was written with {}={}".format(name, header[name])
+                    )
+            digest_size = hash_constructor(self.params["hash_function"])().digest_size
+            width = digest_size + LENGTH.size
+            for name, size, mtime_ns, inode, count in header["files"]:
+                block = infile.read(width * count)
+                if len(block) != width * count:
+                    raise ValueError("Truncated state file: {}".format(path))
+                chunks = [
+                    (
+                        block[start : start + digest_size].hex(),
+                        LENGTH.unpack_from(block, start + digest_size)[0],
+                    )
+                    for start in range(0, len(block), width)
+                ]
+                self.acquire(chunks)
+                self.add_file(name, ((size, mtime_ns, inode), chunks))
+
+
+def list_files(paths, recursive):
+    # type: (Tuple[str, ...], bool) -> Dict[str, os.stat_result]
+    """Complete listing of (path, stat) of the watched files."""
+    return {
+        entry.path: entry.stat(follow_symlinks=False)
+        for entry in walk_files(paths, recursive)
+    }
+
+
+class Inotify:
+    """
+    Minimal inotify watcher (Linux) for directory trees via ctypes.
+
+    :param paths: Directories to watch
+    :param recursive: Also watch all subdirectories (and new ones)
+    """
+
+    def __init__(self, paths, recursive):
+        self.libc = ctypes.CDLL(None, use_errno=True)
+        self.fd = self.libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        self.recursive = recursive
+        self.dirs = {}  # type: Dict[int, str]
+        for path in paths:
+            self.add_tree(path)
+
+    @staticmethod
+    def available():
+        # type: () -> bool
+        if not sys.platform.startswith("linux"):
+            return False
+        try:
+            return hasattr(ctypes.CDLL(None), "inotify_init1")
+        except (OSError, TypeError):
+            return False
+
+    def add(self, path):
+        # type: (str) -> None
+        wd = self.libc.inotify_add_watch(self.fd, os.fsencode(path), WATCH_MASK)
+        if wd >= 0:
+            self.dirs[wd] = path
+
+    def add_tree(self, path):
+        # type: (str) -> None
+        self.add(path)
+        if self.recursive:
+            for root, dirs, _ in os.walk(path):
+                for name in dirs:
+                    self.add(os.path.join(root, name))
+
+    def events(self, timeout):
+        # type: (float) -> Iterator[Tuple[int, int, str]]
+        """Yield (mask, cookie, path) of the events that arrive within timeout."""
+        if not select.select([self.fd], [], [], timeout)[0]:
+            return
+        try:
+            data = os.read(self.fd, 1 << 16)
+        except BlockingIOError:
+            return
+        offset = 0
+        while offset < len(data):
+            wd, mask, cookie, length = EVENT.unpack_from(data, offset)
+            offset += EVENT.size
+            name = os.fsdecode(data[offset : offset + length].rstrip(b"\0"))
+            offset += length
+            if mask & IN_IGNORED:
+                self.dirs.pop(wd, None)
+                continue
+            directory = self.dirs.get(wd)
+            if mask & IN_Q_OVERFLOW or directory is None:
+                yield IN_Q_OVERFLOW, 0, ""
+                continue
+            yield mask, cookie, os.path.join(directory, name)
+
+    def changes(self, interval):
+        # type: (float) -> Tuple[Set[str], List[Tuple[str, str]], bool]
+        """
+        Wait for events, then collect them until none arrive for `interval`.
+
+        :return: Changed paths, (old, new) moves and whether events were lost
+        """
+        changed = set()  # type: Set[str]
+        moves = []  # type: List[Tuple[str, str]]
+        moved_from = {}  # type: Dict[int, str]
+        overflow = False
+        timeout = None
+        while True:
+            received = False
+            for mask, cookie, path in self.events(timeout):
+                received = True
+                if mask & IN_Q_OVERFLOW:
+                    overflow = True
+                elif mask & IN_MOVED_FROM:
+                    moved_from[cookie] = path
+                elif mask & IN_MOVED_TO and cookie in moved_from:
+                    moves.append((moved_from.pop(cookie), path))
+                    if self.recursive and mask & IN_ISDIR:
+                        self.add_tree(path)
+                else:
+                    changed.add(path)
+                    if (
+                        self.recursive
+                        and mask & IN_ISDIR
+                        and mask & (IN_CREATE | IN_MOVED_TO)
+                    ):
+                        self.add_tree(path)
+            if not received and timeout is not None:
+                break
+            timeout = interval
+        # Moved out of the watched directories.
+        changed.update(moved_from.values())
+        return changed, moves, overflow
+
+    def close(self):
+        # type: () -> None
+        os.close(self.fd)
+
+
+def apply_changes(index, changed, moves, recursive):
+    # type: (ChunkIndex, Set[str], List[Tuple[str, str]], bool) -> None
+    """Update the index for the paths reported by `Inotify.changes()`."""
+    for old, new in moves:
+        index.move(old, new)
+        changed.add(new)
+    for path in sorted(changed):
+        try:
+            st = os.stat(path, follow_symlinks=False)
+        except OSError:
+            index.remove(path)
+            continue
+        if stat.S_ISREG(st.st_mode):
+            index.update(path, st)
+        elif recursive and stat.S_ISDIR(st.st_mode):
+            # A directory created or moved in, its files may predate the watch.
+            found = list_files((path,), recursive)
+            for name, entry in found.items():
+                index.update(name, entry)
+
+
+def metrics(index, elapsed):
+    # type: (ChunkIndex, float) -> dict
+    return dict(
+        time=time.strftime("%Y-%m-%dT%H:%M:%S"),
+        files=len(index.files),
+        unique_chunks=len(index.refs),
+        bytes_total=index.bytes_total,
+        bytes_unique=index.bytes_unique,
+        dedupe_ratio=round(index.dedupe_ratio, 6),
+        rechunked_files=index.rechunked_files,
+        rechunked_bytes=index.rechunked_bytes,
+        moved_files=index.moved_files,
+        removed_files=index.removed_files,
+        errors=index.errors,
+        seconds=round(elapsed, 3),
+    )
+
+
+def format_metrics(m):
+    # type: (dict) -> str
+    return (
+        "{time} files {files} - total {total} - unique {unique} - dedupe {ratio:.2f} %"
+        " - rechunked {rechunked} files ({bytes}) - moved {moved} - removed {removed}"
+        " in {seconds:.2f}s".format(
+            time=m["time"],
+            files=intcomma(m["files"]),
+            total=naturalsize(m["bytes_total"]),
+            unique=naturalsize(m["bytes_unique"]),
+            ratio=m["dedupe_ratio"] * 100,
+            rechunked=intcomma(m["rechunked_files"]),
+            bytes=naturalsize(m["rechunked_bytes"]),
+            moved=intcomma(m["moved_files"]),
+            removed=intcomma(m["removed_files"]),
+            seconds=m["seconds"],
+        )
+    )
+
+
+@click.command(cls=DefaultHelp)
+@click.argument(
+    "paths",
+    type=click.Path(exists=True, file_okay=False, resolve_path=True),
+    nargs=-1,
+)
+@click.option(
+    "-r",
+    "--recursive",
+    help="Watch directory tree recursively.",
+    is_flag=True,
+)
+@click.option(
+    "-s",
+    "--size",
+    type=click.INT,
+    default=16384,
+    help="The desired average size of the chunks.",
+    show_default=True,
+)
+@click.option(
+    "-mi", "--min-size", type=click.INT, help="Minimum chunk size (default size/4)"
+)
+@click.option(
+    "-ma", "--max-size", type=click.INT, help="Maximum chunk size (default size*8)"
+)
+@click.option(
+    "-hf", "--hash-function", type=click.STRING, default="sha256", show_default=True
+)
+@click.option(
+    "--engine",
+    type=click.Choice(ENGINES),
+    default="fastcdc",
+    help="Chunking algorithm.",
+    show_default=True,
+)
+@click.option(
+    "--state",
+    type=click.Path(dir_okay=False, writable=True),
+    help="Load the index from this file on start and save it on exit.",
+)
+@click.option(
+    "--poll",
+    help="Detect changes by comparing the stat of all files instead of inotify.",
+    is_flag=True,
+)
+@click.option(
+    "--interval",
+    type=click.FloatRange(min=0),
+    default=2.0,
+    help="Seconds between polls, or without events before changes are applied.",
+    show_default=True,
+)
+@click.option(
+    "--once",
+    help="Update the index (and state file) once and exit.",
+    is_flag=True,
+)
+@click.option("--json", "as_json", help="Emit metrics as JSON lines.", is_flag=True)
+def watch(
+    paths,
+    recursive,
+    size,
+    min_size,
+    max_size,
+    hash_function,
+    engine,
+    state,
+    poll,
+    interval,
+    once,
+    as_json,
+):
+    """Keep dedupe metrics of changing directories up to date."""
+    if min_size is None:
+        min_size = size // 4
+    if max_size is None:
+        max_size = size * 8
+    supported = supported_hashes()
+    if hash_function not in supported:
+        msg = "'{}' is not a supported hash.\nTry one of these:\n{}".format(
+            hash_function, ", ".join(supported)
+        )
+        raise click.BadOptionUsage("hf", msg)
+    index = ChunkIndex(min_size, size, max_size, hash_function, engine)
+    if state and os.path.exists(state):
+        try:
+            index.load(state)
+        except (ValueError, KeyError) as e:
+            raise click.ClickException(str(e))
+
+    def emit(started):
+        m = metrics(index, time.perf_counter() - started)
+        click.echo(json.dumps(m) if as_json else format_metrics(m))
+        index.reset_counters()
+
+    def stop(signum, frame):
+        raise SystemExit(0)
+
+    signal.signal(signal.SIGTERM, stop)
+    # Watch before the first listing so that no change in between is missed.
+    inotify = None
+    if not (poll or once) and Inotify.available():
+        inotify = Inotify(paths, recursive)
+    try:
+        started = time.perf_counter()
+        index.sync(list_files(paths, recursive))
+        emit(started)
+        while not once:
+            if inotify:
+                changed, moves, overflow = inotify.changes(interval)
+                started = time.perf_counter()
+                if overflow:
+                    index.sync(list_files(paths, recursive))
+                else:
+                    apply_changes(index, changed, moves, recursive)
+            else:
+                time.sleep(interval)
+                started = time.perf_counter()
+                index.sync(list_files(paths, recursive))
+            if index.rechunked_files or index.moved_files or index.removed_files:
+                emit(started)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        if inotify:
+            inotify.close()
+        if state:
+            index.save(state)
@@ -0,0 +1,88 @@
+# -*- coding: utf-8 -*-
+from typing import Callable, Dict, List, Optional
+
+
+# Number of bytes hashed at the head and at the tail of a file for the partial hash.
+SAMPLE_SIZE = 4096
+# Block size for reading whole files to compute the full hash.
+READ_SIZE = 1024 * 1024
+
+
+class WholeFileIndex:
+    """
+    Detect files that are byte-identical to an already scanned file.
+
+    Files are grouped by size. Only if a file has the same size as a registered file
+    a partial hash over its head and tail is compared, and only if those match the
+    full files are hashed. Hashes are computed lazily and cached, so unique files
+    cost no extra I/O.
+
+    Use `is_duplicate()` before chunking a file and `add()` after it was chunked
+    successfully, so that only files whose chunks are known are used as reference.
+    After a match `original` is the path of the registered file.
+
+    :param hf: Hash function constructor used for partial and full file hashes
+    """
+
+    def __init__(self, hf):
+        # type: (Callable) -> None
+        self.hf = hf
+        self.by_size = {}  # type: Dict[int, List[list]]
+        self.pending = None
+        self.original = None  # type: Optional[str]
+
+    def is_duplicate(self, path, size):
+        # type: (str, int) -> bool
+        """Check if the file at `path` with `size` bytes matches a registered file."""
+        record = [path, None, None]
+        self.pending = record
+        self.original = None
+        candidates = self.by_size.get(size)
+        if not candidates:
+            return False
+        record[1] = self.partial_hash(path, size)
+        for candidate in candidates:
+            if candidate[1] is None:
+                candidate[1] = self.partial_hash(candidate[0], size)
+            if candidate[1] != record[1]:
+                continue
+            if record[2] is None:
+                record[2] = self.full_hash(path, size, record[1])
+            if candidate[2] is None:
+                candidate[2] = self.full_hash(candidate[0], size, candidate[1])
+            if candidate[2] == record[2]:
+                self.original = candidate[0]
+                return True
+        return False
+
+    def add(self, path, size):
+        # type: (str, int) -> None
+        """Register the file at `path` with `size` bytes as reference for duplicates."""
+        if self.pending is not None and self.pending[0] == path:
+            record = self.pending
+        else:
+            record = [path, None, None]
+        self.pending = None
+        self.by_size.setdefault(size, []).append(record)
+
+    def partial_hash(self, path, size):
+        # type: (str, int) -> bytes
+        """Hash of the first and last SAMPLE_SIZE bytes of the file."""
+        h = self.hf()
+        with open(path, "rb") as infile:
+            h.update(infile.read(SAMPLE_SIZE))
+            if size > SAMPLE_SIZE:
+                infile.seek(max(SAMPLE_SIZE, size - SAMPLE_SIZE))
+                h.update(infile.read(SAMPLE_SIZE))
+        return h.digest()
+
+    def full_hash(self, path, size, partial):
+        # type: (str, int, bytes) -> bytes
+        """Hash of the whole file (the partial hash already covers small files)."""
+        if size <= 2 * SAMPLE_SIZE:
+            return partial
+        h = self.hf()
+        with open(path, "rb") as infile:
+            for block in iter(lambda: infile.read(READ_SIZE), b""):
+                h.update(block)
+        return h.digest()
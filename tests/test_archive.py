@@ -0,0 +1,107 @@
+# -*- coding: utf-8 -*-
+import gzip
+import io
+import os
+import tarfile
+import zipfile
+import pytest
+from click.testing import CliRunner
+from fastcdc.archive import chunk_archive, is_archive, iter_members
+from fastcdc.blockio import chunk_stream
+from fastcdc.cli import cli
+import fastcdc
+
+r = CliRunner()
+
+MEMBERS = {"a.bin": os.urandom(70000), "dir/b.bin": os.urandom(30000), "empty": b""}
+
+
+def as_tuples(chunks):
+    return [(c.offset, c.length, c.hash) for c in chunks]
+
+
+def make_archive(path):
+    name = str(path)
+    if name.endswith(".zip"):
+        with zipfile.ZipFile(name, "w", zipfile.ZIP_DEFLATED) as archive:
+            archive.writestr("dir/", b"")
+            for member, data in MEMBERS.items():
+                archive.writestr(member, data)
+    else:
+        with tarfile.open(name, "w:" + name.split(".")[-1].replace("tar", "")) as tar:
+            for member, data in MEMBERS.items():
+                info = tarfile.TarInfo(member)
+                info.size = len(data)
+                tar.addfile(info, io.BytesIO(data))
+    return name
+
+
+@pytest.mark.parametrize("suffix", [".tar", ".tar.gz", ".tar.xz", ".zip"])
+def test_chunk_archive_members(tmp_path, suffix):
+    path = make_archive(tmp_path / ("test" + suffix))
+    assert is_archive(path)
+    result = {
+        name: as_tuples(chunks)
+        for name, chunks in chunk_archive(path, avg_size=1024, hf="sha256")
+    }
+    assert result == {
+        os.path.join(path, member): as_tuples(
+            fastcdc.fastcdc(data, avg_size=1024, hf="sha256")
+        )
+        for member, data in MEMBERS.items()
+    }
+
+
+def test_chunk_archive_stream(tmp_path):
+    path = make_archive(tmp_path / "test.zip")
+    ((name, chunks),) = chunk_archive(path, avg_size=1024, hf="sha256", reset=False)
+    assert name == path
+    data = b"".join(MEMBERS.values())
+    assert as_tuples(chunks) == as_tuples(
+        fastcdc.fastcdc(data, avg_size=1024, hf="sha256")
+    )
+
+
+def test_gzip_member(tmp_path):
+    path = str(tmp_path / "data.bin.gz")
+    with gzip.open(path, "wb") as outfile:
+        outfile.write(MEMBERS["a.bin"])
+    ((name, stream),) = [(n, s.read()) for n, s in iter_members(path)]
+    assert name == os.path.join(path, "data.bin")
+    assert stream == MEMBERS["a.bin"]
+
+
+def test_chunk_stream_blocks():
+    data = os.urandom(100000)
+    chunks = chunk_stream(io.BytesIO(data), 256, 1024, 8192, block_size=8192)
+    assert as_tuples(chunks) == as_tuples(fastcdc.fastcdc(data, 256, 1024, 8192))
+
+
+def test_scan_archives(tmp_path):
+    make_archive(tmp_path / "test.tar.gz")
+    (tmp_path / "a.bin").write_bytes(MEMBERS["a.bin"])
+    plain = r.invoke(cli, ["scan", "-s", "1024", str(tmp_path)])
+    result = r.invoke(cli, ["scan", "-s", "1024", "--archives", str(tmp_path)])
+    assert result.exit_code == 0
+    assert "Archive Files:  3\n" in result.output
+    assert "Dupe Data:      70.0 kB" not in plain.output
+    assert "Dupe Data:      70.0 kB" in result.output
+
+
+def test_scan_identical_archives(tmp_path):
+    make_archive(tmp_path / "a.tar.gz")
+    (tmp_path / "b.tar.gz").write_bytes((tmp_path / "a.tar.gz").read_bytes())
+    args = ["scan", "-s", "1024", "--archives", "--near-dupes", "0.5", str(tmp_path)]
+    result = r.invoke(cli, args)
+    assert result.exit_code == 0
+    assert "Archive Files:  6\n" in result.output
+    assert "Dupe Files" not in result.output
+    assert "DeDupe Ratio:   50.00 %" in result.output
+    assert r.invoke(cli, args + ["--no-file-dedupe"]).output.count("50.00 %") == 1
+
+
+def test_scan_bad_archive(tmp_path):
+    (tmp_path / "bad.zip").write_bytes(b"not a zip")
+    result = r.invoke(cli, ["scan", "--archives", str(tmp_path)])
+    assert result.exit_code == 0
+    assert "BadZipFile" in result.output
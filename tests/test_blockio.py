@@ -0,0 +1,91 @@
+# -*- coding: utf-8 -*-
+import os
+import pytest
+from click.testing import CliRunner
+from tests import TEST_DIR, TEST_FILE
+from fastcdc.blockio import BlockReader, chunk_file
+from fastcdc.cli import cli
+from fastcdc.stats import Stats
+import fastcdc
+
+r = CliRunner()
+
+
+def as_tuples(chunks):
+    return [(c.offset, c.length, c.hash, c.data) for c in chunks]
+
+
+@pytest.mark.parametrize("engine", ["fastcdc", "buzhash", "ae"])
+@pytest.mark.parametrize("direct", [False, True])
+def test_chunk_file_matches_mmap(tmp_path, engine, direct):
+    path = tmp_path / "data"
+    path.write_bytes(os.urandom(300000))
+    kwargs = dict(avg_size=1024, hf="sha256", engine=engine, fat=True)
+    expected = as_tuples(fastcdc.fastcdc(str(path), **kwargs))
+    chunks = chunk_file(str(path), direct=direct, block_size=16384, **kwargs)
+    assert as_tuples(chunks) == expected
+
+
+@pytest.mark.parametrize("size", [0, 1, 4096, 8192, 8193])
+def test_chunk_file_block_edges(tmp_path, size):
+    path = tmp_path / "data"
+    path.write_bytes(os.urandom(size))
+    chunks = list(chunk_file(str(path), 64, 256, 1024, block_size=4096))
+    assert sum(chunk.length for chunk in chunks) == size
+    if size:
+        expected = list(fastcdc.fastcdc(str(path), 64, 256, 1024))
+        assert [(c.offset, c.length) for c in chunks] == [
+            (c.offset, c.length) for c in expected
+        ]
+
+
+def test_chunk_file_stats():
+    stats = Stats()
+    chunks = list(chunk_file(TEST_FILE, 1024, 4096, 8192, stats=stats, block_size=8192))
+    assert stats.files == 1
+    assert stats.chunks == len(chunks)
+    assert stats.cuts_eof == 1
+    assert stats.bytes_scanned == os.path.getsize(TEST_FILE)
+
+
+def test_block_reader():
+    data = open(TEST_FILE, "rb").read()
+    with BlockReader(TEST_FILE, head_size=100, block_size=8192) as reader:
+        assert reader.head_size == 4096
+        blocks = [
+            (offset, bytes(buffer[reader.head_size : reader.head_size + length]))
+            for buffer, offset, length in reader.blocks()
+        ]
+    assert b"".join(block for _, block in blocks) == data
+    assert [offset for offset, _ in blocks] == list(range(0, len(data), 8192))
+
+
+def test_chunk_file_without_preadv(tmp_path, monkeypatch):
+    data = os.urandom(300000)
+    path = str(tmp_path / "data")
+    with open(path, "wb") as f:
+        f.write(data)
+    expected = list(fastcdc.fastcdc(data, 256, 1024, 8192, hf="sha256"))
+    monkeypatch.delattr(os, "preadv", raising=False)
+    chunks = chunk_file(path, 256, 1024, 8192, hf="sha256", block_size=65536)
+    assert [c.hash for c in chunks] == [c.hash for c in expected]
+
+
+def test_chunk_file_abandoned():
+    chunks = chunk_file(TEST_FILE, 256, 1024, 8192, block_size=4096)
+    next(chunks)
+    chunks.close()
+
+
+def test_chunkify_io_modes():
+    outputs = [
+        r.invoke(cli, ["chunkify", "-s", "1024", "--io", io, TEST_FILE]).output
+        for io in ("mmap", "read", "direct")
+    ]
+    assert outputs[0] == outputs[1] == outputs[2]
+
+
+def test_scan_io_read():
+    result = r.invoke(cli, ["scan", "--io", "read", "--profile", TEST_DIR])
+    assert result.exit_code == 0
+    assert "Chunk Sizes" in result.output
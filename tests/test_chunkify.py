@@ -0,0 +1,53 @@
+# -*- coding: utf-8 -*-
+import json
+from click.testing import CliRunner
+from tests import TEST_FILE
+from fastcdc.cli import cli
+
+r = CliRunner()
+
+
+def test_chunkify_default_plain():
+    result = r.invoke(cli, ["chunkify", TEST_FILE])
+    assert result.exit_code == 0
+    lines = result.output.splitlines()
+    assert len(lines) == 5
+    assert lines[0].startswith("hash=103159aa68bb1ea98f64248c647b8fe9a303365d")
+    assert lines[0].endswith(" offset=0 size=22366")
+    assert "\x1b[" not in result.output
+
+
+def test_chunkify_tsv():
+    result = r.invoke(cli, ["chunkify", "-f", "tsv", TEST_FILE])
+    assert result.exit_code == 0
+    lines = result.output.splitlines()
+    assert lines[0] == "hash\toffset\tsize"
+    assert lines[1].split("\t")[1:] == ["0", "22366"]
+    assert len(lines) == 6
+
+
+def test_chunkify_ndjson():
+    result = r.invoke(cli, ["chunkify", "-f", "ndjson", "--summary", TEST_FILE])
+    assert result.exit_code == 0
+    records = [json.loads(line) for line in result.output.splitlines()]
+    assert records[1] == {
+        "hash": "3f2b58dc77982e763e75db76c4205aaab4e18ff8929e298ca5c58500fee5530d",
+        "offset": 22366,
+        "size": 10491,
+    }
+    assert records[-1]["chunks"] == 5
+    assert records[-1]["bytes"] == sum(rec["size"] for rec in records[:-1])
+
+
+def test_chunkify_quiet_summary():
+    result = r.invoke(cli, ["chunkify", "-q", "--summary", TEST_FILE])
+    assert result.exit_code == 0
+    assert "hash=" not in result.output
+    assert "Chunks:         5" in result.output
+    assert "min 10491 - avg 21893 - max 43819" in result.output
+
+
+def test_chunkify_profile():
+    result = r.invoke(cli, ["chunkify", "-q", "--profile", TEST_FILE])
+    assert result.exit_code == 0
+    assert "boundary scan" in result.output
@@ -0,0 +1,70 @@
+# -*- coding: utf-8 -*-
+import os
+import zlib
+from hashlib import sha256
+import pytest
+from fastcdc.compress import CompressionEstimator, compressor, supported_codecs
+
+
+@pytest.mark.parametrize("codec", supported_codecs())
+def test_compressor(codec):
+    data = b"abc" * 10000
+    assert 0 < compressor(codec)(data) < len(data)
+
+
+def test_compressor_unknown():
+    with pytest.raises(ValueError):
+        compressor("nope")
+
+
+def test_estimator_exact():
+    chunks = [os.urandom(100) * 50 for _ in range(20)]
+    with CompressionEstimator("zlib", threads=2) as estimator:
+        for data in chunks:
+            estimator.add(sha256(data).hexdigest(), data)
+    assert estimator.unique_bytes == 100000
+    assert estimator.sampled_chunks == 20
+    expected = sum(len(zlib.compress(data, 6)) for data in chunks)
+    assert estimator.compressed_bytes == expected
+
+
+def test_estimator_sample():
+    chunks = [os.urandom(100) * 50 for _ in range(1000)]
+    with CompressionEstimator("zlib", sample=0.25) as estimator:
+        for data in chunks:
+            estimator.add(sha256(data).hexdigest(), data)
+    assert 150 < estimator.sampled_chunks < 350
+    assert estimator.unique_bytes == 5000000
+    assert 0.02 < estimator.ratio < 0.05
+
+
+def test_estimator_empty():
+    estimator = CompressionEstimator()
+    estimator.close()
+    assert estimator.compressed_bytes == 0
+    assert estimator.ratio == 1.0
+
+
+@pytest.mark.parametrize("codec,level", [("zlib", 10), ("bz2", 0), ("lzma", 99)])
+def test_compressor_bad_level(codec, level):
+    with pytest.raises(ValueError, match="not supported"):
+        compressor(codec, level)
+
+
+def test_estimator_range(tmp_path):
+    chunks = [os.urandom(100) * 50 for _ in range(200)]
+    path = tmp_path / "data"
+    path.write_bytes(b"".join(chunks))
+    with CompressionEstimator("zlib", sample=0.5) as expected:
+        for data in chunks:
+            expected.add(sha256(data).hexdigest(), data)
+    fd = os.open(str(path), os.O_RDONLY)
+    try:
+        with CompressionEstimator("zlib", sample=0.5) as estimator:
+            for i, data in enumerate(chunks):
+                estimator.add_range(sha256(data).hexdigest(), fd, i * 5000, 5000)
+    finally:
+        os.close(fd)
+    assert estimator.unique_bytes == expected.unique_bytes == 1000000
+    assert estimator.sampled_chunks == expected.sampled_chunks
+    assert estimator.compressed_bytes == expected.compressed_bytes
@@ -0,0 +1,57 @@
+# -*- coding: utf-8 -*-
+import random
+import pytest
+from fastcdc.engines import ENGINES, polynomial_mod, rabin_tables, RABIN_POLYNOMIAL
+from fastcdc.fastcdc_py import fastcdc_py
+from fastcdc.fastcdc_cy import fastcdc_cy
+
+
+def random_data(size, seed=0):
+    rnd = random.Random(seed)
+    return bytes(rnd.getrandbits(8) for _ in range(size))
+
+
+def cut_points(chunks):
+    return [(c.offset, c.length) for c in chunks]
+
+
+@pytest.mark.parametrize("engine", ENGINES)
+@pytest.mark.parametrize("min_size", [64, 256, 1024])
+def test_engine_py_cy_same_cut_points(engine, min_size):
+    data = random_data(100000) + bytes(20000) + b"ab" * 5000
+    expected = cut_points(fastcdc_py(data, min_size, 1024, 8192, engine=engine))
+    assert cut_points(fastcdc_cy(data, min_size, 1024, 8192, engine=engine)) == (
+        expected
+    )
+    assert sum(length for _, length in expected) == len(data)
+    assert all(min_size <= length <= 8192 for _, length in expected[:-1])
+
+
+@pytest.mark.parametrize("engine", ENGINES)
+def test_engine_average_size(engine):
+    chunks = list(fastcdc_cy(random_data(400000, 1), avg_size=4096, engine=engine))
+    average = sum(c.length for c in chunks) / len(chunks)
+    assert 2048 < average < 8192
+
+
+@pytest.mark.parametrize("engine", ENGINES)
+def test_engine_content_defined(engine):
+    data = random_data(200000, 2)
+    original = cut_points(fastcdc_cy(data, avg_size=2048, engine=engine))
+    shifted = cut_points(fastcdc_cy(b"x" * 100 + data, avg_size=2048, engine=engine))
+    ends = {offset + length for offset, length in original}
+    shifted_ends = {offset + length - 100 for offset, length in shifted}
+    assert len(ends & shifted_ends) > len(ends) * 0.9
+
+
+def test_rabin_tables():
+    mod_table, out_table = rabin_tables()
+    assert polynomial_mod(RABIN_POLYNOMIAL, RABIN_POLYNOMIAL) == 0
+    assert mod_table[1] == polynomial_mod(1 << 53, RABIN_POLYNOMIAL) | 1 << 53
+    assert out_table[0] == 0
+
+
+@pytest.mark.parametrize("chunk_func", [fastcdc_py, fastcdc_cy])
+def test_engine_unsupported(chunk_func):
+    with pytest.raises(ValueError):
+        chunk_func(b"data", engine="nope")
@@ -0,0 +1,88 @@
+# -*- coding: utf-8 -*-
+import random
+from hashlib import sha256
+from fastcdc.estimate import DedupeEstimator, HyperLogLog, sample_file
+
+
+def stream(count, seed=0):
+    """Chunks where about 40% of the bytes are repeats of earlier chunks."""
+    rnd = random.Random(seed)
+    seen = []
+    for index in range(count):
+        if seen and rnd.random() < 0.4:
+            yield rnd.choice(seen)
+            continue
+        chunk = (sha256(str(index).encode()).hexdigest(), rnd.randint(2048, 16384))
+        seen.append(chunk)
+        yield chunk
+
+
+def exact(chunks):
+    unique = {}
+    total = 0
+    for digest, length in chunks:
+        unique[digest] = length
+        total += length
+    return 1 - sum(unique.values()) / total, len(unique)
+
+
+def test_hyperloglog_count():
+    hll = HyperLogLog()
+    for index in range(100000):
+        digest = sha256(str(index).encode()).hexdigest()
+        hll.add(digest)
+        hll.add(digest)
+    assert abs(hll.count() - 100000) < 100000 * 4 * hll.error()
+
+
+def test_hyperloglog_small():
+    hll = HyperLogLog()
+    for index in range(10):
+        hll.add(sha256(str(index).encode()).hexdigest())
+    assert hll.count() == 10
+
+
+def test_estimator_exact_without_halving():
+    chunks = list(stream(5000))
+    estimator = DedupeEstimator()
+    for digest, length in chunks:
+        estimator.add(digest, length)
+    ratio, low, high = estimator.dedupe_ratio()
+    assert estimator.rate == 1.0
+    assert abs(ratio - exact(chunks)[0]) < 1e-12
+    assert low == high == ratio
+
+
+def test_estimator_bounded_samples():
+    chunks = list(stream(100000))
+    estimator = DedupeEstimator(max_samples=2000)
+    for digest, length in chunks:
+        estimator.add(digest, length)
+    true_ratio, unique = exact(chunks)
+    ratio, low, high = estimator.dedupe_ratio()
+    assert len(estimator.samples) <= 2000
+    assert estimator.rate < 0.05
+    assert estimator.bytes_total == sum(length for _, length in chunks)
+    assert low < ratio < high
+    assert abs(ratio - true_ratio) < 3 * (high - low)
+    assert abs(estimator.hll.count() - unique) < unique * 4 * estimator.hll.error()
+
+
+def test_estimator_duplicate_files():
+    estimator = DedupeEstimator()
+    estimator.add("ab" * 16, 1000)
+    estimator.add_duplicate(1000)
+    assert estimator.bytes_total == 2000
+    assert estimator.dedupe_ratio() == (0.5, 0.5, 0.5)
+
+
+def test_estimator_empty():
+    assert DedupeEstimator().dedupe_ratio() == (0.0, 0.0, 0.0)
+
+
+def test_sample_file():
+    paths = ["/data/file{}".format(index) for index in range(10000)]
+    selected = [path for path in paths if sample_file(path, 0.1)]
+    assert 800 < len(selected) < 1200
+    assert selected == [path for path in paths if sample_file(path, 0.1)]
+    assert all(sample_file(path, 1.0) for path in paths[:10])
@@ -1,11 +1,15 @@
+import json
+import random
 from hashlib import sha256
 
 import pytest
 from fastcdc.original import *
 from fastcdc.fastcdc_py import fastcdc_py, chunk_generator as chunk_generator_py
 from fastcdc.fastcdc_cy import fastcdc_cy, chunk_generator as chunk_generator_cy
+from fastcdc.fastcdc_cy import isa, set_isa
 from tests import TEST_FILE
-from fastcdc.utils import get_memoryview
+from fastcdc.stats import Stats
+from fastcdc.utils import get_memoryview, hash_constructor
 
 
 @pytest.mark.parametrize("chunk_func", [FastCDC.new, fastcdc_py, fastcdc_cy])
@@ -150,3 +154,92 @@ def test_chunk_length_less_than_min_size(chunk_func):
     )
     chunk = next(chunks)
     assert chunk.length == len(data)
+
+
+@pytest.mark.parametrize("chunk_func", [fastcdc_py, fastcdc_cy])
+def test_stats(chunk_func):
+    stats = Stats()
+    results = list(chunk_func(TEST_FILE, 8192, 16384, 32768, hf=sha256, stats=stats))
+    assert stats.files == 1
+    assert stats.chunks == len(results) == 6
+    assert stats.bytes_scanned == sum(c.length for c in results) == 109466
+    assert stats.cuts_max_size == 1
+    assert stats.cuts_eof == 1
+    assert stats.cuts_content == 4
+    assert stats.histogram[13] == 3
+    assert stats.histogram[14] == 2
+    assert stats.histogram[15] == 1
+    data = json.loads(stats.to_json())
+    assert data["histogram"] == {"8192": 3, "16384": 2, "32768": 1}
+    assert stats.time_scan > 0
+    assert stats.time_hash > 0
+
+
+def supported_isas():
+    supported = []
+    for name in ("scalar", "portable", "avx2"):
+        try:
+            set_isa(name)
+            supported.append(name)
+        except ValueError:
+            pass
+    set_isa()
+    return supported
+
+
+@pytest.fixture
+def restore_isa():
+    yield
+    set_isa()
+
+
+@pytest.mark.parametrize("name", supported_isas())
+@pytest.mark.parametrize("avg_size", [256, 1024, 8192, 65536])
+def test_isa_same_cut_points(name, avg_size, restore_isa):
+    rnd = random.Random(avg_size)
+    data = bytes(rnd.getrandbits(8) for _ in range(300000))
+    data += bytes(70000) + data[:1000] * 50
+    set_isa(name)
+    assert isa() == name
+    expected = [(c.offset, c.length) for c in fastcdc_py(data, avg_size=avg_size)]
+    result = [(c.offset, c.length) for c in fastcdc_cy(data, avg_size=avg_size)]
+    assert result == expected
+
+
+def test_isa_unsupported(restore_isa):
+    with pytest.raises(ValueError):
+        set_isa("mmx")
+
+
+@pytest.mark.parametrize("chunk_func", [fastcdc_py, fastcdc_cy])
+@pytest.mark.parametrize("name", ["xxh3_64", "xxh3_128", "sha256"])
+def test_hash_function_by_name(chunk_func, name):
+    hf = hash_constructor(name)
+    with open(TEST_FILE, "rb") as stream:
+        data = stream.read()
+    for c in chunk_func(TEST_FILE, 256, 1024, 8192, hf=name):
+        assert c.hash == hf(data[c.offset : c.offset + c.length]).hexdigest()
+
+
+@pytest.mark.parametrize("chunk_func", [fastcdc_py, fastcdc_cy])
+def test_hash_function_unsupported(chunk_func):
+    with pytest.raises(ValueError):
+        next(chunk_func(TEST_FILE, hf="nohash"))
+
+
+@pytest.mark.parametrize("avg_size", [256, 1024, 8192, 16384])
+def test_original_compiled_same_cut_points(avg_size, monkeypatch):
+    from fastcdc import original
+
+    rnd = random.Random(avg_size)
+    data = bytes(rnd.getrandbits(8) for _ in range(200000)) + bytes(30000)
+    min_size, max_size = max(64, avg_size // 4), max(1024, avg_size * 8)
+    compiled = [
+        (c.offset, c.length) for c in FastCDC.new(data, min_size, avg_size, max_size)
+    ]
+    cy = [(c.offset, c.length) for c in fastcdc_cy(data, min_size, avg_size, max_size)]
+    monkeypatch.setattr(original, "cut_native", None)
+    python = [
+        (c.offset, c.length) for c in FastCDC.new(data, min_size, avg_size, max_size)
+    ]
+    assert compiled == python == cy
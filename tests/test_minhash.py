@@ -0,0 +1,94 @@
+# -*- coding: utf-8 -*-
+import os
+import random
+import pytest
+from click.testing import CliRunner
+from fastcdc.cli import cli
+from fastcdc.minhash import MinHashIndex, lsh_params, signature, similarity
+from fastcdc.utils import supported_hashes
+import fastcdc
+
+r = CliRunner()
+
+
+def digests(data):
+    return [c.hash for c in fastcdc.fastcdc(data, avg_size=1024, hf="sha256")]
+
+
+def edited(data, edits, seed):
+    rnd = random.Random(seed)
+    data = bytearray(data)
+    for _ in range(edits):
+        offset = rnd.randrange(len(data))
+        data[offset : offset + 4] = os.urandom(4)
+    return bytes(data)
+
+
+def test_lsh_params():
+    for threshold in (0.3, 0.5, 0.8, 0.95):
+        rows, bands = lsh_params(threshold)
+        assert rows * bands <= 128
+        assert 1 - (1 - threshold**rows) ** bands >= 0.95
+    assert lsh_params(0.5) == (3, 42)
+
+
+def test_signature_similarity():
+    data = os.urandom(1000000)
+    a = set(digests(data))
+    b = set(digests(edited(data, 100, 1)))
+    jaccard = len(a & b) / len(a | b)
+    estimate = similarity(signature(a), signature(b))
+    assert abs(estimate - jaccard) < 0.15
+    assert similarity(signature(a), signature(a)) == 1
+    assert similarity(signature(a), signature(digests(os.urandom(100000)))) < 0.1
+    small = signature(digests(os.urandom(500)))
+    assert len(small) == 128
+    assert similarity(small, small) == 1
+    with pytest.raises(ValueError):
+        signature(["0123abcd"])
+    for size in (100, 127):
+        assert len(signature(digests(data), size)) == size
+
+
+def test_clusters():
+    index = MinHashIndex(0.5, size=100)
+    base = os.urandom(200000)
+    other = os.urandom(200000)
+    files = dict(
+        a=base,
+        b=edited(base, 10, 1),
+        c=edited(base, 20, 2),
+        d=other,
+        e=edited(other, 5, 3),
+        f=os.urandom(200000),
+    )
+    for name, data in files.items():
+        chunks = list(fastcdc.fastcdc(data, avg_size=1024, hf="sha256"))
+        assert list(index.feed(name, chunks)) == chunks
+    index.add_copy("g", "f")
+    index.add_copy("h", "missing")
+    clusters = index.clusters()
+    assert sorted(sorted(names) for names, _, _ in clusters) == [
+        ["a", "b", "c"],
+        ["d", "e"],
+        ["f", "g"],
+    ]
+    assert clusters[0][1] == 600000
+    for _, _, mean in clusters:
+        assert 0.5 <= mean <= 1
+
+
+def test_scan_near_dupes(tmp_path):
+    data = os.urandom(300000)
+    (tmp_path / "a.bin").write_bytes(data)
+    (tmp_path / "b.bin").write_bytes(edited(data, 5, 1))
+    (tmp_path / "c.bin").write_bytes(data)
+    (tmp_path / "d.bin").write_bytes(os.urandom(300000))
+    result = r.invoke(cli, ["scan", "-s", "4096", "--near-dupes", "0.5", str(tmp_path)])
+    assert result.exit_code == 0
+    assert "Near-Dupes:     3 files in 1 clusters (50 % similar)" in result.output
+    assert "  3 files, 900.0 kB" in result.output
+    assert "d.bin" not in result.output
+    if "xxh32" in supported_hashes():
+        args = ["scan", "-hf", "xxh32", "--near-dupes", "0.5", str(tmp_path)]
+        assert r.invoke(cli, args).exit_code == 2
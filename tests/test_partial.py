@@ -0,0 +1,85 @@
+# -*- coding: utf-8 -*-
+import os
+import pytest
+from click.testing import CliRunner
+from fastcdc.cli import cli
+from fastcdc.partial import merge_partials, read_header, read_records, write_partial
+
+r = CliRunner()
+
+
+def value(output, label):
+    for line in output.splitlines():
+        if line.startswith(label):
+            return line.split(":", 1)[1].strip()
+
+
+def make_shards(root):
+    shared = os.urandom(50000)
+    for name, files in (
+        ("a", [shared, os.urandom(30000), shared[:20000]]),
+        ("b", [shared, os.urandom(40000) + shared[:25000]]),
+        ("c", [os.urandom(10000)]),
+    ):
+        (root / name).mkdir()
+        for index, data in enumerate(files):
+            (root / name / "f{}".format(index)).write_bytes(data)
+    return [str(root / name) for name in ("a", "b", "c")]
+
+
+@pytest.mark.parametrize("file_dedupe", ["--file-dedupe", "--no-file-dedupe"])
+def test_scan_merge_equals_single_scan(tmp_path, file_dedupe):
+    shards = make_shards(tmp_path)
+    options = ["scan", "-s", "1024", file_dedupe]
+    partials = []
+    for shard in shards:
+        partial = str(tmp_path / (os.path.basename(shard) + ".part"))
+        result = r.invoke(cli, options + ["--emit-partial", partial, shard])
+        assert result.exit_code == 0
+        partials.append(partial)
+    single = r.invoke(cli, options + shards)
+    merged = r.invoke(cli, ["scan-merge"] + partials)
+    assert merged.exit_code == 0
+    for label in ("Files", "Unique Chunks", "Total Data", "Dupe Data", "DeDupe Ratio"):
+        assert value(merged.output, label) == value(single.output, label)
+
+    # Merging in stages gives the same result.
+    staged = str(tmp_path / "ab.part")
+    result = r.invoke(cli, ["scan-merge", "-o", staged] + partials[:2])
+    assert result.exit_code == 0
+    restaged = r.invoke(cli, ["scan-merge", staged, partials[2]])
+    assert restaged.output.splitlines()[1:-1] == merged.output.splitlines()[1:-1]
+
+
+def test_partial_roundtrip(tmp_path):
+    path = str(tmp_path / "p")
+    header = dict(
+        hash_function="md5",
+        digest_size=2,
+        engine="fastcdc",
+        min_size=1,
+        avg_size=2,
+        max_size=3,
+        files=2,
+        extra_dupe=7,
+    )
+    write_partial(path, header, {"ff00": [5, 1], "00ff": [3, 2]})
+    with open(path, "rb") as infile:
+        assert read_header(infile)["files"] == 2
+        records = list(read_records(infile, 2))
+    assert records == [(b"\x00\xff", 3, 2), (b"\xff\x00", 5, 1)]
+    result = merge_partials([path, path])
+    assert result.unique_chunks == 2
+    assert result.unique_bytes == 8
+    assert result.bytes_total == 2 * (5 + 6) + 14
+    assert result.bytes_dupe == result.bytes_total - 8
+
+
+def test_scan_merge_mismatch(tmp_path):
+    shards = make_shards(tmp_path)
+    a, b = str(tmp_path / "a.part"), str(tmp_path / "b.part")
+    r.invoke(cli, ["scan", "-s", "1024", "--emit-partial", a, shards[0]])
+    r.invoke(cli, ["scan", "-s", "2048", "--emit-partial", b, shards[1]])
+    result = r.invoke(cli, ["scan-merge", a, b])
+    assert result.exit_code != 0
+    assert "differs" in result.output
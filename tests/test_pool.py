@@ -0,0 +1,74 @@
+# -*- coding: utf-8 -*-
+import os
+import pickle
+import pytest
+import fastcdc
+from fastcdc.fastcdc_cy import fastcdc_cy
+from fastcdc.fastcdc_py import fastcdc_py
+from fastcdc import pool
+from fastcdc.pool import ChunkPool
+from tests import TEST_FILE
+
+
+def test_chunk_pool(tmp_path):
+    paths = []
+    for index in range(4):
+        path = tmp_path / "file{}".format(index)
+        path.write_bytes(os.urandom(100000 * (index + 1)))
+        paths.append(str(path))
+    paths.append(str(tmp_path / "missing"))
+    with ChunkPool(2, avg_size=1024, hf="sha256") as pool:
+        results = list(pool.imap(paths))
+        for path, result in zip(paths, results):
+            with result:
+                assert result.path == path
+                if path.endswith("missing"):
+                    assert result.error
+                    assert len(result) == 0
+                    continue
+                expected = [
+                    (c.offset, c.length, bytes.fromhex(c.hash))
+                    for c in fastcdc_cy(path, avg_size=1024, hf="sha256")
+                ]
+                assert list(result) == expected
+                assert len(result) == len(expected)
+                assert sum(result.lengths) == os.path.getsize(path)
+
+
+def test_chunk_pool_unordered():
+    with ChunkPool(2, avg_size=4096) as pool:
+        results = list(pool.imap_unordered([TEST_FILE] * 3))
+    assert len(results) == 3
+    for result in results:
+        with result:
+            assert result.digest_size == 32
+            assert list(result.offsets)[:2] == [0, 3407]
+
+
+def test_chunk_pool_unsupported():
+    with pytest.raises(ValueError):
+        ChunkPool(1, engine="nope")
+
+
+@pytest.mark.parametrize("chunk_func", [fastcdc_py, fastcdc_cy])
+def test_chunk_pickle(chunk_func):
+    chunk = next(chunk_func(TEST_FILE, fat=True, hf="sha256"))
+    copy = pickle.loads(pickle.dumps(chunk))
+    assert (copy.offset, copy.length, copy.data, copy.hash) == (
+        chunk.offset,
+        chunk.length,
+        chunk.data,
+        chunk.hash,
+    )
+
+
+def test_chunk_pool_pickled(monkeypatch):
+    monkeypatch.setattr(pool, "SHARED_RESULTS", False)
+    with ChunkPool(1, avg_size=1024) as chunk_pool:
+        (result,) = chunk_pool.imap([TEST_FILE])
+    with result:
+        assert result.shm is None
+        expected = fastcdc.fastcdc(TEST_FILE, avg_size=1024, hf="sha256")
+        assert [(o, n, d.hex()) for o, n, d in result] == [
+            (c.offset, c.length, c.hash) for c in expected
+        ]
@@ -0,0 +1,94 @@
+# -*- coding: utf-8 -*-
+import os
+import random
+import pytest
+from click.testing import CliRunner
+from fastcdc.cli import cli
+from fastcdc.predict import Predictor, chunk_predicted
+from fastcdc.stats import Stats
+import fastcdc
+
+r = CliRunner()
+
+
+def edited(data, edits, seed):
+    rnd = random.Random(seed)
+    data = bytearray(data)
+    for _ in range(edits):
+        offset = rnd.randrange(len(data))
+        data[offset : offset + rnd.randrange(50)] = os.urandom(rnd.randrange(50))
+    return bytes(data)
+
+
+def as_tuples(chunks):
+    return [(c.offset, c.length, c.hash, c.data) for c in chunks]
+
+
+@pytest.mark.parametrize("engine", ["fastcdc", "rabin", "ram"])
+def test_predicted_matches_fastcdc(engine):
+    versions = [os.urandom(500000)]
+    versions.append(edited(versions[0], 10, 1))
+    versions.append(edited(versions[1], 10, 2) + os.urandom(1000))
+    versions.append(versions[2][:123456])
+    predictor = Predictor()
+    kwargs = dict(avg_size=1024, fat=True, hf="sha256", engine=engine)
+    for data in versions:
+        expected = as_tuples(fastcdc.fastcdc(data, **kwargs))
+        assert (
+            as_tuples(chunk_predicted(data, predictor=predictor, **kwargs)) == expected
+        )
+    assert predictor.hits > predictor.misses > 0
+
+
+def test_predicted_repeated_chunks():
+    data = bytes(200000) + os.urandom(5000) + bytes(100000)
+    predictor = Predictor()
+    for _ in range(2):
+        chunks = list(
+            chunk_predicted(data, 256, 1024, 8192, hf="sha256", predictor=predictor)
+        )
+        expected = list(fastcdc.fastcdc(data, 256, 1024, 8192, hf="sha256"))
+        assert [(c.offset, c.length) for c in chunks] == [
+            (c.offset, c.length) for c in expected
+        ]
+
+
+def test_predicted_bounded():
+    predictor = Predictor(max_entries=10)
+    list(
+        chunk_predicted(
+            os.urandom(100000), avg_size=1024, hf="sha256", predictor=predictor
+        )
+    )
+    assert len(predictor.successors) == 10
+
+
+def test_predicted_stats():
+    stats = Stats()
+    data = os.urandom(100000)
+    chunks = list(chunk_predicted(data, stats=stats, hf="sha256"))
+    assert stats.files == 1
+    assert stats.chunks == len(chunks)
+    assert stats.bytes_scanned == len(data)
+    assert stats.cuts_eof == 1
+
+
+def test_predicted_requires_hash():
+    with pytest.raises(ValueError):
+        chunk_predicted(b"abc", hf=None)
+
+
+def test_scan_predict(tmp_path):
+    data = os.urandom(300000)
+    (tmp_path / "a").write_bytes(data)
+    (tmp_path / "b").write_bytes(edited(data, 5, 3))
+    args = ["scan", "-s", "1024", str(tmp_path)]
+    plain = r.invoke(cli, args)
+    result = r.invoke(cli, args + ["--predict"])
+    assert result.exit_code == 0
+    assert "hit rate" in result.output
+    for label in ("Unique Chunks", "Dupe Data"):
+        line = [x for x in plain.output.splitlines() if x.startswith(label)][0]
+        assert line in result.output
+    result = r.invoke(cli, args + ["--predict", "--io", "read"])
+    assert result.exit_code != 0
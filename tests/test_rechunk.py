@@ -0,0 +1,69 @@
+# -*- coding: utf-8 -*-
+import random
+import pytest
+from fastcdc.fastcdc_cy import fastcdc_cy
+from fastcdc.rechunk import rechunk
+
+
+def random_data(size, seed=0):
+    rnd = random.Random(seed)
+    return bytes(rnd.getrandbits(8) for _ in range(size))
+
+
+def chunks(data, engine="fastcdc"):
+    return list(fastcdc_cy(data, avg_size=1024, hf="sha256", engine=engine))
+
+
+def cut_points(chunk_list):
+    return [(c.offset, c.length, c.hash) for c in chunk_list]
+
+
+ORIGINAL = random_data(200000)
+
+
+def overwrite(data):
+    return data[:50000] + random_data(100, 1) + data[50100:], [(50000, 100)]
+
+
+def insert(data):
+    return data[:70000] + random_data(300, 2) + data[70000:], None
+
+
+def delete(data):
+    return data[:30000] + data[30500:], None
+
+
+def append(data):
+    return data + random_data(5000, 3), []
+
+
+def truncate(data):
+    return data[:-5000], []
+
+
+@pytest.mark.parametrize("edit", [overwrite, insert, delete, append, truncate])
+@pytest.mark.parametrize("engine", ["fastcdc", "rabin", "ram"])
+def test_rechunk_equals_full_run(edit, engine):
+    previous = chunks(ORIGINAL, engine)
+    data, dirty = edit(ORIGINAL)
+    expected = cut_points(chunks(data, engine))
+    result = rechunk(data, previous, dirty, avg_size=1024, hf="sha256", engine=engine)
+    assert cut_points(result) == expected
+    result = rechunk(data, previous, avg_size=1024, hf="sha256", engine=engine)
+    assert cut_points(result) == expected
+
+
+def test_rechunk_tuples_and_fat():
+    previous = [(c.offset, c.length) for c in chunks(ORIGINAL)]
+    data, dirty = overwrite(ORIGINAL)
+    result = list(rechunk(data, previous, dirty, avg_size=1024, fat=True))
+    assert [(c.offset, c.length) for c in result] == [
+        (c.offset, c.length) for c in chunks(data)
+    ]
+    assert b"".join(c.data for c in result) == data
+
+
+def test_rechunk_detect_requires_hashes():
+    previous = [(c.offset, c.length) for c in chunks(ORIGINAL)]
+    with pytest.raises(ValueError):
+        rechunk(ORIGINAL, previous, avg_size=1024, hf="sha256")
@@ -0,0 +1,85 @@
+# -*- coding: utf-8 -*-
+import os
+import random
+import pytest
+from click.testing import CliRunner
+from fastcdc.blockio import chunk_file
+from fastcdc.cli import cli
+from fastcdc.fastcdc_py import chunk_sketch
+from fastcdc.resemblance import SimilarityIndex, super_features
+import fastcdc
+
+r = CliRunner()
+
+
+def edited(data, edits, seed):
+    rnd = random.Random(seed)
+    data = bytearray(data)
+    for _ in range(edits):
+        offset = rnd.randrange(len(data))
+        data[offset : offset + 4] = os.urandom(4)
+    return bytes(data)
+
+
+def test_sketch_cy_matches_py():
+    data = os.urandom(50000) + bytes(40000) + os.urandom(100)
+    kwargs = dict(avg_size=1024, sketch=True)
+    cy = list(fastcdc.fastcdc_cy.fastcdc_cy(data, **kwargs))
+    py = list(fastcdc.fastcdc_py.fastcdc_py(data, **kwargs))
+    assert [c.features for c in cy] == [c.features for c in py]
+    for c in cy:
+        assert len(c.features) == 12
+        assert c.features == chunk_sketch(data[c.offset : c.offset + c.length])
+    assert list(fastcdc.fastcdc(data, avg_size=1024))[0].features == ()
+
+
+def test_sketch_block_reads(tmp_path):
+    data = os.urandom(300000)
+    path = tmp_path / "data.bin"
+    path.write_bytes(data)
+    kwargs = dict(avg_size=1024, sketch=True)
+    expected = [c.features for c in fastcdc.fastcdc(data, **kwargs)]
+    chunks = chunk_file(str(path), block_size=65536, **kwargs)
+    assert [c.features for c in chunks] == expected
+
+
+def test_similarity_index():
+    data = os.urandom(500000)
+    index = SimilarityIndex()
+    for chunk in fastcdc.fastcdc(data, avg_size=4096, hf="sha256", sketch=True):
+        assert index.add(chunk) == 0
+    seen = {c.hash for c in fastcdc.fastcdc(data, avg_size=4096, hf="sha256")}
+    changed = edited(data, 20, 1)
+    new = [
+        c
+        for c in fastcdc.fastcdc(changed, avg_size=4096, hf="sha256", sketch=True)
+        if c.hash not in seen
+    ]
+    saved = sum(index.add(c) for c in new)
+    assert index.similar_chunks >= len(new) * 0.8
+    assert saved > sum(c.length for c in new) * 0.5
+    assert index.bytes_saved == saved
+    similar = index.similar_chunks
+    for chunk in fastcdc.fastcdc(os.urandom(100000), avg_size=4096, sketch=True):
+        index.add(chunk)
+    assert index.similar_chunks == similar
+
+
+def test_super_features():
+    features = tuple(range(12))
+    assert len(set(super_features(features))) == 3
+    assert list(super_features(features)) == list(super_features(features))
+    with pytest.raises(ValueError):
+        SimilarityIndex().add(next(fastcdc.fastcdc(b"x" * 2000)))
+
+
+def test_scan_similar(tmp_path):
+    data = os.urandom(500000)
+    (tmp_path / "a.bin").write_bytes(data)
+    (tmp_path / "b.bin").write_bytes(edited(data, 20, 2))
+    result = r.invoke(cli, ["scan", "--similar", str(tmp_path)])
+    assert result.exit_code == 0
+    assert "Similar Chunks:" in result.output
+    assert "Delta Savings:  ~" in result.output
+    result = r.invoke(cli, ["scan", "--similar", "--estimate", str(tmp_path)])
+    assert result.exit_code == 2
@@ -1,6 +1,7 @@
 # -*- coding: utf-8 -*-
+import json
 from click.testing import CliRunner
-from tests import TEST_DIR, ROOT_DIR
+from tests import TEST_DIR, TEST_FILE, ROOT_DIR
 from fastcdc.cli import cli
 
 r = CliRunner()
@@ -32,3 +33,95 @@ def test_scan_custom_params():
 def test_small_avg_size():
     result = r.invoke(cli, ["scan", "-s", "100", ROOT_DIR])
     assert result.exit_code == 0
+
+
+def test_scan_stats():
+    result = r.invoke(cli, ["scan", "--stats", TEST_DIR])
+    assert result.exit_code == 0
+    assert "Size Histogram" in result.output
+
+
+def test_scan_profile_trace(tmp_path):
+    trace = tmp_path / "trace.json"
+    result = r.invoke(cli, ["scan", "--profile-trace", str(trace), TEST_DIR])
+    assert result.exit_code == 0
+    assert "boundary scan" in result.output
+    assert "Slowest Files" in result.output
+    events = json.loads(trace.read_text())["traceEvents"]
+    assert {e["name"] for e in events} == {"walk", "file"}
+
+
+def test_scan_filters():
+    result = r.invoke(cli, ["scan", "-r", "-i", "*.jpg", "-e", ".git", ROOT_DIR])
+    assert result.exit_code == 0
+    assert "Files:          1\n" in result.output
+
+
+def test_scan_file_dedupe_same_result(tmp_path):
+    data = open(TEST_FILE, "rb").read()
+    (tmp_path / "a.jpg").write_bytes(data)
+    (tmp_path / "b.jpg").write_bytes(data)
+    (tmp_path / "c.jpg").write_bytes(data[:-1] + b"x")
+    fast = r.invoke(cli, ["scan", "-s", "1024", str(tmp_path)])
+    slow = r.invoke(cli, ["scan", "-s", "1024", "--no-file-dedupe", str(tmp_path)])
+    assert "Dupe Files:     1\n" in fast.output
+    assert report(fast.output) == report(slow.output)
+
+
+def report(output):
+    skip = ("Dupe Files", "Throughput")
+    return [line for line in output.splitlines()[1:] if not line.startswith(skip)]
+
+
+def test_scan_engine():
+    result = r.invoke(cli, ["scan", "--engine", "rabin", TEST_DIR])
+    assert result.exit_code == 0
+    assert "Chunk Sizes" in result.output
+    result = r.invoke(cli, ["scan", "--engine", "nope", TEST_DIR])
+    assert result.exit_code != 0
+
+
+def test_scan_estimate(tmp_path):
+    data = open(TEST_FILE, "rb").read()
+    (tmp_path / "a.jpg").write_bytes(data)
+    (tmp_path / "b.jpg").write_bytes(data[:-1] + b"x")
+    exact = r.invoke(cli, ["scan", "-s", "1024", str(tmp_path)])
+    result = r.invoke(cli, ["scan", "-s", "1024", "--estimate", str(tmp_path)])
+    assert result.exit_code == 0
+    assert "95% CI" in result.output
+    assert "Sample Rate:    1 " in result.output
+    # Without halving the sample holds all fingerprints and the ratio is exact.
+    ratio = [line for line in exact.output.splitlines() if "DeDupe Ratio" in line][0]
+    assert ratio in result.output
+
+
+def test_scan_estimate_options(tmp_path):
+    result = r.invoke(
+        cli, ["scan", "--estimate", "--emit-partial", str(tmp_path / "p"), TEST_DIR]
+    )
+    assert result.exit_code != 0
+    result = r.invoke(cli, ["scan", "-r", "--sample-files", "0.5", ROOT_DIR])
+    assert result.exit_code == 0
+
+
+def test_scan_compress(tmp_path):
+    text = b"".join(b"line %d of a compressible file\n" % i for i in range(20000))
+    (tmp_path / "a.txt").write_bytes(text)
+    (tmp_path / "b.txt").write_bytes(text[:-1] + b"x")
+    result = r.invoke(cli, ["scan", "-s", "1024", "--compress", "zlib", str(tmp_path)])
+    assert result.exit_code == 0
+    assert "Compressed:" in result.output
+    assert "Total Ratio:" in result.output
+    result = r.invoke(
+        cli, ["scan", "--compress", "lzma", "--compress-sample", "0.5", TEST_DIR]
+    )
+    assert result.exit_code == 0
+    assert "Sampled Chunks:" in result.output
+    for io in ("mmap", "read"):
+        args = ["scan", "-s", "1024", "--io", io, "--compress", "zlib", str(tmp_path)]
+        assert "Compressed:" in r.invoke(cli, args).output
+    result = r.invoke(
+        cli, ["scan", "--compress", "zlib", "--compress-level", "99", TEST_DIR]
+    )
+    assert result.exit_code == 2
+    assert "Level 99 is not supported by zlib" in result.output
@@ -0,0 +1,126 @@
+# -*- coding: utf-8 -*-
+import os
+import socket
+import tempfile
+import threading
+import pytest
+
+if not hasattr(socket, "AF_UNIX"):
+    pytest.skip("Unix domain sockets are not available", allow_module_level=True)
+from click.testing import CliRunner
+from tests import TEST_DIR, TEST_FILE
+from fastcdc.cli import cli
+from fastcdc.serve import (
+    Client,
+    Daemon,
+    Server,
+    ServeError,
+    default_socket,
+    private_directory,
+)
+import fastcdc
+
+r = CliRunner()
+
+
+@pytest.fixture(scope="module")
+def socket_path():
+    # Unix socket paths are limited to about 100 characters.
+    path = os.path.join(tempfile.mkdtemp(), "fastcdc.sock")
+    daemon = Daemon(processes=1, cache_size=8)
+    server = Server(path, daemon)
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield path
+    server.shutdown()
+    server.server_close()
+    daemon.close()
+    os.unlink(path)
+
+
+def expected(data, **kwargs):
+    return [
+        (c.offset, c.length, c.hash)
+        for c in fastcdc.fastcdc(data, hf="sha256", **kwargs)
+    ]
+
+
+def as_tuples(chunks):
+    return [(c.offset, c.length, c.hash) for c in chunks]
+
+
+def test_serve_chunk_path(socket_path):
+    with Client(socket_path) as client:
+        assert as_tuples(client.chunk(TEST_FILE)) == expected(TEST_FILE)
+        before = client.ping()
+        chunks = client.chunk(TEST_FILE, avg_size=1024, engine="ram")
+        assert as_tuples(chunks) == expected(TEST_FILE, avg_size=1024, engine="ram")
+        client.chunk(TEST_FILE, avg_size=1024, engine="ram")
+        assert client.ping()["hits"] == before["hits"] + 1
+
+
+def test_serve_chunk_data(socket_path):
+    data = os.urandom(100000)
+    with Client(socket_path) as client:
+        assert as_tuples(client.chunk(data=data, avg_size=2048)) == expected(
+            data, avg_size=2048
+        )
+        assert client.chunk(data=b"") == []
+
+
+def test_serve_diff(socket_path, tmp_path):
+    data = open(TEST_FILE, "rb").read()
+    (tmp_path / "a").write_bytes(data)
+    (tmp_path / "b").write_bytes(data[:50000] + b"edit" + data[50000:])
+    with Client(socket_path) as client:
+        meta, added = client.diff(tmp_path / "a", tmp_path / "b", avg_size=1024)
+    assert meta["bytes_total"] == len(data) + 4
+    assert 0 < meta["bytes_new"] < len(data) // 4
+    assert sum(chunk.length for chunk in added) == meta["bytes_new"]
+
+
+def test_serve_scan(socket_path, tmp_path):
+    data = open(TEST_FILE, "rb").read()
+    (tmp_path / "a").write_bytes(data)
+    (tmp_path / "b").write_bytes(data)
+    with Client(socket_path) as client:
+        result = client.scan([str(tmp_path)], avg_size=1024)
+    assert result["files"] == 2
+    assert result["bytes_total"] == 2 * len(data)
+    unique = {h: length for _, length, h in expected(data, avg_size=1024)}
+    assert result["bytes_dupe"] == 2 * len(data) - sum(unique.values())
+    assert result["unique_chunks"] == len(unique)
+    assert result["errors"] == []
+
+
+def test_serve_error(socket_path):
+    with Client(socket_path) as client:
+        with pytest.raises(ServeError):
+            client.chunk(os.path.join(TEST_DIR, "missing"))
+        with pytest.raises(ServeError):
+            client.chunk(TEST_FILE, engine="nope")
+        # The connection is still usable after an error.
+        assert client.ping()
+
+
+def test_serve_refuses_running(socket_path):
+    result = r.invoke(cli, ["serve", "--socket", socket_path])
+    assert result.exit_code != 0
+    assert "listening" in result.output
+
+
+def test_serve_socket_private(socket_path, monkeypatch):
+    assert os.stat(socket_path).st_mode & 0o077 == 0
+    monkeypatch.setenv("XDG_RUNTIME_DIR", "/run/user/1000")
+    assert default_socket() == "/run/user/1000/fastcdc.sock"
+    monkeypatch.delenv("XDG_RUNTIME_DIR")
+    path = default_socket()
+    assert os.path.dirname(os.path.dirname(path)) == tempfile.gettempdir()
+    directory = tempfile.mkdtemp()
+    os.rmdir(directory)
+    private_directory(os.path.join(directory, "fastcdc.sock"))
+    assert os.stat(directory).st_mode & 0o777 == 0o700
+    os.chmod(directory, 0o755)
+    with pytest.raises(OSError):
+        private_directory(os.path.join(directory, "fastcdc.sock"))
+    os.rmdir(directory)
@@ -0,0 +1,134 @@
+# -*- coding: utf-8 -*-
+import os
+import pytest
+from click.testing import CliRunner
+from fastcdc import fastcdc_py
+from fastcdc.cli import cli
+from fastcdc.engines import ENGINES, offset_function
+from fastcdc.stats import Stats
+from fastcdc.utils import file_holes
+import fastcdc
+
+r = CliRunner()
+
+KWARGS = dict(min_size=256, avg_size=1024, max_size=8192, fat=True, hf="sha256")
+
+
+def scanned(data, engine):
+    """Chunk offsets and lengths from a plain boundary scan without fast paths."""
+    mi, avg, ma = KWARGS["min_size"], KWARGS["avg_size"], KWARGS["max_size"]
+    if engine == "fastcdc":
+        cs = fastcdc_py.center_size(avg, mi, ma)
+        bits = fastcdc_py.logarithm2(avg)
+        mask_s, mask_l = fastcdc_py.mask(bits + 1), fastcdc_py.mask(bits - 1)
+
+        def find(blob):
+            return fastcdc_py.cdc_offset(blob, mi, ma, cs, mask_s, mask_l)
+
+    else:
+        find = offset_function(engine, mi, avg, ma)
+    view = memoryview(data)
+    offset = 0
+    result = []
+    while offset < len(data):
+        cp = find(view[offset : offset + ma])
+        result.append((offset, cp))
+        offset += cp
+    return result
+
+
+def runs_data():
+    return b"".join(
+        [
+            os.urandom(3000),
+            bytes(100000),
+            os.urandom(5000),
+            b"\xff" * 50000,
+            b"ab" * 20000,
+            bytes(8191),
+            os.urandom(100),
+            b"\x07" * 12345,
+        ]
+    )
+
+
+def as_tuples(chunks):
+    return [(c.offset, c.length, c.hash, c.data) for c in chunks]
+
+
+@pytest.mark.parametrize("engine", ENGINES)
+def test_runs_match_scan(engine):
+    data = runs_data()
+    expected = scanned(data, engine)
+    for module in (fastcdc.fastcdc_cy, fastcdc.fastcdc_py):
+        chunker = getattr(module, module.__name__.split(".")[-1])
+        chunks = list(chunker(data, engine=engine, **KWARGS))
+        assert [(c.offset, c.length) for c in chunks] == expected
+        for c in chunks:
+            assert c.data == data[c.offset : c.offset + c.length]
+            assert (
+                c.hash == fastcdc.utils.hash_constructor("sha256")(c.data).hexdigest()
+            )
+
+
+@pytest.mark.parametrize("hf", ["xxh3_64", "xxh3_128", "sha256", None])
+def test_runs_hashes(hf):
+    data = runs_data()
+    kwargs = dict(KWARGS, hf=hf)
+    assert as_tuples(fastcdc.fastcdc_cy.fastcdc_cy(data, **kwargs)) == as_tuples(
+        fastcdc.fastcdc_py.fastcdc_py(data, **kwargs)
+    )
+
+
+def test_runs_stats():
+    data = bytes(100000) + os.urandom(5000)
+    stats = Stats()
+    chunks = list(fastcdc.fastcdc(data, stats=stats, **KWARGS))
+    assert stats.bytes_scanned == len(data)
+    assert stats.chunks == len(chunks)
+    assert 90000 < stats.bytes_runs <= 100000
+    assert "bytes_runs" in stats.as_dict()
+    assert "Bytes in Runs:" in stats.report()
+
+
+@pytest.fixture
+def sparse_file(tmp_path):
+    path = tmp_path / "sparse.img"
+    with open(path, "wb") as f:
+        f.write(os.urandom(100000))
+        f.seek(3 * 1024 * 1024)
+        f.write(os.urandom(100000))
+        f.truncate(8 * 1024 * 1024)
+    holes = file_holes(str(path))
+    if not holes:
+        pytest.skip("Filesystem does not report holes")
+    return path
+
+
+def test_file_holes(sparse_file):
+    holes = file_holes(str(sparse_file))
+    data = sparse_file.read_bytes()
+    assert holes[-1][1] == len(data)
+    for start, end in holes:
+        assert data[start:end] == bytes(end - start)
+    with open(sparse_file, "rb") as f:
+        f.seek(10)
+        assert file_holes(f) == holes
+        assert f.tell() == 10
+    assert file_holes(b"data") == []
+
+
+def test_sparse_file_chunks(sparse_file):
+    data = sparse_file.read_bytes()
+    expected = scanned(data, "fastcdc")
+    for chunker in (fastcdc.fastcdc_cy.fastcdc_cy, fastcdc.fastcdc_py.fastcdc_py):
+        stats = Stats()
+        chunks = list(chunker(str(sparse_file), stats=stats, **KWARGS))
+        assert [(c.offset, c.length) for c in chunks] == expected
+        assert stats.bytes_runs > 7 * 1024 * 1024
+
+
+def test_scan_sparse(sparse_file):
+    result = r.invoke(cli, ["scan", str(sparse_file.parent)])
+    assert result.exit_code == 0
+    assert "Sparse Data:" in result.output
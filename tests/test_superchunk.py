@@ -0,0 +1,97 @@
+# -*- coding: utf-8 -*-
+import os
+import pytest
+from click.testing import CliRunner
+from fastcdc.cli import cli
+from fastcdc.superchunk import SuperChunkIndex, superchunks
+import fastcdc
+
+r = CliRunner()
+
+
+def chunked(data):
+    return list(fastcdc.fastcdc(data, avg_size=1024, hf="sha256"))
+
+
+def test_superchunks_cover_chunks():
+    chunks = chunked(os.urandom(1000000))
+    result = list(superchunks(chunks, "sha256", avg_count=16))
+    assert [c for s in result for c in s.chunks] == chunks
+    assert sum(s.length for s in result) == 1000000
+    for s in result[:-1]:
+        assert 4 <= len(s.chunks) <= 64
+        assert s.offset + s.length == s.chunks[-1].offset + s.chunks[-1].length
+    assert 8 < len(chunks) / len(result) < 32
+
+
+def test_superchunks_resync_after_edit():
+    data = os.urandom(2000000)
+    edited = data[:1000000] + b"edit" + data[1000000:]
+    before = {s.hash for s in superchunks(chunked(data), "sha256", avg_count=16)}
+    after = [s for s in superchunks(chunked(edited), "sha256", avg_count=16)]
+    changed = [s for s in after if s.hash not in before]
+    assert 1 <= len(changed) <= 2
+    assert changed[0].offset <= 1000000 < changed[-1].offset + changed[-1].length
+
+
+def test_superchunks_errors():
+    chunks = list(fastcdc.fastcdc(os.urandom(10000), avg_size=1024))
+    with pytest.raises(ValueError):
+        list(superchunks(chunks, "sha256"))
+    with pytest.raises(ValueError):
+        list(superchunks([], "sha256", avg_count=8, min_count=8))
+    with pytest.raises(ValueError):
+        list(superchunks([], "sha256", avg_count=2))
+
+
+def test_superchunk_index():
+    data = os.urandom(500000)
+    index = SuperChunkIndex("sha256", 8)
+    first = list(index.feed(chunked(data)))
+    assert index.dedupe_ratio == 0
+    assert index.chunks_new == index.chunks == len(first)
+    second = list(index.feed(chunked(data)))
+    assert [c.hash for c in second] == [c.hash for c in first]
+    assert index.dedupe_ratio == 0.5
+    assert index.chunks_new == len(first)
+    index = SuperChunkIndex("sha256", 8)
+    list(index.feed(chunked(data), "a"))
+    assert index.add_copy("b", "a")
+    assert not index.add_copy("c", "missing")
+    assert index.dedupe_ratio == 0.5
+    assert index.chunks == 2 * len(first)
+
+
+def test_scan_superchunks(tmp_path):
+    data = os.urandom(1000000)
+    (tmp_path / "a.bin").write_bytes(data)
+    (tmp_path / "b.bin").write_bytes(data[:500000] + b"edit" + data[500000:])
+    result = r.invoke(cli, ["scan", "-s", "1024", "--superchunks", "16", str(tmp_path)])
+    assert result.exit_code == 0
+    assert "Superchunks:" in result.output
+    assert "Super DeDupe:   4" in result.output
+    for count in ("1", "2"):
+        result = r.invoke(cli, ["scan", "--superchunks", count, str(tmp_path)])
+        assert result.exit_code == 2
+
+
+def test_scan_superchunks_identical_files(tmp_path):
+    data = os.urandom(300000)
+    (tmp_path / "a.bin").write_bytes(data)
+    (tmp_path / "b.bin").write_bytes(data)
+    args = ["scan", "-s", "1024", "--superchunks", "16", str(tmp_path)]
+    for extra in ([], ["--no-file-dedupe"]):
+        result = r.invoke(cli, args + extra)
+        assert result.exit_code == 0
+        assert "Super DeDupe:   50.00 %" in result.output
+
+
+def test_superchunk_index_forgets_files():
+    data = os.urandom(100000)
+    index = SuperChunkIndex("sha256", 8, max_files=2)
+    for name in "abc":
+        list(index.feed(chunked(data), name))
+    assert list(index.files) == ["b", "c"]
+    assert not index.add_copy("d", "a")
+    assert index.add_copy("d", "b")
+    assert list(index.files) == ["c", "d"]
@@ -0,0 +1,52 @@
+# -*- coding: utf-8 -*-
+from click.testing import CliRunner
+from tests import TEST_DIR, TEST_FILE
+from fastcdc.cli import cli
+from fastcdc.tune import Config, parse_config
+import fastcdc
+
+r = CliRunner()
+
+
+def test_tune_no_args():
+    result = r.invoke(cli, "tune")
+    assert result.exit_code == 0
+    assert "single pass" in result.output
+
+
+def test_tune_configs():
+    result = r.invoke(
+        cli, ["tune", "-s", "1024", "-c", ":4096:", "--engine", "ram", TEST_DIR]
+    )
+    assert result.exit_code == 0
+    lines = [line for line in result.output.splitlines() if line.startswith("ram")]
+    assert len(lines) == 2
+    assert lines[1].split()[1:4] == ["1024", "4096", "32768"]
+
+
+def test_tune_matches_scan(tmp_path):
+    data = open(TEST_FILE, "rb").read()
+    (tmp_path / "a.jpg").write_bytes(data)
+    (tmp_path / "b.jpg").write_bytes(data[:-1] + b"x")
+    config = Config("fastcdc", 256, 1024, 8192, "sha256")
+    config.chunk(data)
+    config.chunk(data[:-1] + b"x")
+    scan = r.invoke(cli, ["scan", "-s", "1024", "--no-file-dedupe", str(tmp_path)])
+    assert "Unique Chunks:  {}\n".format(len(config.fingerprints)) in scan.output
+    expected = "{:.2f} %".format(config.dedupe_ratio * 100)
+    assert "DeDupe Ratio:   {}".format(expected) in scan.output
+    assert config.chunks == 2 * len(list(fastcdc.fastcdc(data, 256, 1024, 8192)))
+
+
+def test_parse_config():
+    assert parse_config("1024:4096:16384") == (1024, 4096, 16384)
+    assert parse_config(":8192:") == (2048, 8192, 65536)
+
+
+def test_tune_bad_config():
+    result = r.invoke(cli, ["tune", "-c", "8192", TEST_DIR])
+    assert result.exit_code != 0
+    for args in (["-c", "100:50:10"], ["-c", "4096:2048:8192"], ["-s", "16"]):
+        result = r.invoke(cli, ["tune"] + args + [TEST_DIR])
+        assert result.exit_code == 2
+        assert "Traceback" not in result.output
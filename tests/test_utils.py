@@ -1,8 +1,10 @@
 # -*- coding: utf-8 -*-
+import os
 import pytest
 from os import DirEntry
 from typing import Generator
 from fastcdc import utils
+from tests import ROOT_DIR
 
 
 def test_logarithm2():
@@ -50,3 +52,49 @@ def test_iter_files():
     assert isinstance(utils.iter_files("."), Generator)
     files = list(utils.iter_files("."))
     assert isinstance(files[0], DirEntry)
+
+
+def make_tree(root):
+    (root / "a").mkdir()
+    (root / "a" / "b").mkdir()
+    (root / "skip").mkdir()
+    (root / "top.txt").write_bytes(b"x" * 10)
+    (root / "a" / "one.bin").write_bytes(b"x" * 100)
+    (root / "a" / "b" / "two.txt").write_bytes(b"x" * 1000)
+    (root / "skip" / "three.txt").write_bytes(b"x" * 10)
+    return root
+
+
+def walk_names(*args, **kwargs):
+    return sorted(entry.name for entry in utils.walk_files(*args, **kwargs))
+
+
+def test_walk_files(tmp_path):
+    root = str(make_tree(tmp_path))
+    assert walk_names([root]) == ["top.txt"]
+    assert walk_names([root], True) == ["one.bin", "three.txt", "top.txt", "two.txt"]
+    assert walk_names([root, root + "/a"]) == ["one.bin", "top.txt"]
+    assert walk_names([]) == []
+
+
+def test_walk_files_filters(tmp_path):
+    root = str(make_tree(tmp_path))
+    assert walk_names([root], True, include=["*.txt"], exclude=["skip"]) == [
+        "top.txt",
+        "two.txt",
+    ]
+    assert walk_names([root], True, include=["a/b/*"]) == ["two.txt"]
+    assert walk_names([root], True, min_size=100, max_size=999) == ["one.bin"]
+
+
+def test_walk_files_skip_hardlinks(tmp_path):
+    root = make_tree(tmp_path)
+    os.link(str(root / "top.txt"), str(root / "a" / "link.txt"))
+    assert len(walk_names([str(root)], True)) == 5
+    assert len(walk_names([str(root)], True, skip_hardlinks=True)) == 4
+
+
+def test_walk_files_close_early():
+    walker = utils.walk_files([ROOT_DIR], True, threads=2)
+    assert isinstance(next(walker), DirEntry)
+    walker.close()
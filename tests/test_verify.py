@@ -0,0 +1,88 @@
+# -*- coding: utf-8 -*-
+import os
+import pytest
+from click.testing import CliRunner
+from fastcdc.cli import cli
+from fastcdc.verify import parse_manifest, segments, verify_file
+
+r = CliRunner()
+
+
+def manifest(tmp_path, data, fmt="plain", hf="sha256"):
+    path = tmp_path / "data.bin"
+    path.write_bytes(data)
+    args = ["chunkify", "-s", "4096", "-hf", hf, "-f", fmt, "--summary", str(path)]
+    result = r.invoke(cli, args)
+    assert result.exit_code == 0
+    return str(path), result.output
+
+
+@pytest.mark.parametrize("fmt", ["pretty", "plain", "tsv", "ndjson"])
+def test_parse_formats(tmp_path, fmt):
+    _, plain = manifest(tmp_path, os.urandom(100000))
+    _, output = manifest(tmp_path, (tmp_path / "data.bin").read_bytes(), fmt)
+    expected = list(parse_manifest(plain.splitlines()))
+    assert len(expected) > 10
+    assert list(parse_manifest(output.splitlines())) == expected
+    with pytest.raises(ValueError, match="line 2"):
+        list(parse_manifest(plain.splitlines()[:1] + ["garbage"]))
+
+
+def test_segments():
+    chunks = [(0, 10, "a"), (10, 10, "b"), (20, 10, "c"), (40, 5, "d")]
+    assert [len(s) for s in segments(chunks, 20)] == [2, 1, 1]
+    assert [len(s) for s in segments(chunks, 100)] == [3, 1]
+
+
+@pytest.mark.parametrize("hf", ["sha256", "xxh3_64"])
+def test_verify_file(tmp_path, hf):
+    data = os.urandom(500000)
+    path, output = manifest(tmp_path, data, hf=hf)
+    chunks = list(parse_manifest(output.splitlines()))
+    result = verify_file(path, chunks, hf, threads=2, block_size=65536)
+    assert result.ok
+    assert result.chunks == len(chunks)
+    assert result.bytes_verified == len(data)
+    corrupt = bytearray(data)
+    corrupt[300000] ^= 1
+    corrupt[10] ^= 1
+    with open(path, "wb") as f:
+        f.write(corrupt + b"tail")
+    result = verify_file(path, reversed(chunks), hf, threads=2, block_size=65536)
+    assert [m.offset <= 10 for m in result.mismatches] == [True, False]
+    assert all(m.offset <= 300000 < m.offset + m.length for m in result.mismatches[1:])
+    assert result.trailing_bytes == 4
+    for threads in (1, 8):
+        result = verify_file(path, chunks, hf, threads, 65536, max_errors=1)
+        assert len(result.mismatches) == 1 and not result.complete
+    with open(path, "wb") as f:
+        f.write(data[:250000])
+    result = verify_file(path, chunks, hf)
+    assert result.mismatches[-1].actual == ""
+    assert result.mismatches[-1].offset + result.mismatches[-1].length == len(data)
+
+
+def test_verify_without_pread(tmp_path, monkeypatch):
+    path, output = manifest(tmp_path, os.urandom(300000))
+    chunks = list(parse_manifest(output.splitlines()))
+    monkeypatch.delattr(os, "pread")
+    assert verify_file(path, chunks, threads=4, block_size=65536).ok
+
+
+def test_verify_cli(tmp_path):
+    data = os.urandom(200000)
+    path, output = manifest(tmp_path, data)
+    (tmp_path / "manifest").write_text(output)
+    args = ["verify", str(tmp_path / "manifest"), path]
+    result = r.invoke(cli, args)
+    assert result.exit_code == 0
+    assert "Result:         OK" in result.output
+    with open(path, "r+b") as f:
+        f.seek(100000)
+        f.write(b"x")
+    result = r.invoke(cli, args)
+    assert result.exit_code == 1
+    assert "Mismatches:     1" in result.output
+    assert "Result:         FAILED" in result.output
+    result = r.invoke(cli, args + ["-hf", "nope"])
+    assert result.exit_code == 2
@@ -0,0 +1,173 @@
+# -*- coding: utf-8 -*-
+import json
+import os
+import sys
+import pytest
+from click.testing import CliRunner
+from fastcdc.cli import cli
+from fastcdc.watch import ChunkIndex, Inotify, apply_changes, list_files, parents
+
+r = CliRunner()
+
+
+def new_index():
+    return ChunkIndex(1024, 4096, 32768, "sha256")
+
+
+def check_totals(index):
+    """Incremental totals equal a recount of all files."""
+    digests = {}
+    total = 0
+    for _, chunks in index.files.values():
+        for digest, length in chunks:
+            digests[digest] = length
+            total += length
+    assert index.bytes_total == total
+    assert index.bytes_unique == sum(digests.values())
+    assert set(index.refs) == set(digests)
+    dirs = {}
+    for path in index.files:
+        for directory in parents(path):
+            dirs[directory] = dirs.get(directory, 0) + 1
+    assert index.dirs == dirs
+
+
+def test_index_updates(tmp_path):
+    data = os.urandom(200000)
+    (tmp_path / "a").write_bytes(data)
+    (tmp_path / "b").write_bytes(data)
+    (tmp_path / "empty").write_bytes(b"")
+    index = new_index()
+    index.sync(list_files((str(tmp_path),), False))
+    assert index.rechunked_files == 3
+    assert index.bytes_total == 400000
+    assert index.bytes_unique == 200000
+    assert index.dedupe_ratio == 0.5
+    index.reset_counters()
+    index.sync(list_files((str(tmp_path),), False))
+    assert index.rechunked_files == 0
+    (tmp_path / "b").write_bytes(data[:100000] + b"edit" + data[100000:])
+    index.sync(list_files((str(tmp_path),), False))
+    assert index.rechunked_files == 1
+    assert 0.4 < index.dedupe_ratio < 0.5
+    check_totals(index)
+    os.unlink(tmp_path / "a")
+    index.sync(list_files((str(tmp_path),), False))
+    assert index.removed_files == 1
+    assert index.dedupe_ratio == 0
+    check_totals(index)
+
+
+def test_index_moves(tmp_path):
+    (tmp_path / "dir").mkdir()
+    (tmp_path / "dir" / "a").write_bytes(os.urandom(50000))
+    (tmp_path / "b").write_bytes(os.urandom(50000))
+    index = new_index()
+    index.sync(list_files((str(tmp_path),), True))
+    index.reset_counters()
+    os.rename(tmp_path / "b", tmp_path / "c")
+    index.sync(list_files((str(tmp_path),), True))
+    assert (index.rechunked_files, index.moved_files) == (0, 1)
+    os.rename(tmp_path / "dir", tmp_path / "moved")
+    index.move(str(tmp_path / "dir"), str(tmp_path / "moved"))
+    assert str(tmp_path / "moved" / "a") in index.files
+    # Moving a file over another releases the replaced chunks.
+    index.move(str(tmp_path / "c"), str(tmp_path / "moved" / "a"))
+    assert index.bytes_total == 50000
+    check_totals(index)
+
+
+def test_index_hardlinks_removed(tmp_path):
+    (tmp_path / "a").write_bytes(os.urandom(100000))
+    os.link(tmp_path / "a", tmp_path / "b")
+    (tmp_path / "c").write_bytes(os.urandom(1000))
+    index = new_index()
+    index.sync(list_files((str(tmp_path),), False))
+    os.unlink(tmp_path / "a")
+    os.unlink(tmp_path / "b")
+    index.sync(list_files((str(tmp_path),), False))
+    assert sorted(index.files) == [str(tmp_path / "c")]
+    assert index.bytes_total == 1000
+    check_totals(index)
+
+
+def test_state_roundtrip(tmp_path):
+    data = os.urandom(100000)
+    (tmp_path / "a").write_bytes(data)
+    (tmp_path / "b").write_bytes(data + os.urandom(1000))
+    state = str(tmp_path / "state")
+    index = new_index()
+    index.sync(list_files((str(tmp_path),), False))
+    index.save(state)
+    loaded = new_index()
+    loaded.load(state)
+    assert loaded.files == index.files
+    assert loaded.refs == index.refs
+    assert loaded.bytes_unique == index.bytes_unique
+    other = ChunkIndex(1024, 8192, 32768, "sha256")
+    with pytest.raises(ValueError):
+        other.load(state)
+
+
+@pytest.mark.skipif(not Inotify.available(), reason="inotify not available")
+def test_inotify(tmp_path):
+    (tmp_path / "sub").mkdir()
+    (tmp_path / "old").write_bytes(os.urandom(10000))
+    index = new_index()
+    index.sync(list_files((str(tmp_path),), True))
+    inotify = Inotify((str(tmp_path),), True)
+    try:
+        (tmp_path / "sub" / "new").write_bytes(os.urandom(10000))
+        os.rename(tmp_path / "old", tmp_path / "renamed")
+        changed, moves, overflow = inotify.changes(0.1)
+    finally:
+        inotify.close()
+    assert not overflow
+    assert str(tmp_path / "sub" / "new") in changed
+    assert moves == [(str(tmp_path / "old"), str(tmp_path / "renamed"))]
+    apply_changes(index, changed, moves, True)
+    assert sorted(index.files) == [
+        str(tmp_path / "renamed"),
+        str(tmp_path / "sub" / "new"),
+    ]
+    assert (index.rechunked_files, index.moved_files) == (2, 1)
+    check_totals(index)
+
+
+@pytest.mark.skipif(not Inotify.available(), reason="inotify not available")
+def test_inotify_not_recursive(tmp_path):
+    (tmp_path / "top").write_bytes(os.urandom(10000))
+    index = new_index()
+    index.sync(list_files((str(tmp_path),), False))
+    inotify = Inotify((str(tmp_path),), False)
+    try:
+        (tmp_path / "sub").mkdir()
+        (tmp_path / "sub" / "f").write_bytes(os.urandom(10000))
+        changed, moves, overflow = inotify.changes(0.1)
+        assert len(inotify.dirs) == 1
+    finally:
+        inotify.close()
+    apply_changes(index, changed, moves, False)
+    assert sorted(index.files) == sorted(list_files((str(tmp_path),), False))
+    assert sorted(index.files) == [str(tmp_path / "top")]
+
+
+def test_inotify_unavailable(monkeypatch):
+    monkeypatch.setattr(sys, "platform", "win32")
+    assert not Inotify.available()
+
+
+def test_watch_once(tmp_path):
+    (tmp_path / "data").mkdir()
+    (tmp_path / "data" / "a").write_bytes(os.urandom(100000))
+    state = str(tmp_path / "state")
+    args = ["watch", "--once", "--json", "--state", state, str(tmp_path / "data")]
+    result = r.invoke(cli, args)
+    assert result.exit_code == 0
+    metrics = json.loads(result.output)
+    assert metrics["rechunked_files"] == 1
+    assert metrics["bytes_total"] == 100000
+    result = r.invoke(cli, args)
+    assert json.loads(result.output)["rechunked_files"] == 0
+    result = r.invoke(cli, args[:2] + [str(tmp_path / "data")])
+    assert "dedupe 0.00 %" in result.output
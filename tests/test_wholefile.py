@@ -0,0 +1,33 @@
+# -*- coding: utf-8 -*-
+import os
+from hashlib import sha256
+from fastcdc.wholefile import WholeFileIndex, SAMPLE_SIZE
+
+
+def write(path, data):
+    path.write_bytes(data)
+    return str(path), len(data)
+
+
+def test_whole_file_index(tmp_path):
+    data = os.urandom(SAMPLE_SIZE * 4)
+    changed = data[: SAMPLE_SIZE * 2] + b"x" + data[SAMPLE_SIZE * 2 + 1 :]
+    original = write(tmp_path / "original", data)
+    copy = write(tmp_path / "copy", data)
+    middle = write(tmp_path / "middle", changed)
+    index = WholeFileIndex(sha256)
+    assert not index.is_duplicate(*original)
+    index.add(*original)
+    assert not index.is_duplicate(*middle)
+    index.add(*middle)
+    assert index.is_duplicate(*copy)
+
+
+def test_whole_file_index_unregistered(tmp_path):
+    data = b"small"
+    first = write(tmp_path / "first", data)
+    second = write(tmp_path / "second", data)
+    index = WholeFileIndex(sha256)
+    assert not index.is_duplicate(*first)
+    # Files that were not added (e.g. failed to chunk) are no reference.
+    assert not index.is_duplicate(*second)